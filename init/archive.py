@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+archive.py – Dateien fortlaufend in (geteilte) zip- oder tar-Archive schreiben.
+
+Ein Archivsatz besteht aus einem oder mehreren Teilen {name}_001.zip, {name}_002.zip, ...
+Sobald ein Teil die eingestellte Größe überschreiten würde, wird der nächste begonnen.
+Dateien werden einzeln und sofort angehängt (add_file), d. h. der Satz kann schon
+befüllt werden, während noch weitere Bilder entstehen.
+
+zip-Archive werden ohne Kompression geschrieben (ZIP_STORED) – PNG ist bereits
+komprimiert, eine zweite Kompression kostet nur Zeit.
+
+Beim Abschluss (close_archive_set) entstehen zusätzlich:
+  {name}.manifest.json   alle Dateien mit Teil, Größe und SHA-256 sowie alle Teile
+  {name}.sha256          Prüfsummen der Teile (Format von sha256sum)
+"""
+import io
+import os
+import re
+import json
+import hashlib
+import tarfile
+import zipfile
+from datetime import datetime
+from logger import log_message, shorten_path
+
+ARCHIVE_FORMATS = ("zip", "tar")
+
+# Dateien bis zu dieser Größe werden in einem Stück gelesen (Prüfsumme und Inhalt)
+_READ_WHOLE = 64 << 20
+_CHUNK = 1 << 20
+# Geschätzter Verwaltungsaufwand je Eintrag (Header) für die Teilung
+_ENTRY_OVERHEAD = {"zip": 128, "tar": 1024}
+# Abschluss eines Teils (zip: Endsatz, tar: Endblöcke und Auffüllung auf 10 KiB)
+_END_RESERVE = {"zip": 128, "tar": tarfile.RECORDSIZE}
+
+def remove_archive_set(output_dir, name):
+    """
+    Entfernt einen früheren Archivsatz gleichen Namens (alle Teile beider Formate,
+    Manifest, Prüfsummen). Sonst blieben bei einem erneuten Lauf mit weniger Teilen
+    die höheren Teile liegen – in keinem Manifest aufgeführt, aber mitgeliefert.
+
+    :return: Anzahl entfernter Dateien
+    """
+    if not os.path.isdir(output_dir):
+        return 0
+    part_pattern = re.compile(rf"{re.escape(name)}_\d{{3,}}\.({'|'.join(ARCHIVE_FORMATS)})")
+    removed = 0
+    for file in os.listdir(output_dir):
+        if part_pattern.fullmatch(file) or file in (f"{name}.manifest.json", f"{name}.sha256"):
+            os.remove(os.path.join(output_dir, file))
+            removed += 1
+    if removed:
+        log_message(f"Früheren Archivsatz entfernt: {name} ({removed} Dateien)", level="info")
+    return removed
+
+def open_archive_set(output_dir, name, fmt="zip", split_bytes=0):
+    """
+    Beginnt einen Archivsatz; ein früherer Satz gleichen Namens wird vorher
+    entfernt (remove_archive_set).
+
+    :param fmt: "zip" oder "tar"
+    :param split_bytes: maximale Größe eines Teils in Bytes (0 = nicht teilen)
+    :return: Zustand (dict) für add_file / close_archive_set
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unbekanntes Archivformat: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+    remove_archive_set(output_dir, name)
+    return {
+        "output_dir": output_dir,
+        "name": name,
+        "format": fmt,
+        "split_bytes": int(split_bytes),
+        "handle": None,
+        "part_size": 0,
+        "part_files": 0,
+        "parts": [],
+        "files": [],
+    }
+
+def _part_path(state, number):
+    return os.path.join(state["output_dir"], f"{state['name']}_{number:03}.{state['format']}")
+
+def _open_part(state):
+    path = _part_path(state, len(state["parts"]) + 1)
+    if state["format"] == "zip":
+        handle = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    else:
+        handle = tarfile.open(path, "w", format=tarfile.PAX_FORMAT)
+    state["handle"] = handle
+    state["part_size"] = 0
+    state["part_files"] = 0
+    state["parts"].append({"name": os.path.basename(path), "files": 0})
+    log_message(f"Neues Archiv: {shorten_path(path)}", level="info")
+
+def _close_part(state):
+    if state["handle"] is not None:
+        state["handle"].close()
+        state["parts"][-1]["files"] = state["part_files"]
+        state["handle"] = None
+
+def add_file(state, path, arcname):
+    """
+    Hängt eine Datei an den Archivsatz an (beginnt bei Bedarf einen neuen Teil)
+    und berechnet dabei ihre SHA-256-Prüfsumme.
+
+    :return: Prüfsumme (hex)
+    """
+    size = os.path.getsize(path)
+    needed = size + _ENTRY_OVERHEAD[state["format"]] + len(arcname)
+    limit = state["split_bytes"] - _END_RESERVE[state["format"]]
+    if state["handle"] is None:
+        _open_part(state)
+    elif state["split_bytes"] and state["part_files"] and state["part_size"] + needed > limit:
+        _close_part(state)
+        _open_part(state)
+
+    digest = hashlib.sha256()
+    mtime = os.path.getmtime(path)
+    arcname = arcname.replace(os.sep, "/")
+
+    if size <= _READ_WHOLE:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest.update(data)
+        if state["format"] == "zip":
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            state["handle"].writestr(info, data)
+        else:
+            info = tarfile.TarInfo(arcname)
+            info.size = len(data)
+            info.mtime = mtime
+            state["handle"].addfile(info, io.BytesIO(data))
+    else:
+        # Große Dateien: Prüfsumme vorab in Blöcken, Inhalt gestreamt
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                digest.update(chunk)
+        if state["format"] == "zip":
+            state["handle"].write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        else:
+            state["handle"].add(path, arcname, recursive=False)
+
+    state["part_size"] += needed
+    state["part_files"] += 1
+    sha256 = digest.hexdigest()
+    state["files"].append({"path": arcname, "part": state["parts"][-1]["name"],
+                           "size": size, "sha256": sha256})
+    return sha256
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def close_archive_set(state, extra=None):
+    """
+    Schließt den letzten Teil und schreibt Manifest und Prüfsummen der Teile.
+
+    :param extra: zusätzliche Felder für das Manifest (z. B. Quellordner)
+    :return: Pfad des Manifests oder None, wenn keine Datei aufgenommen wurde
+    """
+    _close_part(state)
+    if not state["parts"]:
+        return None
+
+    for part in state["parts"]:
+        part_path = os.path.join(state["output_dir"], part["name"])
+        part["size"] = os.path.getsize(part_path)
+        part["sha256"] = _file_sha256(part_path)
+
+    manifest = {
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "format": state["format"],
+        "split_bytes": state["split_bytes"],
+        "parts": state["parts"],
+        "files": state["files"],
+    }
+    if extra:
+        manifest.update(extra)
+    manifest_path = os.path.join(state["output_dir"], f"{state['name']}.manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(state["output_dir"], f"{state['name']}.sha256"), "w", encoding="utf-8", newline="\n") as f:
+        for part in state["parts"]:
+            f.write(f"{part['sha256']}  {part['name']}\n")
+
+    log_message(f"Archivsatz abgeschlossen: {state['name']} ({len(state['files'])} Dateien, "
+                f"{len(state['parts'])} Teil(e))", level="info")
+    return manifest_path
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+atlas.py – Sprite-Atlanten für extrahierte Objekte.
+
+Statt hunderter kleiner Dateien ({nr:02}_{name}.png) werden die Objekte eines
+Quellbildes in eine oder wenige Atlasseiten gepackt:
+
+  {name}.atlas.png, {name}.atlas.1.png, ...   Atlasseiten (RGBA bzw. LA)
+  {name}.atlas.json                           Index (Pflicht)
+  {name}.atlas.csv                            Index als Tabelle (optional)
+
+Der Index enthält je Objekt den ursprünglichen Dateinamen, die Seite, das Rechteck
+im Atlas (x, y, w, h) und die Position im Quellbild (src_x, src_y). Entpackt
+(explode_atlas) entstehen exakt die Dateien, die ohne Atlas geschrieben worden wären.
+
+Aufruf zum Entpacken:
+  python atlas.py <Atlas-JSON oder Ordner> [--remove]
+"""
+import os
+import re
+import sys
+import csv
+import json
+import numpy as np
+from logger import log_message, shorten_path
+from safewrite import atomic_imwrite
+from imgio import read
+
+ATLAS_VERSION = 1
+ATLAS_SUFFIX = ".atlas"
+
+_ATLAS_FILE = re.compile(r"^(?P<stem>.+)\.atlas(\.\d+)?\.(png|json|csv)$", re.IGNORECASE)
+
+# ----------------------------------------------------------
+# Dateinamen
+# ----------------------------------------------------------
+def atlas_stem(file_name):
+    """Basisname eines Atlas-Bestandteils (Seite, JSON, CSV) oder None."""
+    m = _ATLAS_FILE.match(os.path.basename(file_name))
+    return m.group("stem") if m else None
+
+def is_atlas_file(file_name):
+    """True für Atlasseiten und Atlas-Indizes."""
+    return atlas_stem(file_name) is not None
+
+def is_atlas_index(file_name):
+    """True für den JSON-Index eines Atlas."""
+    return file_name.lower().endswith(ATLAS_SUFFIX + ".json")
+
+def page_file_name(stem, page):
+    """Dateiname der Atlasseite page (0 = {stem}.atlas.png)."""
+    return f"{stem}{ATLAS_SUFFIX}.png" if page == 0 else f"{stem}{ATLAS_SUFFIX}.{page}.png"
+
+def load_atlas_options(cfg):
+    """
+    Liest den Abschnitt [Atlas] der settings.ini. Liefert None, wenn der Atlasmodus
+    ausgeschaltet ist, sonst ein dict mit max_size, padding und csv.
+    """
+    if not cfg.getboolean("Atlas", "enabled", fallback=False):
+        return None
+    return {
+        "max_size": cfg.getint("Atlas", "max_size", fallback=4096),
+        "padding": cfg.getint("Atlas", "padding", fallback=1),
+        "csv": cfg.getboolean("Atlas", "csv", fallback=False),
+    }
+
+# ----------------------------------------------------------
+# Packen (Regale, absteigende Höhe)
+# ----------------------------------------------------------
+def pack_rects(sizes, max_size=4096, padding=1):
+    """
+    Packt Rechtecke (w, h) in Seiten von höchstens max_size x max_size Pixeln
+    (Regal-Verfahren "first fit decreasing height"). Zwischen den Rechtecken
+    bleiben padding Pixel frei. Größere Rechtecke erhalten eine eigene Seite.
+
+    :return: (placements, page_sizes) – placements[i] = (Seite, x, y) für sizes[i],
+             page_sizes[p] = (Breite, Höhe)
+    """
+    if not sizes:
+        return [], []
+    total_area = sum((w + padding) * (h + padding) for w, h in sizes)
+    widest = max(w for w, _ in sizes) + padding
+    # Annähernd quadratische Seiten, mindestens so breit wie das breiteste Objekt
+    page_width = min(max_size, max(widest, int(np.ceil(np.sqrt(total_area * 1.1)))))
+
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i))
+    placements = [None] * len(sizes)
+    pages = []  # je Seite: {"width", "height", "shelves": [[y, Höhe, belegte Breite]]}
+
+    for i in order:
+        w, h = sizes[i][0] + padding, sizes[i][1] + padding
+        placed = False
+        for p, page in enumerate(pages):
+            for shelf in page["shelves"]:
+                if h <= shelf[1] and shelf[2] + w <= page["width"]:
+                    placements[i] = (p, shelf[2], shelf[0])
+                    shelf[2] += w
+                    placed = True
+                    break
+            if not placed and w <= page["width"] and page["height"] + h <= max_size:
+                page["shelves"].append([page["height"], h, w])
+                placements[i] = (p, 0, page["height"])
+                page["height"] += h
+                placed = True
+            if placed:
+                break
+        if not placed:
+            pages.append({"width": max(page_width, w), "height": h, "shelves": [[0, h, w]]})
+            placements[i] = (len(pages) - 1, 0, 0)
+
+    page_sizes = [[0, 0] for _ in pages]
+    for (p, x, y), (w, h) in zip(placements, sizes):
+        page_sizes[p][0] = max(page_sizes[p][0], x + w)
+        page_sizes[p][1] = max(page_sizes[p][1], y + h)
+    return placements, [tuple(s) for s in page_sizes]
+
+# ----------------------------------------------------------
+# Schreiben und Lesen
+# ----------------------------------------------------------
+def _write_page(path, page):
+    return atomic_imwrite(path, page)
+
+def _read_page(path, mode):
+    page = read(path, "gray_alpha" if mode == "gray" else "bgra")
+    if page is None:
+        raise IOError(f"Atlasseite konnte nicht geladen werden: {path}")
+    return page
+
+def write_atlas(output_dir, stem, objects, mode="color", max_size=4096, padding=1,
+                write_csv=False, extra=None):
+    """
+    Packt Objekte in Atlasseiten und schreibt Seiten und Index.
+
+    :param objects: Liste von (Dateiname, Array, (src_x, src_y)); Array ist BGRA ("color")
+                    bzw. (H, W, 2) aus Grauwert und Alpha ("gray")
+    :param extra: zusätzliche Felder für den JSON-Index (z. B. Skalierung)
+    :return: Pfad des JSON-Index oder None, wenn keine Objekte vorhanden sind
+    """
+    if not objects:
+        return None
+    sizes = [(arr.shape[1], arr.shape[0]) for _, arr, _ in objects]
+    placements, page_sizes = pack_rects(sizes, max_size=max_size, padding=padding)
+    channels = objects[0][1].shape[2]
+    pages = [np.zeros((h, w, channels), dtype=np.uint8) for w, h in page_sizes]
+
+    entries = []
+    for (name, arr, (src_x, src_y)), (p, x, y) in zip(objects, placements):
+        h, w = arr.shape[:2]
+        pages[p][y:y + h, x:x + w] = arr
+        entries.append({"name": name, "page": p, "x": x, "y": y, "w": w, "h": h,
+                        "src_x": int(src_x), "src_y": int(src_y)})
+
+    page_names = [page_file_name(stem, p) for p in range(len(pages))]
+    for page_name, page in zip(page_names, pages):
+        if not _write_page(os.path.join(output_dir, page_name), page):
+            raise IOError(f"Atlasseite konnte nicht gespeichert werden: {page_name}")
+
+    index = {"version": ATLAS_VERSION, "mode": mode, "padding": padding,
+             "pages": page_names, "objects": entries}
+    if extra:
+        index.update(extra)
+    index_path = os.path.join(output_dir, f"{stem}{ATLAS_SUFFIX}.json")
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+    if write_csv:
+        with open(os.path.join(output_dir, f"{stem}{ATLAS_SUFFIX}.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["name", "page", "x", "y", "w", "h", "src_x", "src_y"])
+            for e in entries:
+                writer.writerow([e["name"], page_names[e["page"]], e["x"], e["y"], e["w"], e["h"],
+                                 e["src_x"], e["src_y"]])
+
+    log_message(f"Atlas gespeichert: {shorten_path(index_path)} ({len(entries)} Objekte, {len(pages)} Seite(n))", level="info")
+    return index_path
+
+def load_atlas(index_path):
+    """Liest den JSON-Index eines Atlas."""
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != ATLAS_VERSION:
+        raise ValueError(f"Nicht unterstützte Atlas-Version: {index.get('version')}")
+    return index
+
+def iter_atlas_objects(index_path, index=None):
+    """
+    Liefert (Eintrag, Array) für alle Objekte eines Atlas. Jede Seite wird nur einmal
+    dekodiert; die Arrays sind Kopien und können verändert werden.
+    """
+    index = load_atlas(index_path) if index is None else index
+    folder = os.path.dirname(index_path)
+    pages = {}
+    for entry in index["objects"]:
+        p = entry["page"]
+        if p not in pages:
+            pages[p] = _read_page(os.path.join(folder, index["pages"][p]), index["mode"])
+        x, y, w, h = entry["x"], entry["y"], entry["w"], entry["h"]
+        yield entry, pages[p][y:y + h, x:x + w].copy()
+
+def atlas_files(index_path, index=None):
+    """Alle Dateien eines Atlas (Index, Seiten, ggf. CSV)."""
+    index = load_atlas(index_path) if index is None else index
+    folder = os.path.dirname(index_path)
+    files = [index_path] + [os.path.join(folder, p) for p in index["pages"]]
+    csv_path = index_path[:-len(".json")] + ".csv"
+    if os.path.exists(csv_path):
+        files.append(csv_path)
+    return files
+
+def remove_atlas(index_path):
+    """Löscht alle Dateien eines Atlas."""
+    for path in atlas_files(index_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def explode_atlas(index_path, output_dir=None, remove=False):
+    """
+    Entpackt einen Atlas in einzelne PNG-Dateien (ursprüngliche Dateinamen).
+
+    :param output_dir: Zielordner (Standard: Ordner des Atlas)
+    :param remove: Atlas nach erfolgreichem Entpacken löschen
+    :return: Anzahl geschriebener Dateien
+    """
+    index = load_atlas(index_path)
+    output_dir = output_dir or os.path.dirname(index_path)
+    os.makedirs(output_dir, exist_ok=True)
+    written = 0
+    for entry, arr in iter_atlas_objects(index_path, index):
+        if _write_page(os.path.join(output_dir, entry["name"]), arr):
+            written += 1
+        else:
+            log_message(f"Fehler beim Schreiben von {entry['name']}", level="error")
+    log_message(f"Atlas entpackt: {shorten_path(index_path)} → {written} Dateien", level="info")
+    if remove and written == len(index["objects"]):
+        remove_atlas(index_path)
+    return written
+
+def find_atlases(directory):
+    """Alle Atlas-Indizes in einem Ordner (rekursiv)."""
+    found = []
+    for root, _, files in os.walk(directory):
+        found.extend(os.path.join(root, f) for f in files if is_atlas_index(f))
+    return sorted(found)
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--remove"]
+    if len(args) != 1:
+        print("Aufruf: python atlas.py <Atlas-JSON oder Ordner> [--remove]")
+        sys.exit(1)
+    target = args[0]
+    targets = find_atlases(target) if os.path.isdir(target) else [target]
+    for index_path in targets:
+        explode_atlas(index_path, remove="--remove" in sys.argv[1:])
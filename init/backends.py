@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+backends.py – austauschbare Bild-Engines hinter einer gemeinsamen Schnittstelle.
+
+Die Stufen mischen bisher PIL und OpenCV; keine der beiden Bibliotheken streamt,
+ein großes Bild liegt also immer vollständig (und bei jedem Wechsel zwischen RGB
+und BGR doppelt) im Speicher. Eine Engine ist ein dict mit denselben Funktionen:
+
+  open(path)                      Bild öffnen -> Handle
+  size(handle)                    (Breite, Höhe)
+  read_region(handle, box=None)   Pixel als NumPy-Array in OpenCV-Reihenfolge
+                                  (BGR/BGRA/Grau); box = (x, y, Breite, Höhe)
+  convert(handle, mode)           "gray", "bgr" oder "bgra" -> Handle
+  resize(handle, size, interp)    auf (Breite, Höhe); interp = lanczos, bicubic,
+                                  bilinear oder nearest -> Handle
+  invert(handle)                  Farbkanäle invertieren (Alpha bleibt) -> Handle
+  write(handle, path)             atomar schreiben (Format anhand der Endung)
+
+Engines:
+  cv2   Handle = NumPy-Array (IMREAD_UNCHANGED)
+  pil   Handle = PIL-Bild; Operationen wie bisher in Scal und convert
+  vips  Handle = pyvips-Bild (optional, "pip install pyvips" plus libvips).
+        libvips rechnet bedarfsgesteuert: open/convert/resize/invert bauen nur
+        eine Verarbeitungskette auf, erst write liest das Bild zeilenweise und
+        schreibt es direkt – der Speicherbedarf bleibt unabhängig von der Bildgröße.
+
+choose_backend() wählt je Bild: mit engine = auto die bisherige Engine der Stufe,
+für Bilder ab streaming_megapixels (Kopfdaten, ohne Dekodieren) vips, sofern
+installiert. Einstellungen: settings.ini, Abschnitt [Backend].
+"""
+import io
+import os
+import numpy as np
+import cv2
+from PIL import Image, ImageOps
+from logger import log_message, shorten_path
+from safewrite import atomic_imwrite, atomic_write_bytes, pil_save_params, write_params
+
+try:
+    import pyvips
+except (ImportError, OSError):  # Paket fehlt oder libvips nicht installiert
+    pyvips = None
+
+ENGINE_NAMES = ("cv2", "pil", "vips")
+MODES = ("gray", "bgr", "bgra")
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_backend_options(cfg):
+    """Liest [Backend] aus der settings.ini."""
+    options = {"engine": "auto", "streaming_megapixels": 64.0}
+    if cfg is None or not cfg.has_section("Backend"):
+        return options
+    options["engine"] = cfg.get("Backend", "engine", fallback="auto").strip().lower()
+    options["streaming_megapixels"] = cfg.getfloat("Backend", "streaming_megapixels", fallback=64.0)
+    return options
+
+def vips_available():
+    return pyvips is not None
+
+# ----------------------------------------------------------
+# OpenCV
+# ----------------------------------------------------------
+_CV2_INTERPOLATIONS = {"nearest": cv2.INTER_NEAREST, "bilinear": cv2.INTER_LINEAR,
+                       "bicubic": cv2.INTER_CUBIC, "lanczos": cv2.INTER_LANCZOS4}
+
+def _cv2_open(path):
+    img = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise IOError(f"Bild konnte nicht geladen werden: {shorten_path(str(path))}")
+    return img
+
+def _cv2_region(img, box=None):
+    if box is None:
+        return img
+    x, y, w, h = box
+    return img[y:y + h, x:x + w]
+
+def _cv2_convert(img, mode):
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if mode == "gray":
+        return img if channels == 1 else cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if channels == 4 else cv2.COLOR_BGR2GRAY)
+    if mode == "bgr":
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if channels == 1 else img[:, :, :3]
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA if channels == 1 else cv2.COLOR_BGR2BGRA) if channels != 4 else img
+
+def _cv2_resize(img, size, interp="lanczos"):
+    return cv2.resize(img, tuple(size), interpolation=_CV2_INTERPOLATIONS[interp])
+
+def _cv2_invert(img):
+    if img.ndim == 3 and img.shape[2] == 4:
+        result = img.copy()
+        result[:, :, :3] = 255 - img[:, :, :3]
+        return result
+    return cv2.bitwise_not(img)
+
+def _cv2_write(img, path):
+    if not atomic_imwrite(path, img):
+        raise IOError(f"Bild konnte nicht gespeichert werden: {shorten_path(str(path))}")
+
+# ----------------------------------------------------------
+# PIL
+# ----------------------------------------------------------
+_PIL_INTERPOLATIONS = {"nearest": Image.NEAREST, "bilinear": Image.BILINEAR,
+                       "bicubic": Image.BICUBIC, "lanczos": Image.LANCZOS}
+_PIL_MODES = {"gray": "L", "bgr": "RGB", "bgra": "RGBA"}
+
+def _pil_open(path):
+    return Image.open(path)
+
+def _pil_region(img, box=None):
+    if box is not None:
+        x, y, w, h = box
+        img = img.crop((x, y, x + w, y + h))
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    arr = np.asarray(img)
+    if img.mode == "RGB":
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    if img.mode == "RGBA":
+        return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+    return arr
+
+def _pil_convert(img, mode):
+    return img.convert(_PIL_MODES[mode])
+
+def _pil_resize(img, size, interp="lanczos"):
+    return img.resize(tuple(size), _PIL_INTERPOLATIONS[interp])
+
+def _pil_invert(img):
+    if img.mode in ("RGBA", "LA"):
+        *colors, alpha = img.split()
+        inverted = [ImageOps.invert(c) for c in colors]
+        return Image.merge(img.mode, (*inverted, alpha))
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    return ImageOps.invert(img)
+
+def _pil_write(img, path):
+    path = str(path)
+    buffer = io.BytesIO()
+    img.save(buffer, Image.registered_extensions()[os.path.splitext(path)[1].lower()], **pil_save_params(path))
+    atomic_write_bytes(path, buffer.getvalue())
+
+# ----------------------------------------------------------
+# libvips (optional)
+# ----------------------------------------------------------
+_VIPS_KERNELS = {"nearest": "nearest", "bilinear": "linear", "bicubic": "cubic", "lanczos": "lanczos3"}
+
+def _vips_open(path):
+    # sequential: Pixel werden beim Schreiben in einem Durchlauf von oben nach unten gelesen
+    return pyvips.Image.new_from_file(str(path), access="sequential")
+
+def _vips_region(img, box=None):
+    if box is not None:
+        img = img.crop(*box)
+    if img.format != "uchar":
+        img = img.cast("uchar")
+    arr = np.ndarray(buffer=img.write_to_memory(), dtype=np.uint8, shape=(img.height, img.width, img.bands))
+    if img.bands == 3:
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    if img.bands == 4:
+        return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+    return arr[:, :, 0] if img.bands == 1 else arr
+
+def _vips_convert(img, mode):
+    if mode == "gray":
+        return img.colourspace("b-w")[0]
+    rgb = img.colourspace("srgb") if img.bands < 3 else img
+    if mode == "bgr":
+        return rgb[:3]
+    return rgb if rgb.bands == 4 else rgb[:3].bandjoin(255)
+
+def _vips_resize(img, size, interp="lanczos"):
+    w, h = size
+    return img.resize(w / img.width, vscale=h / img.height, kernel=_VIPS_KERNELS[interp])
+
+def _vips_invert(img):
+    if img.hasalpha():
+        return img[:img.bands - 1].invert().bandjoin(img[img.bands - 1])
+    return img.invert()
+
+def _vips_write(img, path):
+    path = str(path)
+    base, ext = os.path.splitext(path)
+    # Temporäre Datei mit gleicher Endung: libvips wählt das Format danach
+    tmp_path = f"{base}.{os.getpid()}.tmp{ext}"
+    params = write_params(path)
+    try:
+        if params:
+            img.write_to_file(tmp_path, compression=params[1])
+        else:
+            img.write_to_file(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ----------------------------------------------------------
+# Auswahl
+# ----------------------------------------------------------
+BACKENDS = {
+    "cv2": {"name": "cv2", "open": _cv2_open, "size": lambda img: (img.shape[1], img.shape[0]),
+            "read_region": _cv2_region, "convert": _cv2_convert, "resize": _cv2_resize,
+            "invert": _cv2_invert, "write": _cv2_write},
+    "pil": {"name": "pil", "open": _pil_open, "size": lambda img: img.size,
+            "read_region": _pil_region, "convert": _pil_convert, "resize": _pil_resize,
+            "invert": _pil_invert, "write": _pil_write},
+    "vips": {"name": "vips", "open": _vips_open, "size": lambda img: (img.width, img.height),
+             "read_region": _vips_region, "convert": _vips_convert, "resize": _vips_resize,
+             "invert": _vips_invert, "write": _vips_write},
+}
+
+def get_backend(name):
+    """Engine nach Namen; vips ohne pyvips fällt mit Warnung auf cv2 zurück."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unbekannte Bild-Engine: {name}")
+    if name == "vips" and not vips_available():
+        log_message("pyvips/libvips nicht installiert – verwende cv2.", level="warning")
+        return BACKENDS["cv2"]
+    return BACKENDS[name]
+
+def header_megapixels(path):
+    """Bildgröße in Megapixeln aus den Kopfdaten (ohne Dekodieren), 0 bei Fehlern."""
+    try:
+        with Image.open(path) as img:
+            return img.width * img.height / 1e6
+    except Exception:
+        return 0.0
+
+def choose_backend(options, path, default="cv2"):
+    """
+    Engine für ein Bild: die in [Backend] engine eingetragene, bei "auto" die
+    bisherige Engine der Stufe (default) – für große Bilder vips, falls verfügbar.
+    """
+    engine = options["engine"]
+    if engine != "auto":
+        return get_backend(engine)
+    if vips_available() and header_megapixels(path) >= options["streaming_megapixels"]:
+        log_message(f"Großes Bild, verarbeite bedarfsgesteuert mit libvips: {shorten_path(str(path))}", level="info")
+        return BACKENDS["vips"]
+    return BACKENDS[default]
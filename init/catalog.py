@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+catalog.py – Bildkatalog (SQLite) je Lauf mit Kopfdaten aller Bilder.
+
+Beim Einlesen (convert) werden nur die Dateiköpfe gelesen – PNG IHDR/tRNS und
+JPEG SOF direkt, alle anderen Formate über PIL ohne Dekodieren – und im Katalog
+{Datumsordner}/catalog.sqlite abgelegt:
+
+  Breite, Höhe, Modus, Alphakanal, Bittiefe, Anzahl Einzelbilder, Format, SHA-256
+
+Stufen fragen den Katalog statt das Bild zu öffnen (z. B. überspringt Extract
+Bilder ohne Alphakanal, ohne sie zu dekodieren). Einträge gelten, solange Größe und
+Änderungszeit der Datei übereinstimmen; sonst wird der Kopf neu gelesen (get_info).
+
+Eine günstige Prüfung erkennt beschädigte Dateien (abgeschnittene PNG/JPEG,
+unlesbare Köpfe). Sie werden nach {Datumsordner}/_quarantine verschoben, bevor eine
+teure Stufe sie anfasst.
+
+Die Tabelle stage_runs vermerkt je Datei und Stufe die Prüfsumme des Ergebnisses
+und einen Fingerabdruck der Stufenparameter. Nicht idempotente Stufen (invert,
+SwapColors) überspringen so Dateien, die sie in einem früheren Lauf auf demselben
+Datumsordner mit denselben Parametern bereits bearbeitet haben; nach geänderten
+Parametern (z. B. anderen Farbpaaren in [swap]) wird erneut bearbeitet.
+
+Wie die Arbeitswarteschlange (workqueue.py) liegt der Katalog im Datumsordner, auf
+den mehrere Worker – auch über ein Netzlaufwerk – zugreifen. Er wird daher im
+Rollback-Journal-Modus betrieben (WAL setzt gemeinsamen Speicher voraus), und
+Schreibvorgänge laufen unter einer Schreibsperre (BEGIN IMMEDIATE). Prüfsummen werden
+vor dem Sperren berechnet, damit die Sperre nur für das Eintragen gehalten wird.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from PIL import Image
+from logger import log_message, shorten_path
+
+CATALOG_NAME = "catalog.sqlite"
+QUARANTINE_FOLDER = "_quarantine"
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+# PNG-Farbtyp -> (Modus, Kanäle)
+_PNG_COLOR_TYPES = {0: ("L", 1), 2: ("RGB", 3), 3: ("P", 1), 4: ("LA", 2), 6: ("RGBA", 4)}
+# JPEG-Marker mit Bildgröße (SOF0..SOF15 ohne DHT, JPG, DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+# Ende einer JPEG-Datei (EOI) muss in diesem Bereich am Dateiende liegen
+_JPEG_TAIL = 4096
+_CHUNK = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER,
+    mtime     REAL,
+    format    TEXT,
+    width     INTEGER,
+    height    INTEGER,
+    mode      TEXT,
+    has_alpha INTEGER,
+    bit_depth INTEGER,
+    frames    INTEGER,
+    sha256    TEXT,
+    status    TEXT,
+    error     TEXT,
+    probed    REAL
+)
+"""
+# Abgeschlossene Stufen je Datei: erkennt Wiederholungen nicht idempotenter Stufen
+# (z. B. invert) in einem erneuten Lauf auf demselben Datumsordner
+_STAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_runs (
+    path          TEXT,
+    stage         TEXT,
+    input_sha256  TEXT,
+    output_sha256 TEXT,
+    changed       INTEGER,
+    finished      REAL,
+    params        TEXT,
+    PRIMARY KEY (path, stage)
+)
+"""
+_COLUMNS = ("path", "size", "mtime", "format", "width", "height", "mode", "has_alpha",
+            "bit_depth", "frames", "sha256", "status", "error", "probed")
+
+# ----------------------------------------------------------
+# Kopfdaten lesen
+# ----------------------------------------------------------
+def _probe_png(f):
+    """IHDR und (bis zum ersten IDAT) tRNS/acTL auswerten."""
+    f.seek(8)
+    length, chunk_type = struct.unpack(">I4s", f.read(8))
+    if chunk_type != b"IHDR" or length != 13:
+        raise ValueError("PNG ohne gültigen IHDR")
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", f.read(10))
+    if color_type not in _PNG_COLOR_TYPES or not width or not height:
+        raise ValueError("PNG mit ungültigem IHDR")
+    mode, channels = _PNG_COLOR_TYPES[color_type]
+    has_alpha = color_type in (4, 6)
+    frames = 1
+    f.seek(8 + 8 + 13 + 4)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG ohne Bilddaten")
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IDAT":
+            break
+        if chunk_type == b"tRNS":
+            has_alpha = True
+        elif chunk_type == b"acTL":
+            frames = struct.unpack(">I", f.read(4))[0]
+            length -= 4
+        f.seek(length + 4, os.SEEK_CUR)
+    return {"format": "PNG", "width": width, "height": height, "mode": mode,
+            "has_alpha": has_alpha, "bit_depth": bit_depth, "channels": channels, "frames": frames}
+
+def _probe_jpeg(f):
+    """Segmente bis zum ersten SOF-Marker überspringen."""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            raise ValueError("JPEG ohne SOF")
+        marker = byte[0]
+        if marker in (0x01,) or 0xD0 <= marker <= 0xD9:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker in _JPEG_SOF:
+            bit_depth, height, width, components = struct.unpack(">BHHB", f.read(6))
+            if not width or not height:
+                raise ValueError("JPEG mit ungültiger Bildgröße")
+            return {"format": "JPEG", "width": width, "height": height,
+                    "mode": _JPEG_MODES.get(components, "RGB"), "has_alpha": False,
+                    "bit_depth": bit_depth, "channels": components, "frames": 1}
+        f.seek(length - 2, os.SEEK_CUR)
+
+def _probe_pil(f):
+    """Alle übrigen Formate: PIL öffnet nur den Kopf."""
+    f.seek(0)
+    with Image.open(f) as img:
+        bands = img.getbands()
+        return {"format": img.format, "width": img.width, "height": img.height, "mode": img.mode,
+                "has_alpha": "A" in bands or "a" in bands or "transparency" in img.info,
+                "bit_depth": {"1": 1, "I;16": 16, "I": 32, "F": 32}.get(img.mode, 8),
+                "channels": len(bands), "frames": getattr(img, "n_frames", 1)}
+
+def probe_stream(f):
+    """Wie probe_header, aber für eine geöffnete Datei bzw. einen Puffer (io.BytesIO)."""
+    f.seek(0)
+    signature = f.read(8)
+    if signature == _PNG_SIGNATURE:
+        return _probe_png(f)
+    if signature[:3] == b"\xff\xd8\xff":
+        return _probe_jpeg(f)
+    return _probe_pil(f)
+
+def probe_header(path):
+    """
+    Liest die Kopfdaten eines Bildes, ohne es zu dekodieren.
+
+    :return: dict mit format, width, height, mode, has_alpha, bit_depth, channels, frames
+    :raises: ValueError/OSError bei unlesbaren Köpfen
+    """
+    with open(path, "rb") as f:
+        return probe_stream(f)
+
+def check_stream(f, size, info):
+    """Wie check_integrity, aber für eine geöffnete Datei bzw. einen Puffer der Länge size."""
+    if info["format"] == "PNG":
+        f.seek(max(0, size - len(_PNG_IEND)))
+        if f.read() != _PNG_IEND:
+            return "PNG unvollständig (IEND fehlt)"
+        return None
+    if info["format"] == "JPEG":
+        f.seek(max(0, size - _JPEG_TAIL))
+        if b"\xff\xd9" not in f.read():
+            return "JPEG unvollständig (EOI fehlt)"
+        return None
+    try:
+        f.seek(0)
+        with Image.open(f) as img:
+            img.verify()
+    except Exception as e:
+        return f"Bild beschädigt: {e}"
+    return None
+
+def check_integrity(path, info):
+    """
+    Günstige Prüfung auf abgeschnittene Dateien: PNG muss mit IEND enden, JPEG mit
+    EOI (in den letzten Bytes); andere Formate prüft PIL (verify).
+
+    :return: None oder Fehlerbeschreibung
+    """
+    with open(path, "rb") as f:
+        return check_stream(f, os.path.getsize(path), info)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# ----------------------------------------------------------
+# Katalog
+# ----------------------------------------------------------
+def catalog_path(date_folder):
+    return os.path.join(date_folder, CATALOG_NAME)
+
+def open_catalog(date_folder):
+    """Öffnet (bzw. erzeugt) den Katalog eines Datumsordners."""
+    conn = sqlite3.connect(catalog_path(date_folder), timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute(_SCHEMA)
+    conn.execute(_STAGE_SCHEMA)
+    # Kataloge älterer Läufe: Spalte für den Parameter-Fingerabdruck nachrüsten
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(stage_runs)")}
+    if "params" not in columns:
+        with _writing(conn):
+            conn.execute("ALTER TABLE stage_runs ADD COLUMN params TEXT")
+    return conn
+
+@contextmanager
+def _writing(conn):
+    """Schreibtransaktion mit sofortiger Sperre; innerhalb einer laufenden Transaktion ohne eigene."""
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _rel_path(date_folder, path):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(date_folder)).replace(os.sep, "/")
+
+def _store(conn, entry):
+    with _writing(conn):
+        conn.execute(f"INSERT OR REPLACE INTO images ({', '.join(_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                     [entry.get(column) for column in _COLUMNS])
+
+def catalog_file(conn, date_folder, path, check=True):
+    """
+    Liest Kopf, Prüfsumme und (optional) Integrität einer Datei und speichert sie.
+
+    :return: Eintrag (dict); status ist "ok" oder "corrupt" (Grund in error)
+    """
+    entry = _file_entry(date_folder, path, check)
+    _store(conn, entry)
+    return entry
+
+def _file_entry(date_folder, path, check):
+    stat = os.stat(path)
+    entry = {"path": _rel_path(date_folder, path), "size": stat.st_size, "mtime": stat.st_mtime,
+             "status": "ok", "error": None, "probed": time.time()}
+    try:
+        info = probe_header(path)
+        entry.update(info)
+        entry["has_alpha"] = int(info["has_alpha"])
+        if check:
+            entry["error"] = check_integrity(path, info)
+    except Exception as e:
+        entry["error"] = f"Kopf nicht lesbar: {e}"
+    if entry["error"]:
+        entry["status"] = "corrupt"
+    entry["sha256"] = file_sha256(path)
+    return entry
+
+def catalog_data(conn, date_folder, path, data, check=True, stat=None):
+    """
+    Wie catalog_file, aber für bereits gelesene Dateidaten (bytes): Kopf, Prüfsumme
+    und Integrität kommen aus dem Speicher, die Datei wird nicht erneut gelesen.
+
+    :param stat: os.stat_result der Datei (sonst os.stat(path))
+    :return: Eintrag (dict); status ist "ok" oder "corrupt" (Grund in error)
+    """
+    stat = stat or os.stat(path)
+    entry = {"path": _rel_path(date_folder, path), "size": stat.st_size, "mtime": stat.st_mtime,
+             "status": "ok", "error": None, "probed": time.time()}
+    buffer = io.BytesIO(data)
+    try:
+        info = probe_stream(buffer)
+        entry.update(info)
+        entry["has_alpha"] = int(info["has_alpha"])
+        if check:
+            entry["error"] = check_stream(buffer, len(data), info)
+    except Exception as e:
+        entry["error"] = f"Kopf nicht lesbar: {e}"
+    if entry["error"]:
+        entry["status"] = "corrupt"
+    entry["sha256"] = hashlib.sha256(data).hexdigest()
+    _store(conn, entry)
+    return entry
+
+def catalog_copy(conn, date_folder, entry, path):
+    """Übernimmt den Eintrag einer Quelldatei für eine identische Kopie (ohne erneutes Lesen)."""
+    stat = os.stat(path)
+    copy_entry = dict(entry, path=_rel_path(date_folder, path), size=stat.st_size, mtime=stat.st_mtime)
+    _store(conn, copy_entry)
+    return copy_entry
+
+def lookup(conn, date_folder, path):
+    """Gespeicherter Eintrag, sofern Größe und Änderungszeit noch stimmen (sonst None)."""
+    row = conn.execute("SELECT * FROM images WHERE path = ?", (_rel_path(date_folder, path),)).fetchone()
+    if row is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if row["size"] != stat.st_size or row["mtime"] != stat.st_mtime:
+        return None
+    return dict(row)
+
+def get_info(conn, date_folder, path):
+    """Eintrag aus dem Katalog; fehlt er oder ist er veraltet, wird der Kopf neu gelesen."""
+    return lookup(conn, date_folder, path) or catalog_file(conn, date_folder, path, check=False)
+
+def forget(conn, date_folder, path):
+    """Entfernt den Eintrag einer Datei (z. B. nach dem Löschen)."""
+    with _writing(conn):
+        conn.execute("DELETE FROM images WHERE path = ?", (_rel_path(date_folder, path),))
+
+def quarantine(conn, date_folder, path, reason):
+    """
+    Verschiebt eine beschädigte Datei nach {Datumsordner}/_quarantine und vermerkt
+    den Grund im Katalog.
+
+    :return: neuer Pfad
+    """
+    target_dir = os.path.join(date_folder, QUARANTINE_FOLDER)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(path))
+    base, ext = os.path.splitext(target)
+    counter = 1
+    while os.path.exists(target):
+        target = f"{base}_{counter}{ext}"
+        counter += 1
+    shutil.move(path, target)
+    with _writing(conn):
+        forget(conn, date_folder, path)
+        _store(conn, {"path": _rel_path(date_folder, target), "size": os.path.getsize(target),
+                      "mtime": os.path.getmtime(target), "status": "quarantined", "error": reason,
+                      "probed": time.time()})
+    log_message(f"Datei in Quarantäne verschoben: {shorten_path(path)} ({reason})", level="warning")
+    return target
+
+def stage_done(conn, date_folder, stage, path, params=None):
+    """
+    True, wenn die Stufe diese Datei mit denselben Parametern (Fingerabdruck params)
+    bereits bearbeitet hat und die Datei seitdem unverändert ist (Prüfsumme gleich
+    dem damaligen Ergebnis).
+    """
+    row = conn.execute("SELECT output_sha256, params FROM stage_runs WHERE path = ? AND stage = ?",
+                       (_rel_path(date_folder, path), stage)).fetchone()
+    if row is None or row["params"] != params:
+        return False
+    return get_info(conn, date_folder, path).get("sha256") == row["output_sha256"]
+
+def record_stage_run(conn, date_folder, stage, path, input_sha256=None, changed=True, params=None):
+    """
+    Vermerkt, dass eine Stufe die Datei (mit den Parametern params) bearbeitet hat.
+    Nach einer Änderung wird der Katalogeintrag (Kopf und Prüfsumme) aktualisiert.
+    """
+    entry = _file_entry(date_folder, path, check=False) if changed else get_info(conn, date_folder, path)
+    with _writing(conn):
+        if changed:
+            _store(conn, entry)
+        conn.execute("INSERT OR REPLACE INTO stage_runs "
+                     "(path, stage, input_sha256, output_sha256, changed, finished, params) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (_rel_path(date_folder, path), stage, input_sha256 or entry["sha256"], entry["sha256"],
+                      int(changed), time.time(), params))
+
+def summary(conn):
+    """Kennzahlen für Berichte: Anzahl je Status und Format, Alphakanal, Pixel gesamt."""
+    result = {"status": {}, "format": {}}
+    for row in conn.execute("SELECT status, COUNT(*) AS n FROM images GROUP BY status"):
+        result["status"][row["status"]] = row["n"]
+    for row in conn.execute("SELECT format, COUNT(*) AS n FROM images WHERE status = 'ok' GROUP BY format"):
+        result["format"][row["format"] or "?"] = row["n"]
+    row = conn.execute("SELECT COUNT(*) AS n, SUM(has_alpha) AS alpha, SUM(width * height) AS pixels "
+                       "FROM images WHERE status = 'ok'").fetchone()
+    result["images"] = row["n"]
+    result["with_alpha"] = row["alpha"] or 0
+    result["pixels"] = row["pixels"] or 0
+    return result
+
+if __name__ == "__main__":
+    # Aufruf: python init/catalog.py <Datumsordner> – Kennzahlen des Katalogs ausgeben
+    if len(sys.argv) < 2 or not os.path.exists(catalog_path(sys.argv[1])):
+        print("Aufruf: python init/catalog.py <Datumsordner mit catalog.sqlite>")
+        sys.exit(1)
+    print(json.dumps(summary(open_catalog(sys.argv[1])), indent=2))
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+colorlut.py – vorberechnete Farbersetzungs-Tabelle (LUT) für SwapColors.
+
+Statt für jedes Farbpaar einen vollständigen ΔE-Durchlauf über das Bild zu rechnen,
+wird pro [swap]-Konfiguration einmalig eine quantisierte RGB -> Ersetzungs-Tabelle
+aufgebaut. Die Tabelle ist zweistufig:
+
+  - grob:  2^bits Zellen pro Kanal (Standard 64³), ein Byte pro Zelle
+  - fein:  nur für Zellen, in denen die Entscheidung nicht einheitlich ist
+           (also Zellen, die eine Toleranzgrenze schneiden), wird die exakte
+           Zuordnung jeder einzelnen Farbe gespeichert.
+
+Damit ist das Ergebnis exakt, die Tabelle bleibt aber klein und cachefreundlich.
+Die fertige Tabelle wird im Projekt-Cache (_cache/colorlut) unter einem Hash der
+Konfiguration abgelegt und in späteren Läufen direkt geladen.
+
+Unterstützte Abstandsmaße:
+  - "euclid":    ΔE76 im 8-Bit-Lab-Raum von OpenCV (entspricht dem bisherigen Verhalten)
+  - "ciede2000": vollständiges, vektorisiertes CIEDE2000 im CIE-Lab-Raum
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import cv2
+from logger import log_message, shorten_path
+from utils import get_cache_dir
+
+# Version des Tabellenformats – bei Änderungen an der Berechnung erhöhen,
+# damit alte Cache-Dateien nicht mehr verwendet werden.
+LUT_VERSION = 1
+
+SUPPORTED_METRICS = ("euclid", "ciede2000")
+
+# Markierung in der Grobtabelle: Zelle muss über die Feintabelle aufgelöst werden
+_REFINE = 255
+
+# ----------------------------------------------------------
+# Farbumrechnung
+# ----------------------------------------------------------
+def hex_to_bgr(hex_color: str) -> np.ndarray:
+    """Konvertiert Hex-Farbcode (#RRGGBB) in BGR-Array."""
+    hex_color = hex_color.strip().lstrip("#")
+    r, g, b = [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
+    return np.array([b, g, r], dtype=np.uint8)
+
+def bgr_to_lab(bgr: np.ndarray, metric: str = "euclid") -> np.ndarray:
+    """
+    Rechnet eine (N, 3)-Liste von BGR-Farben (uint8) in Lab um.
+
+    Für "euclid" wird wie bisher der 8-Bit-Lab-Raum von OpenCV verwendet
+    (L, a, b jeweils 0-255), für "ciede2000" der echte CIE-Lab-Raum
+    (L 0-100, a/b vorzeichenbehaftet).
+    """
+    bgr = np.ascontiguousarray(bgr, dtype=np.uint8).reshape(-1, 1, 3)
+    if metric == "ciede2000":
+        lab = cv2.cvtColor(bgr.astype(np.float32) / 255.0, cv2.COLOR_BGR2LAB)
+    else:
+        lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
+    return lab.reshape(-1, 3)
+
+# ----------------------------------------------------------
+# Abstandsmaße
+# ----------------------------------------------------------
+def delta_e_76(lab: np.ndarray, lab_ref: np.ndarray) -> np.ndarray:
+    """Euklidischer Abstand (ΔE76) zwischen (N, 3)-Lab-Werten und einer Lab-Farbe."""
+    diff = lab - np.asarray(lab_ref, dtype=np.float32)
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+def delta_e_ciede2000(lab: np.ndarray, lab_ref: np.ndarray) -> np.ndarray:
+    """
+    Berechnet CIEDE2000 ΔE zwischen (N, 3)-Lab-Werten und einer Lab-Farbe.
+    Vollständig vektorisiert nach Sharma, Wu, Dalal (2005).
+    """
+    lab = lab.astype(np.float64, copy=False)
+    L1, a1, b1 = lab[:, 0], lab[:, 1], lab[:, 2]
+    L2, a2, b2 = (float(v) for v in lab_ref)
+
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_bar7 = ((C1 + C2) / 2.0) ** 7
+    G = 0.5 * (1.0 - np.sqrt(C_bar7 / (C_bar7 + 25.0 ** 7)))
+
+    a1p = (1.0 + G) * a1
+    a2p = (1.0 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360.0
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360.0
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+
+    chroma_zero = (C1p * C2p) == 0
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180.0, dhp - 360.0, dhp)
+    dhp = np.where(dhp < -180.0, dhp + 360.0, dhp)
+    dhp = np.where(chroma_zero, 0.0, dhp)
+    dHp = 2.0 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp) / 2.0)
+
+    Lp_bar = (L1 + L2) / 2.0
+    Cp_bar = (C1p + C2p) / 2.0
+
+    h_sum = h1p + h2p
+    hp_bar = np.where(np.abs(h1p - h2p) <= 180.0, h_sum / 2.0,
+                      np.where(h_sum < 360.0, (h_sum + 360.0) / 2.0, (h_sum - 360.0) / 2.0))
+    hp_bar = np.where(chroma_zero, h_sum, hp_bar)
+
+    T = (1.0
+         - 0.17 * np.cos(np.radians(hp_bar - 30.0))
+         + 0.24 * np.cos(np.radians(2.0 * hp_bar))
+         + 0.32 * np.cos(np.radians(3.0 * hp_bar + 6.0))
+         - 0.20 * np.cos(np.radians(4.0 * hp_bar - 63.0)))
+    d_theta = 30.0 * np.exp(-(((hp_bar - 275.0) / 25.0) ** 2))
+    Cp_bar7 = Cp_bar ** 7
+    R_C = 2.0 * np.sqrt(Cp_bar7 / (Cp_bar7 + 25.0 ** 7))
+    L50 = (Lp_bar - 50.0) ** 2
+    S_L = 1.0 + 0.015 * L50 / np.sqrt(20.0 + L50)
+    S_C = 1.0 + 0.045 * Cp_bar
+    S_H = 1.0 + 0.015 * Cp_bar * T
+    R_T = -np.sin(np.radians(2.0 * d_theta)) * R_C
+
+    tL = dLp / S_L
+    tC = dCp / S_C
+    tH = dHp / S_H
+    return np.sqrt(tL ** 2 + tC ** 2 + tH ** 2 + R_T * tC * tH).astype(np.float32)
+
+def delta_e(lab: np.ndarray, lab_ref: np.ndarray, metric: str = "euclid") -> np.ndarray:
+    """Wählt das passende Abstandsmaß."""
+    if metric == "ciede2000":
+        return delta_e_ciede2000(lab, lab_ref)
+    return delta_e_76(lab, lab_ref)
+
+# ----------------------------------------------------------
+# Zuordnung Farbe -> Farbpaar
+# ----------------------------------------------------------
+def prepare_pairs(pairs_hex, metric="euclid"):
+    """
+    Bereitet die Farbpaare vor.
+
+    :return: (src_labs, palette) – Lab-Werte der Quellfarben und eine Palette,
+             in der Index k (ab 1) die BGR-Zielfarbe des k-ten Paares enthält.
+    """
+    if len(pairs_hex) >= _REFINE:
+        raise ValueError(f"Zu viele Farbpaare ({len(pairs_hex)}), maximal {_REFINE - 1} werden unterstützt.")
+    src_bgr = np.array([hex_to_bgr(src) for src, _ in pairs_hex], dtype=np.uint8).reshape(-1, 3)
+    src_labs = bgr_to_lab(src_bgr, metric) if len(pairs_hex) else np.zeros((0, 3), np.float32)
+    palette = np.zeros((len(pairs_hex) + 1, 3), dtype=np.uint8)
+    for k, (_, dst) in enumerate(pairs_hex, start=1):
+        palette[k] = hex_to_bgr(dst)
+    return src_labs, palette
+
+def classify_colors(bgr: np.ndarray, src_labs: np.ndarray, delta_e_max: float,
+                    metric: str = "euclid") -> np.ndarray:
+    """
+    Ordnet jeder Farbe einer (N, 3)-BGR-Liste das zutreffende Farbpaar zu.
+
+    Wie bei der bisherigen Schleife gewinnt bei mehreren Treffern das letzte Paar,
+    da spätere Paare frühere Ersetzungen überschreiben.
+
+    :return: uint8-Array mit 0 (keine Ersetzung) oder dem Paarindex k (ab 1).
+    """
+    lab = bgr_to_lab(bgr, metric)
+    result = np.zeros(len(lab), dtype=np.uint8)
+    for k, src_lab in enumerate(src_labs, start=1):
+        result[delta_e(lab, src_lab, metric) <= delta_e_max] = k
+    return result
+
+# ----------------------------------------------------------
+# Aufbau der Tabelle
+# ----------------------------------------------------------
+def build_lut(pairs_hex, delta_e_max, metric="euclid", bits=6):
+    """
+    Baut die zweistufige Tabelle für die gegebene Konfiguration.
+
+    Es werden alle 256³ Farben exakt klassifiziert (ebenenweise, damit der
+    Speicherbedarf klein bleibt) und anschließend zu Zellen mit 2^(8-bits)
+    Farben pro Kanal zusammengefasst.
+
+    :return: dict mit "coarse", "refine_index", "fine", "palette", "bits"
+    """
+    if metric not in SUPPORTED_METRICS:
+        raise ValueError(f"Unbekanntes Abstandsmaß '{metric}' (erlaubt: {', '.join(SUPPORTED_METRICS)})")
+    if not 1 <= bits <= 8:
+        raise ValueError(f"lut_bits muss zwischen 1 und 8 liegen (erhalten: {bits})")
+
+    src_labs, palette = prepare_pairs(pairs_hex, metric)
+
+    # Exakte Klassifikation aller Farben, Index [b, g, r]
+    full = np.zeros((256, 256, 256), dtype=np.uint8)
+    g_plane, r_plane = np.meshgrid(np.arange(256, dtype=np.uint8),
+                                   np.arange(256, dtype=np.uint8), indexing="ij")
+    plane = np.empty((256 * 256, 3), dtype=np.uint8)
+    plane[:, 1] = g_plane.ravel()
+    plane[:, 2] = r_plane.ravel()
+    for b in range(256):
+        plane[:, 0] = b
+        full[b] = classify_colors(plane, src_labs, delta_e_max, metric).reshape(256, 256)
+
+    # In Zellen zerlegen: (cb, sb, cg, sg, cr, sr) -> (Zelle, Unterindex)
+    cells = 1 << bits
+    sub = 1 << (8 - bits)
+    blocks = full.reshape(cells, sub, cells, sub, cells, sub)
+    blocks = blocks.transpose(0, 2, 4, 1, 3, 5).reshape(cells ** 3, sub ** 3)
+    del full
+
+    lo = blocks.min(axis=1)
+    hi = blocks.max(axis=1)
+    uniform = lo == hi
+
+    coarse = np.where(uniform, lo, _REFINE).astype(np.uint8)
+    mixed_cells = np.flatnonzero(~uniform)
+    refine_index = np.full(cells ** 3, -1, dtype=np.int32)
+    refine_index[mixed_cells] = np.arange(len(mixed_cells), dtype=np.int32)
+    fine = np.ascontiguousarray(blocks[mixed_cells])
+
+    return {
+        "coarse": coarse,
+        "refine_index": refine_index,
+        "fine": fine,
+        "palette": palette,
+        "bits": bits,
+    }
+
+def lut_config_hash(pairs_hex, delta_e_max, metric="euclid", bits=6):
+    """Stabiler Hash der Konfiguration – Schlüssel für den Festplatten-Cache."""
+    normalized = {
+        "version": LUT_VERSION,
+        "pairs": [[src.strip().lower().lstrip("#"), dst.strip().lower().lstrip("#")] for src, dst in pairs_hex],
+        "tolerance": float(delta_e_max),
+        "metric": metric,
+        "bits": int(bits),
+    }
+    payload = json.dumps(normalized, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:24]
+
+def load_or_build_lut(pairs_hex, delta_e_max, metric="euclid", bits=6, use_cache=True):
+    """
+    Liefert die Tabelle für die Konfiguration – aus dem Cache, falls vorhanden,
+    sonst wird sie berechnet und (bei use_cache) gespeichert.
+    """
+    config_hash = lut_config_hash(pairs_hex, delta_e_max, metric, bits)
+    cache_path = os.path.join(get_cache_dir("colorlut"), f"{config_hash}.npz") if use_cache else None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                lut = {key: data[key] for key in ("coarse", "refine_index", "fine", "palette")}
+                lut["bits"] = int(data["bits"])
+            log_message(f"Farb-LUT aus Cache geladen: {shorten_path(cache_path)}", level="info")
+            return lut
+        except Exception as e:
+            log_message(f"Farb-LUT im Cache unlesbar, wird neu berechnet: {e}", level="warning")
+
+    log_message(f"Berechne Farb-LUT ({metric}, {1 << bits}³ Zellen, {len(pairs_hex)} Farbpaare)...", level="info")
+    lut = build_lut(pairs_hex, delta_e_max, metric, bits)
+    log_message(f"Farb-LUT fertig: {len(lut['fine'])} Grenzzellen mit Feinauflösung", level="info")
+
+    if cache_path:
+        try:
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez_compressed(tmp_path, **lut)
+            os.replace(tmp_path, cache_path)
+            log_message(f"Farb-LUT gespeichert: {shorten_path(cache_path)}", level="info")
+        except Exception as e:
+            log_message(f"Farb-LUT konnte nicht gespeichert werden: {e}", level="warning")
+    return lut
+
+# ----------------------------------------------------------
+# Anwendung auf ein Bild
+# ----------------------------------------------------------
+def lookup(lut, bgr: np.ndarray) -> np.ndarray:
+    """
+    Liefert für jedes Pixel eines (..., 3)-BGR-Arrays den Paarindex (0 = keine Ersetzung).
+    """
+    bits = lut["bits"]
+    shift = 8 - bits
+    sub_mask = (1 << shift) - 1
+
+    b = bgr[..., 0].astype(np.int32)
+    g = bgr[..., 1].astype(np.int32)
+    r = bgr[..., 2].astype(np.int32)
+    cell = ((b >> shift) << (2 * bits)) | ((g >> shift) << bits) | (r >> shift)
+    idx = lut["coarse"][cell]
+
+    refine = idx == _REFINE
+    if refine.any():
+        offset = (((b[refine] & sub_mask) << (2 * shift))
+                  | ((g[refine] & sub_mask) << shift)
+                  | (r[refine] & sub_mask))
+        idx[refine] = lut["fine"][lut["refine_index"][cell[refine]], offset]
+    return idx
+
+def apply_lut(lut, bgr: np.ndarray) -> int:
+    """
+    Ersetzt die Farben eines (..., 3)-BGR-Arrays in place (ein einziger Gather-Schritt
+    über die Palette für alle Farbpaare).
+
+    :return: Anzahl der ersetzten Pixel.
+    """
+    idx = lookup(lut, bgr)
+    changed = idx > 0
+    count = int(np.count_nonzero(changed))
+    if count:
+        bgr[changed] = lut["palette"][idx[changed]]
+    return count
+
+# ----------------------------------------------------------
+# Modus für palettenarme Bilder: nur eindeutige Farben bewerten
+# ----------------------------------------------------------
+def pack_bgr(bgr: np.ndarray) -> np.ndarray:
+    """Packt (..., 3)-BGR-Werte in 24-Bit-Ganzzahlen (uint32)."""
+    return ((bgr[..., 0].astype(np.uint32) << 16)
+            | (bgr[..., 1].astype(np.uint32) << 8)
+            | bgr[..., 2].astype(np.uint32))
+
+def unpack_bgr(packed: np.ndarray) -> np.ndarray:
+    """Kehrt pack_bgr um und liefert eine (N, 3)-BGR-Liste (uint8)."""
+    packed = packed.astype(np.uint32, copy=False)
+    return np.stack([(packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF], axis=-1).astype(np.uint8)
+
+def estimate_color_count(bgr: np.ndarray, max_samples: int = 65536) -> int:
+    """
+    Schätzt die Anzahl unterschiedlicher Farben anhand eines regelmäßigen
+    Stichprobengitters (höchstens max_samples Pixel). Die Schätzung ist eine
+    untere Schranke und dient nur zur Wahl des Verfahrens.
+    """
+    h, w = bgr.shape[:2]
+    step = max(1, int(np.ceil(np.sqrt((h * w) / max_samples))))
+    return int(len(np.unique(pack_bgr(bgr[::step, ::step]))))
+
+def map_unique_colors(bgr: np.ndarray, src_labs: np.ndarray, palette: np.ndarray,
+                      delta_e_max: float, metric: str = "euclid") -> int:
+    """
+    Ersetzt Farben in place, indem ΔE nur für die eindeutigen Farben des Bildes
+    berechnet und das Ergebnis über den inversen Index zurückverteilt wird.
+
+    :return: Anzahl der ersetzten Pixel (0, wenn keine Farbe getroffen wurde –
+             das Bild wird dann nicht angefasst).
+    """
+    colors, inverse = np.unique(pack_bgr(bgr).ravel(), return_inverse=True)
+    color_idx = classify_colors(unpack_bgr(colors), src_labs, delta_e_max, metric)
+    if not color_idx.any():
+        return 0
+    idx = color_idx[inverse.ravel()].reshape(bgr.shape[:2])
+    changed = idx > 0
+    count = int(np.count_nonzero(changed))
+    bgr[changed] = palette[idx[changed]]
+    return count
+
+# ----------------------------------------------------------
+# Gemeinsamer Einstieg: Verfahren je Bild wählen
+# ----------------------------------------------------------
+SWAP_ENGINES = ("auto", "lut", "unique")
+
+def make_swap_setup(pairs_hex, delta_e_max, metric="euclid", bits=6, use_cache=True,
+                    engine="auto", unique_max_colors=4096):
+    """
+    Bündelt die Swap-Konfiguration. Die Farb-LUT wird erst beim ersten Bild
+    aufgebaut, das sie tatsächlich benötigt – bestehen alle Bilder nur aus
+    wenigen Farben, entfällt der Aufbau ganz.
+    """
+    if engine not in SWAP_ENGINES:
+        raise ValueError(f"Unbekanntes Verfahren '{engine}' (erlaubt: {', '.join(SWAP_ENGINES)})")
+    src_labs, palette = prepare_pairs(pairs_hex, metric)
+    return {
+        "pairs": list(pairs_hex),
+        "tolerance": float(delta_e_max),
+        "metric": metric,
+        "bits": bits,
+        "use_cache": use_cache,
+        "engine": engine,
+        "unique_max_colors": unique_max_colors,
+        "src_labs": src_labs,
+        "palette": palette,
+        "lut": None,
+    }
+
+def get_lut(setup):
+    """Liefert die (einmalig aufgebaute) Farb-LUT zur Swap-Konfiguration."""
+    if setup["lut"] is None:
+        setup["lut"] = load_or_build_lut(setup["pairs"], setup["tolerance"], setup["metric"],
+                                         setup["bits"], setup["use_cache"])
+    return setup["lut"]
+
+def swap_colors(setup, bgr: np.ndarray):
+    """
+    Ersetzt die Farben eines (..., 3)-BGR-Arrays in place.
+
+    Bei "auto" wird die Farbanzahl per Stichprobe geschätzt: palettenarme Bilder
+    werden über ihre eindeutigen Farben bewertet, alle anderen über die LUT.
+
+    :return: (Anzahl ersetzter Pixel, verwendetes Verfahren)
+    """
+    if not setup["pairs"]:
+        return 0, "none"
+    engine = setup["engine"]
+    if engine == "auto":
+        low_cardinality = estimate_color_count(bgr) <= setup["unique_max_colors"]
+        engine = "unique" if low_cardinality else "lut"
+    if engine == "unique":
+        count = map_unique_colors(bgr, setup["src_labs"], setup["palette"],
+                                  setup["tolerance"], setup["metric"])
+    else:
+        count = apply_lut(get_lut(setup), bgr)
+    return count, engine
+
+def load_swap_setup(cfg):
+    """
+    Liest den [swap]-Abschnitt der settings.ini und liefert die Swap-Konfiguration
+    (siehe make_swap_setup). Ungültige Werte werden protokolliert und durch
+    Standardwerte ersetzt.
+    """
+    swap_cfg = cfg["swap"] if "swap" in cfg else {}
+
+    # Farbpaar-Liste aus INI
+    pairs_hex = []
+    idx = 1
+    while f"src_color_{idx}" in swap_cfg:
+        src_hex = swap_cfg[f"src_color_{idx}"]
+        dst_hex = swap_cfg[f"dst_color_{idx}"]
+        pairs_hex.append((src_hex, dst_hex))
+        idx += 1
+
+    def get_number(key, default, cast):
+        if key not in swap_cfg:
+            return default
+        try:
+            return cast(swap_cfg[key])
+        except (ValueError, TypeError):
+            log_message(f"Ungültiger Wert für '{key}' in settings.ini - verwende Standard ({default})", level="warning")
+            return default
+
+    tol = get_number("tolerance", 5.0, float)
+    # Auflösung der Grobtabelle (Bits pro Kanal, 6 = 64³ Zellen)
+    lut_bits = get_number("lut_bits", 6, int)
+    unique_max_colors = get_number("unique_max_colors", 4096, int)
+
+    # Abstandsmaß: "euclid" (ΔE76, bisheriges Verhalten) oder "ciede2000"
+    metric = swap_cfg.get("metric", "euclid").strip().lower()
+    if metric not in SUPPORTED_METRICS:
+        log_message(f"Unbekanntes Abstandsmaß '{metric}' in settings.ini - verwende 'euclid'", level="warning")
+        metric = "euclid"
+
+    # Verfahren: auto (je Bild), lut oder unique (nur eindeutige Farben bewerten)
+    engine = swap_cfg.get("engine", "auto").strip().lower()
+    if engine not in SWAP_ENGINES:
+        log_message(f"Unbekanntes Verfahren '{engine}' in settings.ini - verwende 'auto'", level="warning")
+        engine = "auto"
+
+    use_cache = swap_cfg.get("lut_cache", "on").strip().lower() in ["true", "1", "yes", "on"]
+
+    # Die Farb-LUT wird erst beim ersten Bild aufgebaut, das sie benötigt
+    return make_swap_setup(pairs_hex, tol, metric=metric, bits=lut_bits, use_cache=use_cache,
+                           engine=engine, unique_max_colors=unique_max_colors)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+derived.py – Zwischenspeicher für abgeleitete Bilddarstellungen.
+
+Dieselben Ableitungen (Graustufen, Lab, binäre Alphamaske, Canny-Kanten, Objektmaske
+von TransBack) werden immer wieder berechnet – besonders, weil die Collation-Ordner
+Kopien derselben Bilder enthalten und Stufen wie TransBack, Extract und CleanUp jede
+Kopie einzeln bearbeiten.
+
+Einträge sind über (Inhaltsschlüssel, Ableitung, Parameter) adressiert:
+  - Inhaltsschlüssel (content_key): SHA-256 aus einem aktuellen Katalogeintrag –
+    identische Kopien in verschiedenen Ordnern teilen sich damit alle Ableitungen.
+    Nicht katalogisierte Dateien werden nicht gehasht, sondern über Gerät, Inode,
+    Größe und Änderungszeit erkannt. Eine veränderte Datei bekommt in beiden
+    Fällen automatisch einen neuen Schlüssel
+  - Parameter: z. B. die Canny-Schwellen bei "edges"
+
+Die Größe ist über ein Byte-Budget begrenzt (LRU). Gelieferte Arrays sind
+schreibgeschützt; wer sie verändern will, muss sie kopieren.
+
+Der Speicher lebt im Prozess einer Stufe. Damit auch die Stufen untereinander
+(eigene Prozesse) Ableitungen teilen, legt load_derived_cache Arrays mit einem
+Katalog-Schlüssel zusätzlich in {Datumsordner}/_derived ab (.npy, begrenzt über
+derived_shared_mb); eine spätere Stufe lädt sie dort, statt neu zu rechnen.
+
+    cache = load_derived_cache(config, date_folder)
+    key = content_key(path, catalog, date_folder)
+    gray = get_gray(cache, key, img)
+    edges = get_edges(cache, key, img, 32, 155)
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from catalog import lookup
+
+DERIVATIONS = ("gray", "lab", "alpha_mask", "edges")
+SHARED_FOLDER = "_derived"
+
+# ----------------------------------------------------------
+# Schlüssel
+# ----------------------------------------------------------
+def content_key(path, catalog=None, date_folder=None):
+    """
+    Inhaltsschlüssel einer Bilddatei: SHA-256 aus dem Katalog, sofern der Eintrag
+    noch aktuell ist; sonst (ohne zu hashen) Gerät, Inode, Größe und Änderungszeit.
+    """
+    if catalog is not None:
+        try:
+            entry = lookup(catalog, date_folder, path)
+            if entry and entry.get("sha256"):
+                return entry["sha256"]
+        except Exception:
+            pass
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+# ----------------------------------------------------------
+# Speicher
+# ----------------------------------------------------------
+def create_derived_cache(limit_bytes, shared_dir=None, shared_limit_bytes=0):
+    """
+    Neuer Zwischenspeicher (dict) mit Byte-Budget. Mit shared_dir und
+    shared_limit_bytes > 0 werden Arrays mit Katalog-Schlüssel zusätzlich dort
+    abgelegt bzw. von dort geladen (stufenübergreifend).
+    """
+    shared = shared_dir if shared_dir and shared_limit_bytes > 0 else None
+    shared_bytes = 0
+    if shared:
+        os.makedirs(shared, exist_ok=True)
+        shared_bytes = sum(entry.stat().st_size for entry in os.scandir(shared) if entry.is_file())
+    return {
+        "limit": int(limit_bytes),
+        "entries": OrderedDict(),
+        "bytes": 0,
+        "shared_dir": shared,
+        "shared_limit": int(shared_limit_bytes),
+        "shared_bytes": shared_bytes,
+        "stats": {"hits": 0, "misses": 0, "evictions": 0, "shared_hits": 0, "shared_writes": 0},
+        "lock": threading.Lock(),
+    }
+
+def load_derived_cache(cfg, date_folder=None):
+    """
+    Zwischenspeicher nach [Settings] derived_cache_mb (Arbeitsspeicher) und
+    derived_shared_mb (stufenübergreifend in {Datumsordner}/_derived, 0 = aus).
+    """
+    limit_mb = cfg.getint("Settings", "derived_cache_mb", fallback=512) if cfg is not None else 512
+    shared_mb = cfg.getint("Settings", "derived_shared_mb", fallback=1024) if cfg is not None else 0
+    shared_dir = os.path.join(date_folder, SHARED_FOLDER) if date_folder else None
+    return create_derived_cache(limit_mb * 1024 * 1024, shared_dir, max(0, shared_mb) * 1024 * 1024)
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    return value
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 64
+
+def _shared_path(cache, key, name, params):
+    """Datei der Ableitung im gemeinsamen Ordner; nur für Katalog-Schlüssel (SHA-256)."""
+    if cache["shared_dir"] is None or not isinstance(key, str):
+        return None
+    params_hash = hashlib.sha256(repr(tuple(params)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache["shared_dir"], f"{key}_{name}_{params_hash}.npy")
+
+def _load_shared(cache, path):
+    try:
+        value = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    with cache["lock"]:
+        cache["stats"]["shared_hits"] += 1
+    return value
+
+def _store_shared(cache, path, value):
+    if not isinstance(value, np.ndarray):
+        return
+    with cache["lock"]:
+        if cache["shared_bytes"] + value.nbytes > cache["shared_limit"]:
+            return
+        cache["shared_bytes"] += value.nbytes
+        cache["stats"]["shared_writes"] += 1
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, value, allow_pickle=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def derive(cache, key, name, params, compute):
+    """
+    Liefert die Ableitung name mit params für den Inhalt key; compute() wird nur
+    beim ersten Zugriff aufgerufen (bzw. gar nicht, wenn eine andere Stufe die
+    Ableitung im gemeinsamen Ordner abgelegt hat). Ohne Cache (None) wird immer
+    berechnet.
+    """
+    if cache is None or key is None:
+        return compute()
+    entry_key = (key, name, tuple(params))
+    with cache["lock"]:
+        value = cache["entries"].get(entry_key)
+        if value is not None:
+            cache["entries"].move_to_end(entry_key)
+            cache["stats"]["hits"] += 1
+            return value
+        cache["stats"]["misses"] += 1
+
+    shared_path = _shared_path(cache, key, name, params)
+    value = _load_shared(cache, shared_path) if shared_path and os.path.exists(shared_path) else None
+    if value is None:
+        value = compute()
+        if shared_path:
+            _store_shared(cache, shared_path, value)
+    value = _freeze(value)
+    size = _nbytes(value)
+    if size > cache["limit"]:
+        return value
+    with cache["lock"]:
+        if entry_key not in cache["entries"]:
+            cache["entries"][entry_key] = value
+            cache["bytes"] += size
+        while cache["bytes"] > cache["limit"]:
+            _, evicted = cache["entries"].popitem(last=False)
+            cache["bytes"] -= _nbytes(evicted)
+            cache["stats"]["evictions"] += 1
+    return value
+
+def cache_stats(cache):
+    """Treffer, Fehlzugriffe, Verdrängungen und belegte Bytes."""
+    return dict(cache["stats"], bytes=cache["bytes"], entries=len(cache["entries"]),
+                shared_bytes=cache["shared_bytes"])
+
+# ----------------------------------------------------------
+# Ableitungen (Eingabe: BGR-, BGRA- oder Graustufenbild, uint8)
+# ----------------------------------------------------------
+def _to_gray(img):
+    if img.ndim == 2:
+        return img
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def get_gray(cache, key, img):
+    """Graustufenbild (wie cv2.cvtColor ...2GRAY)."""
+    return derive(cache, key, "gray", (), lambda: _to_gray(img))
+
+def get_lab(cache, key, img):
+    """8-Bit-Lab (OpenCV-Skalierung) der Farbkanäle."""
+    return derive(cache, key, "lab", (), lambda: cv2.cvtColor(img[:, :, :3], cv2.COLOR_BGR2LAB))
+
+def get_alpha_mask(cache, key, img, threshold=1):
+    """Binäre Alphamaske: 255 bei Alpha > threshold, sonst 0 (ohne Alphakanal: alles 255)."""
+    def compute():
+        if img.ndim != 3 or img.shape[2] != 4:
+            return np.full(img.shape[:2], 255, dtype=np.uint8)
+        return cv2.threshold(img[:, :, 3], threshold, 255, cv2.THRESH_BINARY)[1]
+    return derive(cache, key, "alpha_mask", (threshold,), compute)
+
+def get_edges(cache, key, img, threshold1, threshold2):
+    """Canny-Kanten des Graustufenbildes (nutzt die gespeicherte Graustufe)."""
+    return derive(cache, key, "edges", (threshold1, threshold2),
+                  lambda: cv2.Canny(get_gray(cache, key, img), threshold1, threshold2))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+imgio.py – einheitliches Lesen, Kodieren und Speicherlayout der Bilder.
+
+Bisher bringt jede Stufe ihre Bilder selbst in Form (cv2.merge für den
+Alphakanal, 16 Bit → 8 Bit, PIL "LA" für Graustufen mit Alpha, RGB ↔ BGR beim
+Wechsel zu PIL). Dieses Modul ist die einzige Stelle, die dekodiert und kodiert,
+und liefert zusammenhängende uint8-Arrays in einem festen Layout:
+
+  "bgra"        (H, W, 4) BGRA – kanonisches Layout der Farbstufen
+  "gray_alpha"  (H, W, 2) Grau + Alpha – Graustufen-Ausschnitte und -Atlanten
+  "gray"        (H, W) Grau ohne Alpha – Graustufenbilder ohne Transparenz (ingest)
+  "color"       BGR bzw. BGRA wie in der Datei (Graustufen als BGR) – für Stufen,
+                die ein Bild im ursprünglichen Layout zurückschreiben
+
+Bereits passende Arrays werden ohne Kopie übernommen (to_layout). Kanäle gibt es
+als Sichten statt als Kopien (color_view, alpha_view). Zu PIL: from_pil liest den
+Puffer über np.asarray ohne Kopie, to_pil teilt den Speicher per Image.frombuffer,
+wo PIL das Layout direkt abbilden kann (Grau, RGBA); BGR(A) ↔ RGB(A) und Grau + Alpha
+brauchen genau eine Kopie.
+"""
+import io
+import numpy as np
+import cv2
+from PIL import Image
+
+LAYOUTS = ("bgra", "gray_alpha", "gray", "color")
+
+# ----------------------------------------------------------
+# Layout
+# ----------------------------------------------------------
+def to_uint8(img):
+    """16-Bit-Bilder auf 8 Bit (obere Bits), andere unverändert."""
+    if img.dtype == np.uint16:
+        return (img >> 8).astype(np.uint8)
+    if img.dtype != np.uint8:
+        return np.clip(img, 0, 255).astype(np.uint8)
+    return img
+
+def to_layout(img, layout="bgra"):
+    """
+    Bringt ein Array aus cv2 (Grau, BGR, BGRA) oder ein Grau-Alpha-Array in das
+    gewünschte Layout. Passt es bereits, wird es ohne Kopie zurückgegeben.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unbekanntes Layout: {layout}")
+    img = to_uint8(img)
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if layout == "bgra":
+        if channels == 4:
+            result = img
+        elif channels == 3:
+            result = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+        elif channels == 2:
+            result = np.dstack([cv2.cvtColor(img[:, :, 0], cv2.COLOR_GRAY2BGR), img[:, :, 1]])
+        else:
+            result = cv2.cvtColor(img.reshape(img.shape[:2]), cv2.COLOR_GRAY2BGRA)
+    elif layout == "gray_alpha":
+        if channels == 2:
+            result = img
+        elif channels == 4:
+            result = np.dstack([cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY), img[:, :, 3]])
+        else:
+            gray = img.reshape(img.shape[:2]) if channels == 1 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            result = np.dstack([gray, np.full(gray.shape, 255, np.uint8)])
+    elif layout == "gray":
+        if channels == 1:
+            result = img.reshape(img.shape[:2])
+        elif channels == 2:
+            result = img[:, :, 0]
+        else:
+            result = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if channels == 4 else cv2.COLOR_BGR2GRAY)
+    else:
+        if channels in (3, 4):
+            result = img
+        elif channels == 2:
+            result = to_layout(img, "bgra")
+        else:
+            result = cv2.cvtColor(img.reshape(img.shape[:2]), cv2.COLOR_GRAY2BGR)
+    return np.ascontiguousarray(result)
+
+def color_view(img):
+    """Farbkanäle eines BGR(A)-Bildes als Sicht (ohne Kopie)."""
+    return img[:, :, :3]
+
+def alpha_view(img):
+    """Alphakanal eines BGRA- bzw. Grau-Alpha-Bildes als Sicht, None ohne Alpha."""
+    if img.ndim == 3 and img.shape[2] in (2, 4):
+        return img[:, :, -1]
+    return None
+
+def has_alpha(img):
+    return alpha_view(img) is not None
+
+# ----------------------------------------------------------
+# Dekodieren
+# ----------------------------------------------------------
+def decode(data, layout="bgra"):
+    """Dekodiert Bilddaten (bytes oder uint8-Array) in das gewünschte Layout; None bei Fehlern."""
+    buffer = np.frombuffer(data, np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    img = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return to_layout(img, layout)
+
+def read(path, layout="bgra"):
+    """Liest ein Bild in das gewünschte Layout; None bei Fehlern."""
+    img = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return to_layout(img, layout)
+
+# ----------------------------------------------------------
+# Kodieren
+# ----------------------------------------------------------
+def encode(img, ext, params=None):
+    """
+    Kodiert ein Bild für die Dateiendung ext. Grau + Alpha (2 Kanäle) kann OpenCV
+    nicht schreiben – solche Bilder gehen über PIL ("LA").
+
+    :param params: cv2.imwrite-Parameter (PNG-Kompression wird auch für PIL übernommen)
+    :return: bytes oder None bei Fehlern
+    """
+    params = list(params or [])
+    if img.ndim == 3 and img.shape[2] == 2:
+        options = {}
+        if cv2.IMWRITE_PNG_COMPRESSION in params[::2]:
+            options["compress_level"] = params[params.index(cv2.IMWRITE_PNG_COMPRESSION) + 1]
+        buffer = io.BytesIO()
+        to_pil(img).save(buffer, Image.registered_extensions()[ext.lower()], **options)
+        return buffer.getvalue()
+    ok, encoded = cv2.imencode(ext, img, params)
+    return encoded.tobytes() if ok else None
+
+# ----------------------------------------------------------
+# PIL
+# ----------------------------------------------------------
+def to_pil(img):
+    """
+    PIL-Bild aus einem Array. Grau teilt den Speicher des Arrays (Image.frombuffer),
+    BGR(A) wird einmal nach RGB(A) umgeordnet, Grau + Alpha einmal kopiert.
+    """
+    img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    if img.ndim == 2:
+        return Image.frombuffer("L", (w, h), img, "raw", "L", 0, 1)
+    if img.shape[2] == 2:
+        return Image.fromarray(img, "LA")
+    if img.shape[2] == 4:
+        return Image.frombuffer("RGBA", (w, h), cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA), "raw", "RGBA", 0, 1)
+    return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), "RGB")
+
+def from_pil(image, layout="bgra"):
+    """
+    Array im gewünschten Layout aus einem PIL-Bild (Puffer per np.asarray, ohne Kopie;
+    ist keine Umwandlung nötig, ist das Ergebnis nur lesbar).
+    """
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        has_transparency = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_transparency else "RGB")
+    arr = np.asarray(image)
+    if image.mode == "RGB":
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    elif image.mode == "RGBA":
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+    return to_layout(arr, layout)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+iopipeline.py – Vorauslesen und nachgelagertes Schreiben um die Rechenstufe.
+
+Eine Stufe liest, rechnet und schreibt Bild für Bild; während cv2.imread bzw.
+cv2.imwrite auf die Platte (oder das Netzlaufwerk) warten, steht die CPU still.
+run_pipeline() trennt die drei Schritte:
+
+  Lese-Pool    dekodiert die nächsten Bilder vorab in eine begrenzte Warteschlange
+               (read_ahead Bilder); belegen sie mehr als read_ahead_mb, werden die
+               überzähligen auf die Platte ausgelagert (membudget.create_spill_cache)
+  Rechnen      läuft im aufrufenden Thread, Bild für Bild in Eingabereihenfolge
+  Schreib-Pool kodiert und speichert Ergebnisse im Hintergrund; die Warteschlange
+               fasst write_behind Ergebnisse, danach wartet das Rechnen
+
+Rückmeldungen der Schreiber (finish) werden ebenfalls im aufrufenden Thread
+ausgeführt – Katalog und Laufbericht (SQLite, Zähler) bleiben so einem Thread
+vorbehalten.
+
+Kennzahlen: mittlere und maximale Belegung beider Warteschlangen, die Zeit, die das
+Rechnen auf Lesen bzw. Schreiben gewartet hat, und ausgelagerte Bilder (pipeline_metrics).
+Einstellungen: settings.ini, Abschnitt [IO].
+"""
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from logger import log_message
+from membudget import load_budget_bytes, create_spill_cache, cache_put, cache_pop, cache_clear, sweep_spill_dirs
+
+_DONE = object()
+# Anteil des Speicherbudgets für vorausgelesene Bilder bei read_ahead_mb = 0
+_READ_AHEAD_SHARE = 0.25
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_io_options(cfg):
+    """
+    Liest [IO] aus der settings.ini. read_ahead_mb = 0 begrenzt die vorausgelesenen
+    Bilder auf ein Viertel des Speicherbudgets ([Settings] memory_budget_mb).
+    """
+    options = {"enabled": True, "read_ahead": 4, "write_behind": 4, "read_workers": 2, "write_workers": 2}
+    read_ahead_mb = 0
+    if cfg is not None and cfg.has_section("IO"):
+        options["enabled"] = cfg.getboolean("IO", "enabled", fallback=True)
+        for key in ("read_ahead", "write_behind", "read_workers", "write_workers"):
+            options[key] = max(1, cfg.getint("IO", key, fallback=options[key]))
+        read_ahead_mb = max(0, cfg.getint("IO", "read_ahead_mb", fallback=0))
+    options["read_ahead_bytes"] = (read_ahead_mb * 1024 * 1024 if read_ahead_mb
+                                   else int(load_budget_bytes(cfg) * _READ_AHEAD_SHARE))
+    return options
+
+# ----------------------------------------------------------
+# Kennzahlen
+# ----------------------------------------------------------
+def _create_metrics(options):
+    return {
+        "read_ahead": options["read_ahead"], "write_behind": options["write_behind"],
+        "read_samples": 0, "read_occupancy_sum": 0, "read_occupancy_max": 0,
+        "write_samples": 0, "write_occupancy_sum": 0, "write_occupancy_max": 0,
+        "read_wait": 0.0, "write_wait": 0.0, "items": 0, "spilled": 0, "started": time.time(),
+    }
+
+def _sample(metrics, name, size):
+    metrics[f"{name}_samples"] += 1
+    metrics[f"{name}_occupancy_sum"] += size
+    metrics[f"{name}_occupancy_max"] = max(metrics[f"{name}_occupancy_max"], size)
+
+def pipeline_metrics(metrics):
+    """Verdichtete Kennzahlen (für Laufbericht und Log)."""
+    def mean(name):
+        samples = metrics[f"{name}_samples"]
+        return round(metrics[f"{name}_occupancy_sum"] / samples, 2) if samples else 0.0
+    return {
+        "items": metrics["items"],
+        "read_ahead": metrics["read_ahead"],
+        "write_behind": metrics["write_behind"],
+        "read_queue_mean": mean("read"),
+        "read_queue_max": metrics["read_occupancy_max"],
+        "write_queue_mean": mean("write"),
+        "write_queue_max": metrics["write_occupancy_max"],
+        "read_wait_s": round(metrics["read_wait"], 3),
+        "write_wait_s": round(metrics["write_wait"], 3),
+        "spilled": metrics["spilled"],
+        "seconds": round(time.time() - metrics["started"], 3),
+    }
+
+# ----------------------------------------------------------
+# Pipeline
+# ----------------------------------------------------------
+def run_pipeline(items, load, compute, save, finish=None, options=None):
+    """
+    Verarbeitet items mit vorausgelesenen Eingaben und im Hintergrund geschriebenen
+    Ergebnissen.
+
+    :param load:    load(item) -> Daten (Lese-Pool; Ausnahmen werden an compute gereicht)
+    :param compute: compute(item, daten, fehler) -> Ergebnis oder None (nichts zu schreiben);
+                    läuft im aufrufenden Thread, fehler ist die Ausnahme aus load oder None
+    :param save:    save(item, ergebnis) -> Rückgabewert (Schreib-Pool)
+    :param finish:  finish(item, rückgabewert, fehler) – im aufrufenden Thread, sobald das
+                    Ergebnis geschrieben ist
+    :param options: dict aus load_io_options; enabled=False verarbeitet seriell
+    :return: Kennzahlen (pipeline_metrics)
+    """
+    options = options or load_io_options(None)
+    metrics = _create_metrics(options)
+    finish = finish or (lambda item, value, error: None)
+
+    if not options["enabled"]:
+        for item in items:
+            try:
+                data, error = load(item), None
+            except Exception as e:
+                data, error = None, e
+            result = compute(item, data, error)
+            metrics["items"] += 1
+            if result is None:
+                continue
+            try:
+                value, error = save(item, result), None
+            except Exception as e:
+                value, error = None, e
+            finish(item, value, error)
+        return pipeline_metrics(metrics)
+
+    read_queue = queue.Queue(maxsize=options["read_ahead"])
+    write_queue = queue.Queue(maxsize=options["write_behind"])
+    done_queue = queue.Queue()
+    stop = threading.Event()
+    # Vorausgelesene Bilder liegen im Zwischenspeicher; über read_ahead_bytes hinaus
+    # werden die ältesten auf die Platte ausgelagert und beim Abholen zurückgeladen
+    sweep_spill_dirs()
+    read_ahead_bytes = options.get("read_ahead_bytes") or load_io_options(None)["read_ahead_bytes"]
+    buffers = create_spill_cache(read_ahead_bytes, f"iopipeline_{threading.get_ident()}")
+
+    def stash(index, item):
+        data = load(item)
+        if isinstance(data, np.ndarray):
+            cache_put(buffers, index, data)
+            return True, None
+        return False, data
+
+    def take(index, stashed):
+        cached, data = stashed
+        if not cached:
+            return data
+        return cache_pop(buffers, index)
+
+    def feeder(readers):
+        # Aufträge in Eingabereihenfolge; die begrenzte Warteschlange bremst das Vorauslesen
+        try:
+            for index, item in enumerate(items):
+                if stop.is_set():
+                    break
+                read_queue.put((item, index, readers.submit(stash, index, item)))
+        finally:
+            read_queue.put(_DONE)
+
+    def writer():
+        while True:
+            job = write_queue.get()
+            if job is _DONE:
+                return
+            item, result = job
+            try:
+                done_queue.put((item, save(item, result), None))
+            except Exception as e:
+                done_queue.put((item, None, e))
+
+    def drain(block=False):
+        while True:
+            try:
+                item, value, error = done_queue.get(block=block)
+            except queue.Empty:
+                return
+            finish(item, value, error)
+            block = False
+
+    readers = ThreadPoolExecutor(max_workers=options["read_workers"])
+    writers = [threading.Thread(target=writer, daemon=True) for _ in range(options["write_workers"])]
+    for thread in writers:
+        thread.start()
+    feed = threading.Thread(target=feeder, args=(readers,), daemon=True)
+    feed.start()
+    try:
+        while True:
+            waited = time.perf_counter()
+            job = read_queue.get()
+            if job is _DONE:
+                break
+            item, index, future = job
+            try:
+                data, error = take(index, future.result()), None
+            except Exception as e:
+                data, error = None, e
+            metrics["read_wait"] += time.perf_counter() - waited
+            _sample(metrics, "read", read_queue.qsize())
+
+            result = compute(item, data, error)
+            metrics["items"] += 1
+            drain()
+            if result is None:
+                continue
+            waited = time.perf_counter()
+            write_queue.put((item, result))
+            metrics["write_wait"] += time.perf_counter() - waited
+            _sample(metrics, "write", write_queue.qsize())
+    except BaseException:
+        stop.set()
+        # Vorausgelesene Aufträge verwerfen, damit der Feeder nicht blockiert
+        while feed.is_alive():
+            try:
+                read_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise
+    finally:
+        for _ in writers:
+            write_queue.put(_DONE)
+        for thread in writers:
+            thread.join()
+        readers.shutdown(wait=True)
+        drain()
+        metrics["spilled"] = buffers["stats"]["spills"]
+        cache_clear(buffers)
+
+    summary = pipeline_metrics(metrics)
+    log_message(f"E/A-Pipeline: {summary['items']} Bilder, Lesewarteschlange Ø {summary['read_queue_mean']} "
+                f"(max {summary['read_queue_max']}/{summary['read_ahead']}), Schreibwarteschlange "
+                f"Ø {summary['write_queue_mean']} (max {summary['write_queue_max']}/{summary['write_behind']}), "
+                f"Wartezeit Lesen {summary['read_wait_s']} s, Schreiben {summary['write_wait_s']} s, "
+                f"ausgelagert {summary['spilled']}", level="info")
+    return summary
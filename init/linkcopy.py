@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+linkcopy.py – Dateien möglichst ohne Datenkopie im Dateisystem bereitstellen.
+
+Reihenfolge der Verfahren (place_file):
+  1. hardlink       – nur wenn ausdrücklich erlaubt: beide Namen zeigen auf dieselbe
+                      Datei, spätere In-place-Änderungen wirken sich auf beide aus
+  2. reflink        – Copy-on-Write-Klon (Linux, FICLONE; z. B. Btrfs, XFS)
+  3. copy_file_range / sendfile – Kopie im Kernel ohne Umweg über Python-Puffer,
+                      funktioniert auch über Gerätegrenzen
+  4. copy2          – normale Kopie (z. B. unter Windows)
+
+Zeitstempel und Rechte werden wie bei shutil.copy2 übernommen (außer bei hardlink).
+"""
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl FICLONE (linux/fs.h)
+_FICLONE = 0x40049409
+
+LINK_METHODS = ("hardlink", "reflink", "kernel", "copy")
+
+def reflink(src, dst):
+    """Copy-on-Write-Klon von src nach dst. Liefert True bei Erfolg."""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+def kernel_copy(src, dst):
+    """Kopie per copy_file_range bzw. sendfile. Liefert True bei Erfolg."""
+    copy_range = getattr(os, "copy_file_range", None)
+    sendfile = getattr(os, "sendfile", None)
+    if copy_range is None and sendfile is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+            while remaining > 0:
+                chunk = min(remaining, 1 << 30)
+                sent = 0
+                if copy_range is not None:
+                    try:
+                        sent = copy_range(in_fd, out_fd, chunk)
+                    except OSError:
+                        copy_range = None
+                        if sendfile is None:
+                            raise
+                if copy_range is None:
+                    sent = sendfile(out_fd, in_fd, None, chunk)
+                if sent == 0:
+                    break
+                remaining -= sent
+            if remaining > 0:
+                raise OSError("Kopie unvollständig")
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+def same_file(src, dst):
+    """
+    True, wenn dst bereits denselben Inhalt bereitstellt: dieselbe Datei (Hardlink)
+    oder eine frühere Kopie mit gleicher Größe und nanosekundengenau gleichem
+    Änderungszeitpunkt (copystat übernimmt st_mtime_ns). Ganze Sekunden reichen
+    nicht – eine in derselben Sekunde geänderte Quelle würde sonst übersehen.
+    """
+    try:
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    if (s.st_dev, s.st_ino) == (d.st_dev, d.st_ino):
+        return True
+    return s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns
+
+def place_file(src, dst, allow_hardlink=False, methods=None):
+    """
+    Stellt src unter dst bereit – mit dem ersten funktionierenden Verfahren.
+    Ist dst bereits aktuell (same_file), passiert nichts.
+
+    :param allow_hardlink: Hardlinks zulassen (nur sinnvoll, wenn keine Stufe die
+                           Dateien später in place verändert)
+    :param methods: Reihenfolge der Verfahren (Standard: LINK_METHODS)
+    :return: verwendetes Verfahren oder "unchanged"
+    """
+    if same_file(src, dst):
+        return "unchanged"
+    if os.path.lexists(dst):
+        os.remove(dst)
+    for method in methods or LINK_METHODS:
+        if method == "hardlink":
+            if not allow_hardlink:
+                continue
+            try:
+                os.link(src, dst)
+                return method
+            except OSError:
+                continue
+        elif method == "reflink":
+            if reflink(src, dst):
+                shutil.copystat(src, dst)
+                return method
+        elif method == "kernel":
+            if kernel_copy(src, dst):
+                shutil.copystat(src, dst)
+                return method
+        elif method == "copy":
+            shutil.copy2(src, dst)
+            return method
+    shutil.copy2(src, dst)
+    return "copy"
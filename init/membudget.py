@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+membudget.py – Speicherbudget für parallele Bildverarbeitung.
+
+Große Bilder (z. B. 100-MP-TIFFs) brauchen in einzelnen Stufen ein Vielfaches ihrer
+Dateigröße – Enhancement legt für k-Means float32-Kopien an. Laufen mehrere solcher
+Bilder gleichzeitig, reicht der Arbeitsspeicher nicht mehr. Dieses Modul
+
+  - schätzt den Spitzenbedarf einer Aufgabe aus den Kopfdaten des Bildes
+    (Breite × Höhe × Kanäle) und einem Faktor je Stufe,
+  - lässt Aufgaben nur zu, solange das Budget nicht überschritten wird
+    (eine einzelne zu große Aufgabe läuft allein),
+  - lernt die Faktoren aus gemessenen Spitzen (tracemalloc) und speichert sie in
+    _cache/membudget.json,
+  - bietet einen Zwischenspeicher für dekodierte Bilder, der bei vollem Speicher die
+    am längsten ungenutzten Einträge auf die Platte auslagert (.npy bzw. .npz);
+    die E/A-Pipeline (iopipeline.py) hält darin ihre vorausgelesenen Bilder.
+
+Typischer Ablauf:
+    budget = create_budget(load_budget_bytes(config), "Enhancement")
+    results = run_with_budget(budget, files, process, max_workers=4)
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from logger import log_message, shorten_path
+from utils import get_cache_dir
+
+# Faktor = Spitzenbedarf in Bytes / (Breite × Höhe × Kanäle); Startwerte bis gemessen wurde
+DEFAULT_MULTIPLIERS = {
+    "Enhancement": 14.0,   # RGB-Kopie, float32-Daten und Labels für k-Means, Rauschen
+    "TransBack": 6.0,
+    "CleanUp": 4.0,
+    "SwapColors": 4.0,
+    "Extract": 3.0,
+    "Scal": 4.0,
+}
+DEFAULT_MULTIPLIER = 4.0
+# Gewicht einer neuen Messung im gleitenden Mittel
+_LEARN_RATE = 0.3
+# Sicherheitszuschlag auf die Schätzung (tracemalloc sieht nicht alle nativen Puffer)
+_SAFETY = 1.25
+# Anteil des Arbeitsspeichers bei memory_budget_mb = 0
+_AUTO_SHARE = 0.5
+_FALLBACK_BUDGET_MB = 4096
+
+_MODE_CHANNELS = {"1": 1, "L": 1, "P": 1, "I": 4, "F": 4, "I;16": 2, "LA": 2, "PA": 2,
+                  "RGB": 3, "YCbCr": 3, "LAB": 3, "HSV": 3, "RGBA": 4, "RGBa": 4, "CMYK": 4}
+
+# ----------------------------------------------------------
+# Budget bestimmen
+# ----------------------------------------------------------
+def total_memory():
+    """Physischer Arbeitsspeicher in Bytes (None, wenn nicht ermittelbar)."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def load_budget_bytes(cfg):
+    """
+    Liest [Settings] memory_budget_mb aus der settings.ini.
+    0 = automatisch (die Hälfte des Arbeitsspeichers).
+    """
+    budget_mb = cfg.getint("Settings", "memory_budget_mb", fallback=0) if cfg is not None else 0
+    if budget_mb > 0:
+        return budget_mb * 1024 * 1024
+    total = total_memory()
+    if total:
+        return int(total * _AUTO_SHARE)
+    return _FALLBACK_BUDGET_MB * 1024 * 1024
+
+# ----------------------------------------------------------
+# Faktoren je Stufe (gelernt)
+# ----------------------------------------------------------
+def _multiplier_path():
+    return os.path.join(get_cache_dir(), "membudget.json")
+
+def load_multipliers():
+    """Gelernte Faktoren aus _cache/membudget.json ({Stufe: {"factor", "samples"}})."""
+    try:
+        with open(_multiplier_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_multipliers(learned):
+    path = _multiplier_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(learned, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log_message(f"Speicherfaktoren konnten nicht gespeichert werden: {e}", level="warning")
+
+def stage_multiplier(budget, stage=None):
+    stage = stage or budget["stage"]
+    entry = budget["learned"].get(stage)
+    if entry:
+        return entry["factor"]
+    return DEFAULT_MULTIPLIERS.get(stage, DEFAULT_MULTIPLIER)
+
+def record_peak(budget, units, peak_bytes, stage=None):
+    """
+    Übernimmt eine gemessene Spitze (Bytes) für eine Aufgabe mit units =
+    Breite × Höhe × Kanäle in das gleitende Mittel der Stufe.
+    """
+    if units <= 0 or peak_bytes <= 0:
+        return
+    stage = stage or budget["stage"]
+    factor = peak_bytes / units
+    with budget["cond"]:
+        entry = budget["learned"].get(stage)
+        if entry:
+            entry["factor"] = round((1 - _LEARN_RATE) * entry["factor"] + _LEARN_RATE * factor, 3)
+            entry["samples"] += 1
+        else:
+            budget["learned"][stage] = {"factor": round(factor, 3), "samples": 1}
+        learned = dict(budget["learned"])
+    save_multipliers(learned)
+
+_reported = threading.local()
+
+def report_peak(peak_bytes):
+    """
+    Meldet eine anderswo gemessene Spitze (z. B. aus einem Kindprozess, siehe
+    watchdog) an ein laufendes measure_peak desselben Threads.
+    """
+    _reported.peak = max(getattr(_reported, "peak", 0), int(peak_bytes))
+
+def measure_peak(func, *args, **kwargs):
+    """
+    Führt func aus und misst die Spitze der Python-/NumPy-Allokationen (tracemalloc)
+    bzw. die per report_peak gemeldete Spitze, falls diese größer ist.
+
+    :return: (Ergebnis, Spitze in Bytes)
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    _reported.peak = 0
+    start, _ = tracemalloc.get_traced_memory()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return result, max(0, peak - start, _reported.peak)
+
+# ----------------------------------------------------------
+# Schätzung
+# ----------------------------------------------------------
+def probe_units(file_path):
+    """Breite × Höhe × Kanäle eines Bildes (nur Kopfdaten, ohne Dekodieren)."""
+    with Image.open(file_path) as img:
+        width, height = img.size
+        channels = _MODE_CHANNELS.get(img.mode, len(img.getbands()))
+    return width * height * channels
+
+def estimate_bytes(budget, file_path, stage=None):
+    """Geschätzter Spitzenbedarf einer Aufgabe in Bytes (0, wenn der Kopf nicht lesbar ist)."""
+    try:
+        units = probe_units(file_path)
+    except Exception:
+        return 0
+    return int(units * stage_multiplier(budget, stage) * _SAFETY)
+
+# ----------------------------------------------------------
+# Zulassung
+# ----------------------------------------------------------
+def create_budget(limit_bytes, stage="default"):
+    """Neues Budget (dict) für eine Stufe; lädt die gelernten Faktoren."""
+    return {
+        "limit": int(limit_bytes),
+        "stage": stage,
+        "in_use": 0,
+        "active": 0,
+        "peak_in_use": 0,
+        "waited": 0,
+        "learned": load_multipliers(),
+        "cond": threading.Condition(),
+    }
+
+def admit(budget, nbytes):
+    """
+    Wartet, bis nbytes ins Budget passen, und reserviert sie.
+    Eine Aufgabe, die allein schon größer als das Budget ist, wird zugelassen,
+    sobald keine andere mehr läuft.
+    """
+    with budget["cond"]:
+        if budget["active"] and budget["in_use"] + nbytes > budget["limit"]:
+            budget["waited"] += 1
+            while budget["active"] and budget["in_use"] + nbytes > budget["limit"]:
+                budget["cond"].wait()
+        if nbytes > budget["limit"]:
+            log_message(f"Aufgabe ({nbytes // (1024 * 1024)} MB) größer als das Speicherbudget "
+                        f"({budget['limit'] // (1024 * 1024)} MB) – läuft allein.", level="warning")
+        budget["in_use"] += nbytes
+        budget["active"] += 1
+        budget["peak_in_use"] = max(budget["peak_in_use"], budget["in_use"])
+    return nbytes
+
+def release(budget, nbytes):
+    """Gibt eine Reservierung wieder frei."""
+    with budget["cond"]:
+        budget["in_use"] -= nbytes
+        budget["active"] -= 1
+        budget["cond"].notify_all()
+
+@contextmanager
+def reserve(budget, nbytes):
+    """with reserve(budget, n): ... – reserviert n Bytes für die Dauer des Blocks."""
+    admit(budget, nbytes)
+    try:
+        yield
+    finally:
+        release(budget, nbytes)
+
+def run_with_budget(budget, items, func, max_workers=None, estimate_fn=None, units_fn=None):
+    """
+    Führt func(item) für alle Dateien parallel aus, ohne das Budget zu überschreiten.
+    Zugelassen wird in der Reihenfolge von items.
+
+    Die erste Aufgabe läuft allein und wird gemessen (record_peak) – so lernt jede
+    Stufe ihren Faktor, auch wenn danach parallel gearbeitet wird.
+
+    :param estimate_fn: Schätzung in Bytes je item (Standard: estimate_bytes)
+    :param units_fn: Breite × Höhe × Kanäle je item (Standard: probe_units)
+    :return: Liste der Ergebnisse (None bei Ausnahmen, die protokolliert werden)
+    """
+    items = list(items)
+    if not items:
+        return []
+    estimate_fn = estimate_fn or (lambda item: estimate_bytes(budget, item))
+    units_fn = units_fn or probe_units
+    results = [None] * len(items)
+
+    def call(index):
+        try:
+            return func(items[index])
+        except Exception as e:
+            log_message(f"Fehler bei {shorten_path(str(items[index]))}: {e}", level="error")
+            return None
+
+    # Kalibrierung mit der ersten Aufgabe
+    with reserve(budget, estimate_fn(items[0])):
+        results[0], peak = measure_peak(call, 0)
+    try:
+        record_peak(budget, units_fn(items[0]), peak)
+    except Exception:
+        pass
+
+    workers = max_workers or 1
+    if workers <= 1:
+        for index in range(1, len(items)):
+            with reserve(budget, estimate_fn(items[index])):
+                results[index] = call(index)
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for index in range(1, len(items)):
+            nbytes = admit(budget, estimate_fn(items[index]))
+            future = pool.submit(call, index)
+            future.add_done_callback(lambda _, n=nbytes: release(budget, n))
+            futures.append((index, future))
+        for index, future in futures:
+            results[index] = future.result()
+    return results
+
+def budget_summary(budget):
+    """Kurze Zusammenfassung für das Log."""
+    mb = 1024 * 1024
+    return (f"Speicherbudget {budget['limit'] // mb} MB, Spitze reserviert {budget['peak_in_use'] // mb} MB, "
+            f"{budget['waited']} Aufgaben mussten warten, Faktor {budget['stage']}: "
+            f"{stage_multiplier(budget):.1f}")
+
+# ----------------------------------------------------------
+# Zwischenspeicher mit Auslagerung auf die Platte
+# ----------------------------------------------------------
+def create_spill_cache(limit_bytes, name="default", compress=False):
+    """
+    Zwischenspeicher für dekodierte Bilder (ndarray) mit Obergrenze im Arbeitsspeicher.
+    Wird die Grenze überschritten, werden die am längsten ungenutzten Einträge nach
+    _cache/spill/<PID>_<name> ausgelagert (.npy roh bzw. .npz komprimiert).
+    """
+    return {
+        "limit": int(limit_bytes),
+        "compress": compress,
+        "dir": os.path.join(get_cache_dir("spill"), f"{os.getpid()}_{name}"),
+        "memory": OrderedDict(),
+        "memory_bytes": 0,
+        "spilled": {},
+        "counter": 0,
+        "stats": {"hits": 0, "disk_hits": 0, "misses": 0, "spills": 0},
+        "lock": threading.RLock(),
+    }
+
+def _spill(cache, key, arr):
+    os.makedirs(cache["dir"], exist_ok=True)
+    cache["counter"] += 1
+    if cache["compress"]:
+        path = os.path.join(cache["dir"], f"{cache['counter']:08}.npz")
+        np.savez_compressed(path, data=arr)
+    else:
+        path = os.path.join(cache["dir"], f"{cache['counter']:08}.npy")
+        np.save(path, arr, allow_pickle=False)
+    cache["spilled"][key] = path
+    cache["stats"]["spills"] += 1
+
+def _load_spilled(path):
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return data["data"]
+    return np.load(path, allow_pickle=False)
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _evict(cache):
+    while cache["memory_bytes"] > cache["limit"] and len(cache["memory"]) > 1:
+        key, arr = cache["memory"].popitem(last=False)
+        cache["memory_bytes"] -= arr.nbytes
+        _spill(cache, key, arr)
+
+def cache_put(cache, key, arr):
+    """Legt arr unter key ab (ersetzt einen vorhandenen Eintrag)."""
+    with cache["lock"]:
+        cache_drop(cache, key)
+        cache["memory"][key] = arr
+        cache["memory_bytes"] += arr.nbytes
+        _evict(cache)
+
+def cache_get(cache, key):
+    """Liefert den Eintrag oder None; ausgelagerte Einträge werden zurückgeladen."""
+    with cache["lock"]:
+        arr = cache["memory"].get(key)
+        if arr is not None:
+            cache["memory"].move_to_end(key)
+            cache["stats"]["hits"] += 1
+            return arr
+        path = cache["spilled"].pop(key, None)
+        if path is None:
+            cache["stats"]["misses"] += 1
+            return None
+        arr = _load_spilled(path)
+        _remove_file(path)
+        cache["stats"]["disk_hits"] += 1
+        cache["memory"][key] = arr
+        cache["memory_bytes"] += arr.nbytes
+        _evict(cache)
+        return arr
+
+def cache_pop(cache, key):
+    """Wie cache_get, entfernt den Eintrag aber (ausgelagerte werden nicht zurückgelegt)."""
+    with cache["lock"]:
+        arr = cache["memory"].pop(key, None)
+        if arr is not None:
+            cache["memory_bytes"] -= arr.nbytes
+            cache["stats"]["hits"] += 1
+            return arr
+        path = cache["spilled"].pop(key, None)
+        if path is None:
+            cache["stats"]["misses"] += 1
+            return None
+        cache["stats"]["disk_hits"] += 1
+    arr = _load_spilled(path)
+    _remove_file(path)
+    return arr
+
+def cache_drop(cache, key):
+    """Entfernt einen Eintrag (Arbeitsspeicher und Platte)."""
+    with cache["lock"]:
+        arr = cache["memory"].pop(key, None)
+        if arr is not None:
+            cache["memory_bytes"] -= arr.nbytes
+        path = cache["spilled"].pop(key, None)
+        if path:
+            _remove_file(path)
+
+def cache_clear(cache):
+    """Leert den Zwischenspeicher und entfernt ausgelagerte Dateien."""
+    with cache["lock"]:
+        cache["memory"].clear()
+        cache["memory_bytes"] = 0
+        cache["spilled"].clear()
+        shutil.rmtree(cache["dir"], ignore_errors=True)
+
+def sweep_spill_dirs(max_age_hours=24):
+    """Entfernt Auslagerungsordner abgebrochener Läufe (älter als max_age_hours)."""
+    spill_root = get_cache_dir("spill")
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(spill_root):
+        path = os.path.join(spill_root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
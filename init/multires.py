@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+multires.py – Grob-zu-fein-Berechnung von Masken.
+
+Große Bilder werden zunächst auf einer Pyramidenstufe (1/2^level) grob ausgewertet,
+um die relevanten Objekte und deren Begrenzungsrahmen zu finden. Die teure Auswertung
+in voller Auflösung (Labeling, Kanten, Konturen) erfolgt anschließend nur noch
+innerhalb dieser Rahmen.
+
+Die grobe Maske entsteht per block_any: ein grobes Pixel ist gesetzt, sobald im
+zugehörigen Block mindestens ein Pixel gesetzt ist. Dadurch liegt jedes Objekt der
+vollen Auflösung vollständig in genau einem groben Objekt – es geht also nichts
+verloren, die Rahmen sind höchstens etwas zu groß.
+
+Genutzt von CleanUp und TransBack (Schlüssel mask_pyramid_level und
+mask_boundary_px im [Settings]-Abschnitt der settings.ini).
+"""
+import numpy as np
+import cv2
+
+# Höchste Stufe (1/16); darüber reicht die 8-Bit-Mittelung von block_any nicht mehr aus
+MAX_LEVEL = 4
+# Unterhalb dieser Kantenlänge (auf der groben Stufe) lohnt sich die Pyramide nicht
+MIN_COARSE_SIZE = 32
+
+def effective_level(shape, level):
+    """
+    Begrenzt die Pyramidenstufe auf 0..MAX_LEVEL, sodass das grobe Bild mindestens
+    MIN_COARSE_SIZE Pixel Kantenlänge behält. 0 bedeutet: volle Auflösung.
+    """
+    h, w = shape[:2]
+    level = min(MAX_LEVEL, max(0, int(level)))
+    while level > 0 and min(h, w) >> level < MIN_COARSE_SIZE:
+        level -= 1
+    return level
+
+def block_any(mask, level):
+    """
+    Verkleinert eine Binärmaske um den Faktor 2^level. Ein grobes Pixel ist 255,
+    wenn im zugehörigen Block mindestens ein Pixel der Maske gesetzt ist.
+    Die Maske wird dazu rechts/unten auf ein Vielfaches der Blockgröße aufgefüllt.
+    """
+    scale = 1 << level
+    h, w = mask.shape[:2]
+    hs, ws = -(-h // scale), -(-w // scale)
+    if hs * scale != h or ws * scale != w:
+        mask = cv2.copyMakeBorder(mask, 0, hs * scale - h, 0, ws * scale - w,
+                                  cv2.BORDER_CONSTANT, value=0)
+    coarse = cv2.resize(mask, (ws, hs), interpolation=cv2.INTER_AREA)
+    _, coarse = cv2.threshold(coarse, 0, 255, cv2.THRESH_BINARY)
+    return coarse
+
+def coarse_rect_to_full(x, y, w, h, level, pad, shape):
+    """
+    Rechnet einen Rahmen der groben Stufe in volle Auflösung um, erweitert ihn
+    um pad Pixel und begrenzt ihn auf die Bildgröße.
+
+    :return: (x0, y0, x1, y1) in voller Auflösung (x1/y1 exklusiv)
+    """
+    full_h, full_w = shape[:2]
+    scale = 1 << level
+    return (max(0, x * scale - pad), max(0, y * scale - pad),
+            min(full_w, (x + w) * scale + pad), min(full_h, (y + h) * scale + pad))
+
+def merge_rects(rects):
+    """Fasst sich überlappende oder berührende Rahmen (x0, y0, x1, y1) zusammen."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while rects:
+            current = rects.pop()
+            i = 0
+            while i < len(rects):
+                other = rects[i]
+                if (current[0] <= other[2] and other[0] <= current[2]
+                        and current[1] <= other[3] and other[1] <= current[3]):
+                    current = [min(current[0], other[0]), min(current[1], other[1]),
+                               max(current[2], other[2]), max(current[3], other[3])]
+                    rects.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append(current)
+        rects = result
+    return [tuple(r) for r in rects]
+
+def candidate_rects(mask, level, min_area, pad):
+    """
+    Liefert die (erweiterten, zusammengefassten) Rahmen aller Objekte der Maske,
+    die groß genug sein können, um eine Konturfläche > min_area zu erreichen.
+    Maßstab ist – wie bei filter_mask_by_contour_area – (Breite - 1) * (Höhe - 1)
+    des hochgerechneten groben Rahmens, also eine obere Schranke.
+
+    :return: Liste von (x0, y0, x1, y1) in voller Auflösung
+    """
+    scale = 1 << level
+    coarse = block_any(mask, level)
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(coarse, connectivity=8)
+    rects = []
+    for x, y, w, h, _ in stats[1:num_labels]:
+        if (int(w) * scale - 1) * (int(h) * scale - 1) > min_area:
+            rects.append(coarse_rect_to_full(x, y, w, h, level, pad, mask.shape))
+    return merge_rects(rects)
+
+# ----------------------------------------------------------
+# Auswahl eines Objekts (Seedpunkt oder größtes Objekt)
+# ----------------------------------------------------------
+def _pick_label(labels, stats, seed):
+    """Label am Seedpunkt (lokale Koordinaten) oder – falls dort leer – das größte."""
+    if seed is not None:
+        sx, sy = seed
+        if 0 <= sy < labels.shape[0] and 0 <= sx < labels.shape[1] and labels[sy, sx] != 0:
+            return int(labels[sy, sx])
+    return int(np.argmax(stats[1:, cv2.CC_STAT_AREA])) + 1
+
+def _component_result(labels, stats, label, x0, y0):
+    """(rect, component, area) des Labels; rect in voller Auflösung."""
+    x, y, w, h, area = (int(v) for v in stats[label])
+    component = labels[y:y + h, x:x + w] == label
+    return (x0 + x, y0 + y, x0 + x + w, y0 + y + h), component, area
+
+def select_component(mask, level=0, seed=None):
+    """
+    Wählt in einer Binärmaske das Objekt (8er-Nachbarschaft) am Seedpunkt (x, y) bzw.,
+    falls dort nichts gesetzt ist, das größte Objekt. Bei gleicher Größe gewinnt das in
+    Rasterreihenfolge erste – wie bei np.argmax über connectedComponentsWithStats.
+
+    Mit level > 0 wird zuerst die grobe Maske gelabelt. Gelabelt wird in voller
+    Auflösung dann nur noch innerhalb eines groben Objekts (beim größten Objekt in
+    absteigender Reihenfolge der oberen Schranke, bis kein größeres mehr möglich ist).
+    Da jedes Objekt vollständig in genau einem groben Objekt liegt, ist das Ergebnis
+    identisch zur Auswertung in voller Auflösung.
+
+    :return: (rect, component, area) – rect = (x0, y0, x1, y1) ist der Begrenzungsrahmen
+             des Objekts, component die bool-Maske innerhalb von rect – oder None,
+             wenn die Maske leer ist.
+    """
+    level = effective_level(mask.shape, level)
+    if level == 0:
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if num_labels <= 1:
+            return None
+        return _component_result(labels, stats, _pick_label(labels, stats, seed), 0, 0)
+
+    scale = 1 << level
+    full_h, full_w = mask.shape[:2]
+    coarse = block_any(mask, level)
+    num_coarse, coarse_labels, coarse_stats, _ = cv2.connectedComponentsWithStats(coarse, connectivity=8)
+    if num_coarse <= 1:
+        return None
+
+    def label_within(k, local_seed=None):
+        # Maske auf das grobe Objekt k beschränken und dort in voller Auflösung labeln
+        x, y, w, h, _ = (int(v) for v in coarse_stats[k])
+        x0, y0 = x * scale, y * scale
+        x1, y1 = min(full_w, (x + w) * scale), min(full_h, (y + h) * scale)
+        region = (coarse_labels[y:y + h, x:x + w] == k).astype(np.uint8)
+        region = cv2.resize(region, (w * scale, h * scale), interpolation=cv2.INTER_NEAREST)
+        crop = np.where(region[:y1 - y0, :x1 - x0] != 0, mask[y0:y1, x0:x1], 0).astype(np.uint8)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(crop, connectivity=8)
+        if local_seed is not None:
+            local_seed = (local_seed[0] - x0, local_seed[1] - y0)
+        return _component_result(labels, stats, _pick_label(labels, stats, local_seed), x0, y0)
+
+    if seed is not None and mask[seed[1], seed[0]] != 0:
+        return label_within(coarse_labels[seed[1] >> level, seed[0] >> level], seed)
+
+    best, best_key = None, None
+    order = np.argsort(-coarse_stats[1:, cv2.CC_STAT_AREA], kind="stable") + 1
+    for k in order:
+        if best is not None and int(coarse_stats[k, cv2.CC_STAT_AREA]) * scale * scale < best[2]:
+            break
+        result = label_within(k)
+        rect, component, area = result
+        # Rasterreihenfolge: erstes Pixel = oberste Zeile, darin die linke Spalte
+        key = (-area, rect[1], rect[0] + int(np.argmax(component[0])))
+        if best_key is None or key < best_key:
+            best, best_key = result, key
+    return best
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+objextract.py – gemeinsame Objektextraktion für Extract und ExtractGray.
+
+Objekte werden anhand des Alphakanals (Alpha > 1) einmalig per
+connectedComponentsWithStats gelabelt, anschließend per Slicing ausgeschnitten und
+über einen Thread-Pool als PNG geschrieben.
+
+Das Ergebnis entspricht der bisherigen Verarbeitung (findContours mit RETR_EXTERNAL
+und boundingRect je Kontur):
+  - Löcher im Alphakanal werden vor dem Labeln gefüllt, Objekte in Löchern anderer
+    Objekte zählen also – wie bei äußeren Konturen – nicht als eigenes Objekt
+  - die Nummerierung der Dateien ({nr:02}_{name}.png) folgt der Konturreihenfolge
+    (erstes Pixel in Rasterreihenfolge, absteigend), zu kleine Objekte behalten
+    ihre Nummer und werden übersprungen
+  - der Ausschnitt enthält alle Pixel des Begrenzungsrahmens, Alpha wird binär
+    (255 bei Alpha > 1, sonst 0)
+
+Modi:
+  - "color": BGRA-Ausschnitt (RGBA-PNG)
+  - "gray":  Graustufen mit Alpha (LA-PNG); umgerechnet wird nur der Ausschnitt
+
+Im Atlasmodus (siehe atlas.py) landen alle Objekte eines Bildes in einem
+Sprite-Atlas statt in einzelnen Dateien.
+
+Binäre Alphamaske und (im Graumodus) Graustufe kommen aus dem Ableitungsspeicher
+(derived.py), sofern einer übergeben wird: Labeln und Ausschneiden teilen sich eine
+Maske, und Kopien desselben Bildes – auch aus anderen Stufen – rechnen nicht neu.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from logger import log_message, shorten_path
+from atlas import write_atlas
+from catalog import get_info
+from report import count
+from safewrite import atomic_imwrite
+from imgio import read, has_alpha
+from derived import content_key, get_alpha_mask, get_gray
+
+EXTRACT_MODES = ("color", "gray")
+
+def default_workers():
+    """Standardanzahl Schreib-Threads (PNG-Kodierung gibt den GIL frei)."""
+    return max(1, min(8, os.cpu_count() or 1))
+
+# ----------------------------------------------------------
+# Objekte finden
+# ----------------------------------------------------------
+def fill_holes(binary):
+    """
+    Füllt alle Hintergrundbereiche, die (4er-Nachbarschaft) nicht mit dem Bildrand
+    verbunden sind – entspricht der Fläche innerhalb der äußeren Konturen.
+    """
+    padded = cv2.copyMakeBorder(binary, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    flood_mask = np.zeros((padded.shape[0] + 2, padded.shape[1] + 2), dtype=np.uint8)
+    cv2.floodFill(padded, flood_mask, (0, 0), 128, flags=4)
+    return np.where(padded[1:-1, 1:-1] == 128, 0, 255).astype(np.uint8)
+
+def label_objects(alpha, binary=None):
+    """
+    Liefert die Begrenzungsrahmen (x, y, w, h) aller Objekte des Alphakanals in der
+    Reihenfolge, in der findContours(RETR_EXTERNAL) die äußeren Konturen liefert.
+
+    :param binary: bereits berechnete binäre Alphamaske (Alpha > 1), sonst aus alpha
+    """
+    if binary is None:
+        _, binary = cv2.threshold(alpha, 1, 255, cv2.THRESH_BINARY)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(fill_holes(binary), connectivity=8)
+
+    order = []
+    for k in range(1, num_labels):
+        x, y, w, h = (int(v) for v in stats[k, :4])
+        # erstes Pixel des Objekts in Rasterreihenfolge (oberste Zeile, linke Spalte)
+        first_x = x + int(np.argmax(labels[y, x:x + w] == k))
+        order.append((y, first_x, (x, y, w, h)))
+    order.sort(reverse=True)
+    return [rect for _, _, rect in order]
+
+def crop_object(img, rect, mode="color", binary=None, gray=None):
+    """
+    Schneidet ein Objekt aus einem BGRA-Bild aus. Der Alphakanal wird binär.
+
+    :param binary: binäre Alphamaske des ganzen Bildes (sonst je Ausschnitt berechnet)
+    :param gray: Graustufe des ganzen Bildes für den Graumodus (sonst je Ausschnitt)
+    :return: BGRA-Array ("color") bzw. (H, W, 2)-Array aus Grauwert und Alpha ("gray")
+    """
+    x, y, w, h = rect
+    crop = img[y:y + h, x:x + w]
+    if binary is None:
+        mask = cv2.threshold(crop[:, :, 3], 1, 255, cv2.THRESH_BINARY)[1]
+    else:
+        mask = binary[y:y + h, x:x + w]
+    if mode == "gray":
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGRA2GRAY) if gray is None else gray[y:y + h, x:x + w]
+        return np.dstack([gray, mask])
+    result = crop.copy()
+    result[:, :, 3] = mask
+    return result
+
+def write_crop(output_path, crop):
+    """Speichert einen Ausschnitt als PNG (RGBA bzw. LA – je nach Kanälen von crop). Liefert True bei Erfolg."""
+    return atomic_imwrite(output_path, crop)
+
+# ----------------------------------------------------------
+# Extraktion einer Datei
+# ----------------------------------------------------------
+def extract_objects(img, extract_size=10, binary=None):
+    """
+    Liefert (Nummer, Rahmen) aller Objekte, deren Breite und Höhe mindestens
+    extract_size betragen. Die Nummer entspricht der bisherigen Dateinummer.
+
+    :param binary: bereits berechnete binäre Alphamaske (Alpha > 1)
+    """
+    return [(i + 1, rect) for i, rect in enumerate(label_objects(img[:, :, 3], binary))
+            if rect[2] >= extract_size and rect[3] >= extract_size]
+
+def needs_extraction(catalog, date_folder, file_path, counter=None):
+    """
+    Prüft anhand des Katalogs (nur Kopfdaten), ob ein Bild extrahiert werden muss.
+    Bilder ohne Alphakanal und beschädigte Dateien werden übersprungen, ohne sie zu
+    dekodieren (und im Laufbericht gezählt, falls counter angegeben ist). Ohne
+    Katalog (catalog=None) wird jedes Bild verarbeitet.
+    """
+    if catalog is None:
+        return True
+    try:
+        info = get_info(catalog, date_folder, file_path)
+    except Exception:
+        return True
+    if info["status"] != "ok":
+        log_message(f"Das Bild {file_path} ist beschädigt ({info['error']}) – übersprungen.", level="warning")
+        reason = "corrupt"
+    elif not info["has_alpha"]:
+        log_message(f"Das Bild {file_path} hat keinen Alphakanal – übersprungen.", level="info")
+        reason = "no_alpha"
+    else:
+        return True
+    if counter is not None:
+        count(counter, "skipped", reason)
+    return False
+
+def count_extraction(counter, result):
+    """Zählt das Ergebnis von extract_objects_from_image im Laufbericht."""
+    if result is None:
+        count(counter, "failed")
+    elif result > 0:
+        count(counter, "written")
+    else:
+        count(counter, "unchanged")
+
+def extract_objects_from_image(file_path, extract_size=10, mode="color", max_workers=None,
+                               atlas_options=None, derived_cache=None, catalog=None, date_folder=None):
+    """
+    Extrahiert alle Objekte eines Bildes als einzelne PNG-Dateien
+    ({nr:02}_{name}.png im selben Ordner) und löscht danach die Originaldatei.
+    Bilder ohne Alphakanal werden übersprungen.
+
+    :param file_path: Pfad zum Originalbild.
+    :param extract_size: Mindestbreite und -höhe der Objekte in Pixeln.
+    :param mode: "color" oder "gray".
+    :param max_workers: Anzahl Schreib-Threads (None = default_workers()).
+    :param atlas_options: dict aus atlas.load_atlas_options – Objekte werden dann als
+                          Atlas ({name}.atlas.png/.json) statt einzeln gespeichert.
+    :param derived_cache: Ableitungsspeicher (derived.load_derived_cache) für Alphamaske
+                          und Graustufe; Schlüssel aus dem Katalog (catalog, date_folder).
+    :return: Anzahl gespeicherter Objekte oder None, wenn das Bild nicht verarbeitet wurde.
+    """
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"Unbekannter Extraktionsmodus: {mode}")
+    log_message(f"Starte Verarbeitung von {file_path} mit extract_size={extract_size}", level="info")
+
+    img = read(file_path, "color")
+    if img is None:
+        log_message(f"Fehler: Datei {file_path} konnte nicht geladen werden.", level="error")
+        return None
+    if not has_alpha(img):
+        log_message(f"Das Bild {file_path} hat keinen Alphakanal.", level="warning")
+        return None
+
+    key = content_key(file_path, catalog, date_folder) if derived_cache is not None else None
+    binary = get_alpha_mask(derived_cache, key, img) if derived_cache is not None else None
+    objects = extract_objects(img, extract_size, binary)
+    gray = get_gray(derived_cache, key, img) if derived_cache is not None and mode == "gray" and objects else None
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    output_dir = os.path.dirname(file_path)
+
+    def crop(rect):
+        return crop_object(img, rect, mode, binary, gray)
+
+    if atlas_options and objects:
+        return _extract_to_atlas(file_path, objects, base_name, output_dir, mode, atlas_options, crop)
+
+    def save(number, rect):
+        output_path = os.path.join(output_dir, f"{number:02}_{base_name}.png")
+        try:
+            ok = write_crop(output_path, crop(rect))
+        except Exception as e:
+            log_message(f"Fehler beim Speichern von {shorten_path(output_path)}: {e}", level="error")
+            return False
+        if ok:
+            log_message(f"Objekt {number} gespeichert: {output_path}", level="info")
+        else:
+            log_message(f"Fehler beim Speichern von {shorten_path(output_path)}", level="error")
+        return ok
+
+    workers = max_workers or default_workers()
+    if workers > 1 and len(objects) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda obj: save(*obj), objects))
+    else:
+        results = [save(*obj) for obj in objects]
+
+    extracted_count = sum(results)
+    if extracted_count > 0 and all(results):
+        try:
+            os.remove(file_path)
+            log_message(f"{extracted_count} Objekte aus {file_path} wurden verarbeitet. Originaldatei wurde gelöscht.", level="info")
+        except Exception as e:
+            log_message(f"Fehler beim Löschen der Originaldatei {file_path}: {str(e)}", level="error")
+    elif extracted_count > 0:
+        log_message(f"{extracted_count} von {len(objects)} Objekten aus {file_path} gespeichert. Originaldatei bleibt erhalten.", level="warning")
+    else:
+        log_message(f"Keine Objekte aus {file_path} extrahiert. Originaldatei bleibt erhalten.", level="info")
+    return extracted_count
+
+def _extract_to_atlas(file_path, objects, base_name, output_dir, mode, atlas_options, crop):
+    """Schreibt alle Objekte eines Bildes als Atlas und löscht danach die Originaldatei."""
+    crops = []
+    for number, rect in objects:
+        crops.append((f"{number:02}_{base_name}.png", crop(rect), rect[:2]))
+    try:
+        write_atlas(output_dir, base_name, crops, mode=mode,
+                    max_size=atlas_options.get("max_size", 4096),
+                    padding=atlas_options.get("padding", 1),
+                    write_csv=atlas_options.get("csv", False),
+                    extra={"source": os.path.basename(file_path)})
+    except Exception as e:
+        log_message(f"Fehler beim Speichern des Atlas für {file_path}: {e}. Originaldatei bleibt erhalten.", level="error")
+        return 0
+    try:
+        os.remove(file_path)
+        log_message(f"{len(crops)} Objekte aus {file_path} als Atlas gespeichert. Originaldatei wurde gelöscht.", level="info")
+    except Exception as e:
+        log_message(f"Fehler beim Löschen der Originaldatei {file_path}: {str(e)}", level="error")
+    return len(crops)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+pointops.py – punktweise Bildoperationen und deren Zusammenfassung.
+
+Punktweise Stufen (invert, SwapColors, Kontrast/Helligkeit aus Enhancement) hängen
+nur vom Farbwert eines Pixels ab. Sie werden hier als Operationen beschrieben:
+
+  - "lut":      eine Tabelle mit 256 Einträgen je Farbkanal (3 x 256)
+  - "contrast": Kontrast nach PIL.ImageEnhance – wird beim Anwenden anhand der
+                mittleren Helligkeit des Bildes zu einer LUT gebunden
+  - "colormap": Farbersetzung über eine Swap-Konfiguration (siehe colorlut)
+
+Aufeinanderfolgende LUTs werden zu einer einzigen Tabelle verknüpft. Enthält die
+Kette eine Farbersetzung, wird sie bei palettenarmen Bildern komplett auf den
+eindeutigen Farben ausgewertet und einmalig zurückverteilt. Angewendet wird immer
+in place auf die Farbkanäle, der Alpha-Kanal bleibt unberührt.
+
+Zusätzlich ermittelt plan_fusion() aus spelling.json, welche punktweisen Stufen
+für denselben Collation-Ordner direkt aufeinander folgen. Die erste Stufe einer
+solchen Folge wendet die ganze Kette an (ein Lesen, ein Schreiben pro Bild) und
+vermerkt die Folgestufen je Bild im Katalog (mark_applied). Die Folgestufen
+überspringen nur so vermerkte Bilder – lief die Kopfstufe nicht (etwa weil
+start.json andere Module ausführt als spelling.json aufführt), wenden sie ihre
+Operation selbst an. Jeder Vermerk trägt den Fingerabdruck der Operationen
+(ops_fingerprint); nach geänderten Parametern wird nicht übersprungen.
+"""
+import json
+import hashlib
+import numpy as np
+import cv2
+from utils import load_json_config
+from colorlut import (estimate_color_count, pack_bgr, unpack_bgr, swap_colors, load_swap_setup,
+                      lut_config_hash)
+from safewrite import atomic_imwrite
+from imgio import read
+from catalog import get_info, stage_done, record_stage_run
+from report import count
+from iopipeline import run_pipeline
+from resultcache import fetch_result, store_result
+
+# Vollständig punktweise Stufen
+POINT_STAGES = ("SwapColors", "invert")
+# Stufen, deren Abschluss punktweise ist und die daher eine Folge anführen können
+POINT_TAIL_STAGES = ("Enhancement",)
+
+_IDENTITY = np.arange(256, dtype=np.uint8)
+# Bei Änderungen an der Anwendung erhöhen, damit alte Ergebnisse im
+# laufübergreifenden Ergebnisspeicher nicht mehr verwendet werden
+RESULT_VERSION = 1
+
+# ----------------------------------------------------------
+# Operationen
+# ----------------------------------------------------------
+def lut_op(name, lut):
+    """Punktoperation über eine Tabelle (256 Einträge für alle oder 3 x 256 je Kanal)."""
+    lut = np.asarray(lut, dtype=np.uint8)
+    if lut.ndim == 1:
+        lut = np.tile(lut, (3, 1))
+    return {"kind": "lut", "name": name, "lut": lut}
+
+def invert_op():
+    """Farben invertieren (255 - x)."""
+    return lut_op("invert", 255 - _IDENTITY)
+
+def _blend_lut(base, factor):
+    """
+    Tabelle für PIL.Image.blend(degenerate, image, factor) mit konstantem
+    degenerate-Wert base – gleiche Rundung (float32, abgeschnitten) wie in PIL.
+    """
+    x = _IDENTITY.astype(np.float32)
+    value = np.float32(base) + np.float32(factor) * (x - np.float32(base))
+    return np.clip(value, 0, 255).astype(np.uint8)
+
+def brightness_op(factor):
+    """Helligkeit wie ImageEnhance.Brightness(factor)."""
+    return lut_op("brightness", _blend_lut(0, factor))
+
+def contrast_op(factor):
+    """Kontrast wie ImageEnhance.Contrast(factor); die LUT hängt vom Bildmittelwert ab."""
+    return {"kind": "contrast", "name": "contrast", "factor": float(factor)}
+
+def swap_op(swap_setup):
+    """Farbersetzung gemäß Swap-Konfiguration (siehe colorlut.make_swap_setup)."""
+    return {"kind": "colormap", "name": "swap", "setup": swap_setup}
+
+def ops_params(ops):
+    """
+    Parameter einer Operationskette als JSON-fähige Liste (Tabellen als Prüfsumme,
+    Farbersetzungen über den Konfigurations-Hash der Farb-LUT und das Verfahren).
+    """
+    params = []
+    for op in ops:
+        if op["kind"] == "lut":
+            params.append({"lut": op["name"], "sha256": hashlib.sha256(op["lut"].tobytes()).hexdigest()})
+        elif op["kind"] == "contrast":
+            params.append({"contrast": op["factor"]})
+        elif op["kind"] == "colormap":
+            setup = op["setup"]
+            params.append({"swap": lut_config_hash(setup["pairs"], setup["tolerance"], setup["metric"],
+                                                   setup["bits"]),
+                           "engine": setup["engine"], "unique_max_colors": setup["unique_max_colors"]})
+        else:
+            raise ValueError(f"Unbekannte Operation: {op['kind']}")
+    return params
+
+def ops_fingerprint(ops):
+    """Kurzer, stabiler Fingerabdruck einer Operationskette (für stage_runs im Katalog)."""
+    payload = json.dumps(ops_params(ops), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:24]
+
+def compose_luts(first, second):
+    """Verknüpft zwei 3 x 256-Tabellen: erst first, dann second."""
+    return np.stack([second[c][first[c]] for c in range(3)])
+
+def build_stage_ops(stage_name, cfg):
+    """
+    Liefert die punktweisen Operationen einer Stufe anhand der settings.ini.
+    Bei Enhancement ist das nur der Abschluss (Kontrast und Helligkeit).
+    """
+    if stage_name == "invert":
+        return [invert_op()]
+    if stage_name == "SwapColors":
+        return [swap_op(load_swap_setup(cfg))]
+    if stage_name == "Enhancement":
+        contrast = cfg.getfloat("Settings", "contrast", fallback=1.2)
+        brightness = cfg.getfloat("Settings", "brightness", fallback=1.05)
+        return [contrast_op(contrast), brightness_op(brightness)]
+    raise ValueError(f"Stufe '{stage_name}' ist nicht punktweise")
+
+# ----------------------------------------------------------
+# Anwendung
+# ----------------------------------------------------------
+def _mean_luminance(colors, weights, order):
+    """Mittlere Helligkeit wie ImageStat.Stat(image.convert("L")).mean, gerundet wie PIL."""
+    c = colors.reshape(-1, 3).astype(np.int64)
+    if order == "bgr":
+        r, g, b = c[:, 2], c[:, 1], c[:, 0]
+    else:
+        r, g, b = c[:, 0], c[:, 1], c[:, 2]
+    lum = (r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16
+    if weights is None:
+        mean = lum.mean() if lum.size else 0.0
+    else:
+        mean = (lum * weights).sum() / max(1, weights.sum())
+    return int(mean + 0.5)
+
+def _apply_lut_inplace(arr, lut):
+    """
+    Wendet eine 3 x 256-Tabelle in place an. arr ist ein zusammenhängendes
+    (..., 3)- oder (..., 4)-Array; ein vierter Kanal (Alpha) bleibt unverändert.
+    """
+    channels = arr.shape[-1]
+    table = np.empty((1, 256, channels), dtype=np.uint8)
+    table[0, :, :3] = lut.T
+    if channels == 4:
+        table[0, :, 3] = _IDENTITY
+    shaped = arr.reshape(-1, 1, channels)
+    cv2.LUT(shaped, table, dst=shaped)
+
+def _run_chain(arr, ops, weights=None, order="bgr"):
+    """
+    Führt die Operationskette auf arr aus (in place). Aufeinanderfolgende LUTs
+    werden vorher verknüpft und in einem Schritt angewendet.
+
+    :return: True, wenn eine Farbersetzung Pixel verändert hat (LUTs werden nur
+             über den Vergleich des Ergebnisses erkannt).
+    """
+    pending = None
+    swapped = False
+
+    def flush():
+        nonlocal pending
+        if pending is not None:
+            _apply_lut_inplace(arr, pending)
+            pending = None
+
+    for op in ops:
+        if op["kind"] == "contrast":
+            # Der Mittelwert bezieht sich auf den aktuellen Zwischenstand
+            flush()
+            base = _mean_luminance(arr[..., :3], weights, order)
+            lut = np.tile(_blend_lut(base, op["factor"]), (3, 1))
+        elif op["kind"] == "lut":
+            lut = op["lut"]
+        elif op["kind"] == "colormap":
+            if order != "bgr":
+                raise ValueError("Farbersetzung erwartet BGR-Kanalreihenfolge")
+            flush()
+            count, _ = swap_colors(op["setup"], arr[..., :3])
+            swapped = swapped or count > 0
+            continue
+        else:
+            raise ValueError(f"Unbekannte Operation: {op['kind']}")
+        pending = lut if pending is None else compose_luts(pending, lut)
+    flush()
+    return swapped
+
+def is_lut_only(ops):
+    """True, wenn die Kette nur aus festen Tabellen besteht."""
+    return all(op["kind"] == "lut" for op in ops)
+
+def apply_ops(img, ops, order="bgr", unique_max_colors=4096):
+    """
+    Wendet eine Operationskette in place auf ein Bild (H x W x 3 oder 4, uint8,
+    zusammenhängend) an. Der Alpha-Kanal bleibt unverändert.
+
+      - nur LUTs:  eine verknüpfte Tabelle, ein Durchlauf (cv2.LUT in place)
+      - sonst:     bei palettenarmen Bildern Auswertung auf den eindeutigen Farben
+                   und einmaliges Zurückverteilen, ansonsten Schritt für Schritt
+
+    :return: True, wenn sich Pixelwerte geändert haben.
+    """
+    if not ops:
+        return False
+    if img.ndim != 3 or img.shape[2] not in (3, 4) or img.dtype != np.uint8:
+        raise ValueError("apply_ops erwartet ein 8-Bit-Bild mit 3 oder 4 Kanälen")
+
+    if is_lut_only(ops):
+        lut = ops[0]["lut"]
+        for op in ops[1:]:
+            lut = compose_luts(lut, op["lut"])
+        if np.array_equal(lut, np.tile(_IDENTITY, (3, 1))):
+            return False
+        _apply_lut_inplace(img, lut)
+        return True
+
+    color = img[..., :3]
+    if estimate_color_count(color) <= unique_max_colors:
+        packed, inverse, counts = np.unique(pack_bgr(color).ravel(), return_inverse=True, return_counts=True)
+        colors = unpack_bgr(packed).reshape(-1, 1, 3)
+        original = colors.copy()
+        _run_chain(colors, ops, weights=counts, order=order)
+        changed_colors = np.any(colors != original, axis=-1).ravel()
+        if not changed_colors.any():
+            return False
+        inverse = inverse.ravel()
+        changed = changed_colors[inverse].reshape(color.shape[:2])
+        color[changed] = colors.reshape(-1, 3)[inverse[changed.ravel()]]
+        return True
+
+    before = color.copy()
+    _run_chain(img, ops, order=order)
+    return not np.array_equal(before, color)
+
+def read_image(path):
+    """Liest ein Bild für die Operationskette (Graustufen als BGR); None bei Fehlern."""
+    return read(path, "color")
+
+def process_image_file(path, ops):
+    """
+    Liest ein Bild genau einmal, wendet die Operationskette an und schreibt es
+    nur dann (genau einmal) zurück, wenn sich etwas geändert hat.
+
+    :return: True (geschrieben), False (unverändert) oder None bei Fehlern.
+    """
+    img = read_image(path)
+    if img is None:
+        return None
+    if not apply_ops(img, ops):
+        return False
+    if not atomic_imwrite(path, img):
+        return None
+    return True
+
+def fused_chain(ops, fused):
+    """Operationen der Stufe, gefolgt von denen der zusammengefassten Folgestufen."""
+    chain = list(ops)
+    for follower_ops in fused.values():
+        chain.extend(follower_ops)
+    return chain
+
+def mark_applied(catalog, date_folder, fused, path):
+    """
+    Vermerkt Stufen, deren Operationen eine Kopfstufe für path mit angewendet hat.
+
+    :param fused: {Stufe: ihre Operationen} – vermerkt wird deren Fingerabdruck, damit
+                  die Folgestufe nur bei unveränderten Parametern überspringt
+    """
+    for stage, stage_ops in fused.items():
+        record_stage_run(catalog, date_folder, stage, path, changed=False, params=ops_fingerprint(stage_ops))
+
+def process_stage_file(catalog, date_folder, stage, path, ops, counter, fused=None, result_cache=None):
+    """
+    process_image_file mit Buchführung im Katalog: Hat die Stufe die Datei bereits
+    mit denselben Operationen bearbeitet und ist sie seitdem unverändert (erneuter
+    Lauf), wird sie übersprungen – punktweise Stufen wie invert sind nicht idempotent.
+    Das Ergebnis wird im Laufbericht gezählt.
+
+    :param ops: Operationen der Stufe selbst
+    :param fused: zusammengefasste Folgestufen {Stufe: Operationen}, die gleich mit
+                  angewendet werden
+    :param result_cache: laufübergreifender Ergebnisspeicher (resultcache.open_result_cache);
+                         ein Treffer ersetzt das Anwenden
+    :return: wie process_image_file; "skipped", wenn die Stufe schon angewendet wurde
+    """
+    fused = fused or {}
+    params = ops_fingerprint(ops)
+    if stage_done(catalog, date_folder, stage, path, params):
+        count(counter, "skipped", "already_applied")
+        return "skipped"
+    input_sha256 = get_info(catalog, date_folder, path)["sha256"]
+    chain = fused_chain(ops, fused)
+    result_params = {"ops": ops_params(chain)}
+    hit = False
+    if result_cache is not None:
+        key, _, hit = fetch_result(result_cache, stage, RESULT_VERSION, result_params, path,
+                                   input_sha=input_sha256)
+    result = True if hit else process_image_file(path, chain)
+    if result is None:
+        count(counter, "failed")
+        return None
+    if not hit and result_cache is not None:
+        # Auch ein unverändertes Bild ist ein Ergebnis (die Eingabe selbst)
+        store_result(result_cache, key, stage, input_sha256, result_params, path)
+    record_stage_run(catalog, date_folder, stage, path, input_sha256, changed=result, params=params)
+    mark_applied(catalog, date_folder, fused, path)
+    count(counter, "written" if result else "unchanged")
+    return result
+
+def process_stage_files(catalog, date_folder, stage, paths, ops, counter, io_options=None, on_result=None,
+                        fused=None, result_cache=None):
+    """
+    process_stage_file für viele Dateien über die E/A-Pipeline: Bilder werden
+    vorausgelesen und im Hintergrund geschrieben, Katalog und Zähler bleiben im
+    aufrufenden Thread. Treffer im Ergebnisspeicher werden vorab bereitgestellt und
+    gar nicht erst gelesen.
+
+    :param on_result: on_result(path, ergebnis) – Ergebnis wie bei process_stage_file
+    :param fused: zusammengefasste Folgestufen {Stufe: Operationen} wie bei process_stage_file
+    :param result_cache: laufübergreifender Ergebnisspeicher wie bei process_stage_file
+    :return: Kennzahlen der Pipeline (für den Laufbericht)
+    """
+    on_result = on_result or (lambda path, result: None)
+    fused = fused or {}
+    params = ops_fingerprint(ops)
+    chain = fused_chain(ops, fused)
+    result_params = {"ops": ops_params(chain)}
+    result_keys = {}
+    todo = []
+    for path in paths:
+        if stage_done(catalog, date_folder, stage, path, params):
+            count(counter, "skipped", "already_applied")
+            on_result(path, "skipped")
+            continue
+        if result_cache is not None:
+            input_sha = get_info(catalog, date_folder, path)["sha256"]
+            key, _, hit = fetch_result(result_cache, stage, RESULT_VERSION, result_params, path,
+                                       input_sha=input_sha)
+            if hit:
+                record_stage_run(catalog, date_folder, stage, path, input_sha, changed=True, params=params)
+                mark_applied(catalog, date_folder, fused, path)
+                count(counter, "written")
+                on_result(path, True)
+                continue
+            result_keys[path] = key
+        todo.append(path)
+    input_sha256 = {}
+
+    def compute(path, img, error):
+        if img is None:
+            result_keys.pop(path, None)
+            count(counter, "failed")
+            on_result(path, None)
+            return None
+        input_sha256[path] = get_info(catalog, date_folder, path)["sha256"]
+        if apply_ops(img, chain):
+            return img
+        # Unverändert: die Eingabe selbst ist das Ergebnis
+        input_sha = input_sha256.pop(path)
+        if path in result_keys:
+            store_result(result_cache, result_keys.pop(path), stage, input_sha, result_params, path)
+        record_stage_run(catalog, date_folder, stage, path, input_sha, changed=False, params=params)
+        mark_applied(catalog, date_folder, fused, path)
+        count(counter, "unchanged")
+        on_result(path, False)
+        return None
+
+    def finish(path, ok, error):
+        input_sha = input_sha256.pop(path, None)
+        key = result_keys.pop(path, None)
+        if not ok:
+            count(counter, "failed")
+            on_result(path, None)
+            return
+        if key is not None:
+            store_result(result_cache, key, stage, input_sha, result_params, path)
+        record_stage_run(catalog, date_folder, stage, path, input_sha, changed=True, params=params)
+        mark_applied(catalog, date_folder, fused, path)
+        count(counter, "written")
+        on_result(path, True)
+
+    return run_pipeline(todo, read_image, compute, lambda path, img: atomic_imwrite(path, img),
+                        finish, io_options)
+
+# ----------------------------------------------------------
+# Planung: welche punktweisen Stufen folgen direkt aufeinander?
+# ----------------------------------------------------------
+def is_fusion_enabled(spelling=None):
+    """Liest den Schalter "fuse_point_ops" aus spelling.json (Standard: aus)."""
+    spelling = load_json_config("spelling.json") if spelling is None else spelling
+    return bool(spelling.get("fuse_point_ops", False))
+
+def plan_fusion(spelling=None):
+    """
+    Ermittelt je Collation-Schlüssel (z. B. "output_foldes_collation8") die Folgen
+    direkt aufeinanderfolgender punktweiser Stufen, in der Reihenfolge von spelling.json.
+
+    :return: dict {collation_key: [[Kopfstufe, Folgestufe, ...], ...]} – nur Folgen
+             mit mindestens zwei Stufen.
+    """
+    spelling = load_json_config("spelling.json") if spelling is None else spelling
+    if not is_fusion_enabled(spelling):
+        return {}
+
+    stages_per_folder = {}
+    for entry in spelling.get("spelling", []):
+        if not entry.get("enabled", False):
+            continue
+        for folder_key in entry.get("folders", []):
+            stages_per_folder.setdefault(folder_key, []).append(entry.get("name"))
+
+    plan = {}
+    for folder_key, stages in stages_per_folder.items():
+        runs = []
+        current = []
+        for stage in stages:
+            if current and stage in POINT_STAGES:
+                current.append(stage)
+                continue
+            if len(current) > 1:
+                runs.append(current)
+            current = [stage] if stage in POINT_STAGES + POINT_TAIL_STAGES else []
+        if len(current) > 1:
+            runs.append(current)
+        if runs:
+            plan[folder_key] = runs
+    return plan
+
+def fused_followers(stage_name, collation_key, plan=None):
+    """Stufen, die die Kopfstufe stage_name für diesen Ordner gleich mit anwendet."""
+    plan = plan_fusion() if plan is None else plan
+    for run in plan.get(collation_key, []):
+        if run[0] == stage_name:
+            return run[1:]
+    return []
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+presets.py – Voreinstellungen für Geschwindigkeit und Qualität (draft, balanced, quality).
+
+Statt einzelne INI-Schlüssel von Hand abzustimmen, wählt start.json eine
+Voreinstellung ("settings": {"preset": "draft"}), die die algorithmischen Stellgrößen
+aller Stufen zusammenpassend setzt – auch solche, die bisher fest im Code standen:
+
+  Enhancement  color_levels, abstraction_degree, kmeans_attempts, kmeans_max_iter,
+               kmeans_epsilon
+  TransBack    kernel_size, iterations, mask_pyramid_level (auch CleanUp)
+  Scal         interpolation (lanczos, bicubic, bilinear, nearest)
+  Ausgabe      png_compression (0–9; leer = Standard von OpenCV, in allen drei
+               Voreinstellungen – die ausdrücklichen Stufen sind langsamer)
+
+"balanced" entspricht den bisherigen Werten. Ohne Voreinstellung (null) gilt die
+settings.ini unverändert. Die Voreinstellungen stehen ausschließlich in start.json
+unter "presets" und können dort angepasst oder ergänzt werden; einzelne Schlüssel
+lassen sich zusätzlich über "preset_overrides" (Abschnitt → Schlüssel → Wert)
+überschreiben.
+
+Aufruf: python init/presets.py [--bench [Bilder]] – Durchsatz je Voreinstellung
+"""
+import os
+import sys
+import time
+import json
+import copy
+import numpy as np
+import cv2
+from PIL import Image
+from logger import log_message
+from utils import load_start_config
+from safewrite import set_png_compression
+
+INTERPOLATIONS = {
+    "nearest": (Image.NEAREST, cv2.INTER_NEAREST),
+    "bilinear": (Image.BILINEAR, cv2.INTER_LINEAR),
+    "bicubic": (Image.BICUBIC, cv2.INTER_CUBIC),
+    "lanczos": (Image.LANCZOS, cv2.INTER_LANCZOS4),
+}
+
+# ----------------------------------------------------------
+# Auflösen
+# ----------------------------------------------------------
+def load_presets(start_config=None):
+    """Voreinstellungen aus start.json ("presets"; leer, wenn keine definiert sind)."""
+    start_config = load_start_config() if start_config is None else start_config
+    return copy.deepcopy(start_config.get("presets", {}))
+
+def resolve_preset(start_config=None):
+    """
+    Gewählte Voreinstellung samt preset_overrides.
+
+    :return: (Name, {Abschnitt: {Schlüssel: Wert}}) – (None, {}) ohne Voreinstellung
+    """
+    start_config = load_start_config() if start_config is None else start_config
+    settings = start_config.get("settings", {})
+    name = settings.get("preset")
+    if not name:
+        return None, {}
+    presets = load_presets(start_config)
+    if name not in presets:
+        log_message(f"Unbekannte Voreinstellung '{name}' – settings.ini gilt unverändert.", level="warning")
+        return None, {}
+    values = copy.deepcopy(presets[name])
+    for section, overrides in settings.get("preset_overrides", {}).items():
+        values.setdefault(section, {}).update(overrides)
+    return name, values
+
+def apply_preset(cfg, start_config=None):
+    """
+    Überträgt die gewählte Voreinstellung in die geladene settings.ini (cfg) und
+    stellt die PNG-Kompression für atomar geschriebene Bilder ein.
+
+    :return: Name der Voreinstellung oder None
+    """
+    name, values = resolve_preset(start_config)
+    for section, entries in values.items():
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+        for key, value in entries.items():
+            cfg.set(section, key, str(value))
+    if name:
+        log_message(f"Voreinstellung '{name}' angewendet.", level="info")
+    set_png_compression(png_compression(cfg))
+    return name
+
+# ----------------------------------------------------------
+# Zugriff für die Stufen
+# ----------------------------------------------------------
+def png_compression(cfg):
+    """PNG-Kompressionsstufe 0–9 oder None (Standard der Bibliothek)."""
+    value = cfg.get("Settings", "png_compression", fallback="").strip()
+    if not value:
+        return None
+    return min(9, max(0, int(value)))
+
+def interpolation_name(cfg):
+    """Name des Interpolationsverfahrens aus [Scaling] interpolation (Standard: lanczos)."""
+    name = cfg.get("Scaling", "interpolation", fallback="lanczos").strip().lower()
+    if name not in INTERPOLATIONS:
+        log_message(f"Unbekannte Interpolation '{name}', verwende lanczos.", level="warning")
+        name = "lanczos"
+    return name
+
+def interpolation(cfg, library="pil"):
+    """Interpolationsverfahren aus [Scaling] interpolation als Konstante von PIL bzw. OpenCV."""
+    return INTERPOLATIONS[interpolation_name(cfg)][0 if library == "pil" else 1]
+
+def kmeans_settings(cfg):
+    """(attempts, max_iter, epsilon) für cv2.kmeans in Enhancement."""
+    return (cfg.getint("Settings", "kmeans_attempts", fallback=10),
+            cfg.getint("Settings", "kmeans_max_iter", fallback=100),
+            cfg.getfloat("Settings", "kmeans_epsilon", fallback=0.2))
+
+# ----------------------------------------------------------
+# Messung: Durchsatz je Voreinstellung auf einem synthetischen Korpus
+# ----------------------------------------------------------
+def synthetic_corpus(count=12, size=512, seed=7):
+    """
+    Erzeugt reproduzierbare Testbilder (BGR): heller Papiergrund mit Rauschen und
+    einigen dunkel umrandeten, farbigen Formen – wie gescannte Icons.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        img = np.full((size, size, 3), 235, np.uint8)
+        img = cv2.add(img, rng.integers(0, 20, img.shape, dtype=np.uint8))
+        for _ in range(rng.integers(3, 7)):
+            color = tuple(int(c) for c in rng.integers(0, 200, 3))
+            center = tuple(int(c) for c in rng.integers(size // 8, size - size // 8, 2))
+            radius = int(rng.integers(size // 16, size // 6))
+            cv2.circle(img, center, radius, color, -1)
+            cv2.circle(img, center, radius, (20, 20, 20), 3)
+        images.append(img)
+    return images
+
+def _bench_enhancement(img, settings):
+    z = np.float32(img.reshape((-1, 3)))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER,
+                int(settings["kmeans_max_iter"]), float(settings["kmeans_epsilon"]))
+    _, labels, centers = cv2.kmeans(z, int(settings["color_levels"]), None, criteria,
+                                    int(settings["kmeans_attempts"]), cv2.KMEANS_RANDOM_CENTERS)
+    quantized = np.uint8(centers)[labels.flatten()].reshape(img.shape)
+    for _ in range(int(settings["abstraction_degree"])):
+        quantized = cv2.bilateralFilter(quantized, d=9, sigmaColor=75, sigmaSpace=75)
+    return quantized
+
+def _bench_transback(img, settings):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    level = int(settings["mask_pyramid_level"])
+    small = gray
+    for _ in range(level):
+        small = cv2.pyrDown(small)
+    edges = cv2.Canny(small, 32, 155)
+    k = max(1, int(settings["kernel_size"]) >> level)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+    return cv2.dilate(edges, kernel, iterations=int(settings["iterations"]))
+
+def benchmark_presets(count=12, size=512, names=None):
+    """
+    Misst je Voreinstellung den Durchsatz (Bilder/s) der Kernschritte von Enhancement
+    (k-Means, bilaterale Filter), TransBack (Kanten, Dilatation), Scal (Skalierung
+    auf 50 %) und des PNG-Schreibens auf dem synthetischen Korpus.
+
+    :param names: zu messende Voreinstellungen (Standard: alle aus start.json)
+    """
+    corpus = synthetic_corpus(count, size)
+    presets = load_presets()
+    results = {}
+    for name in names or presets:
+        settings = presets[name]["Settings"]
+        resample = INTERPOLATIONS[presets[name].get("Scaling", {}).get("interpolation", "lanczos")][0]
+        level = settings.get("png_compression", "")
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(level)] if str(level).strip() else []
+        cv2.setRNGSeed(1)
+        timings = {}
+        steps = {
+            "Enhancement": lambda img: _bench_enhancement(img, settings),
+            "TransBack": lambda img: _bench_transback(img, settings),
+            "Scal": lambda img: Image.fromarray(img).resize((size // 2, size // 2), resample),
+            "PNG": lambda img: cv2.imencode(".png", img, params),
+        }
+        for step, func in steps.items():
+            started = time.perf_counter()
+            for img in corpus:
+                func(img)
+            timings[step] = round(count / (time.perf_counter() - started), 2)
+        results[name] = timings
+    return results
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        index = sys.argv.index("--bench")
+        count = int(sys.argv[index + 1]) if len(sys.argv) > index + 1 else 12
+        print(f"Durchsatz in Bildern/s ({count} synthetische Bilder, 512 x 512, "
+              f"{os.cpu_count()} Kerne, OpenCV {cv2.__version__})")
+        print(json.dumps(benchmark_presets(count), indent=2))
+        sys.exit(0)
+    name, values = resolve_preset()
+    print(json.dumps({"preset": name, "values": values}, indent=2, ensure_ascii=False))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+report.py – Laufbericht {Datumsordner}/run_report.json.
+
+Jede Stufe zählt, was sie getan hat, und trägt ihre Zahlen beim Abschluss in den
+gemeinsamen Bericht des Datumsordners ein:
+
+  processed   Bilder betrachtet
+  written     Bilder neu geschrieben
+  unchanged   Ergebnis identisch mit der Eingabe – nicht geschrieben
+  skipped     gar nicht bearbeitet (Gründe in skip_reasons, z. B. "no_alpha")
+  failed      Fehler
+
+Der Bericht wird je Stufe überschrieben (letzter Lauf der Stufe zählt) und atomar
+gespeichert. Hier steht auch EXIT_PARTIAL, der Exit-Code einer Stufe, die fertig ist,
+aber Bilder in Quarantäne lassen musste (watchdog.py, startskript.py, modules/spelling.py).
+"""
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from logger import log_message
+
+REPORT_NAME = "run_report.json"
+_COUNTERS = ("processed", "written", "unchanged", "skipped", "failed")
+# Exit-Code eines Moduls, das fertig ist, aber Bilder in Quarantäne lassen musste
+EXIT_PARTIAL = 3
+
+def report_path(date_folder):
+    return os.path.join(str(date_folder), REPORT_NAME)
+
+def load_report(date_folder):
+    """Liest den Bericht (leerer Bericht, wenn noch keiner existiert)."""
+    try:
+        with open(report_path(date_folder), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": 1, "stages": {}}
+
+def save_report(date_folder, report):
+    path = report_path(date_folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def stage_counter(stage):
+    """Neuer Zähler (dict) für eine Stufe; count darf aus mehreren Threads aufgerufen werden."""
+    counter = {name: 0 for name in _COUNTERS}
+    counter.update({"stage": stage, "skip_reasons": {}, "started": time.time(), "lock": threading.Lock()})
+    return counter
+
+def count(counter, outcome, reason=None):
+    """
+    Zählt ein Bild: outcome ist "written", "unchanged", "skipped" oder "failed".
+    Jedes gezählte Bild gilt als betrachtet (processed).
+    """
+    with counter["lock"]:
+        counter["processed"] += 1
+        counter[outcome] += 1
+        if reason:
+            counter["skip_reasons"][reason] = counter["skip_reasons"].get(reason, 0) + 1
+
+def write_stage_report(date_folder, counter, extra=None):
+    """Trägt die Zahlen einer Stufe in den Bericht ein und protokolliert sie."""
+    with counter["lock"]:
+        entry = {name: counter[name] for name in _COUNTERS}
+        entry["skip_reasons"] = dict(counter["skip_reasons"])
+    entry["seconds"] = round(time.time() - counter["started"], 2)
+    entry["finished"] = datetime.now().isoformat(timespec="seconds")
+    if extra:
+        entry.update(extra)
+    try:
+        report = load_report(date_folder)
+        report["stages"][counter["stage"]] = entry
+        save_report(date_folder, report)
+    except OSError as e:
+        log_message(f"Laufbericht konnte nicht geschrieben werden: {e}", level="warning")
+    log_message(f"{counter['stage']}: {entry['processed']} Bilder, {entry['written']} geschrieben, "
+                f"{entry['unchanged']} unverändert, {entry['skipped']} übersprungen, "
+                f"{entry['failed']} Fehler", level="info")
+    return entry
+
+if __name__ == "__main__":
+    # Aufruf: python init/report.py <Datumsordner> – Bericht ausgeben
+    if len(sys.argv) < 2:
+        print("Aufruf: python init/report.py <Datumsordner>")
+        sys.exit(1)
+    print(json.dumps(load_report(sys.argv[1]), indent=2, ensure_ascii=False))
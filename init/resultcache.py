@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+resultcache.py – laufübergreifender Ergebnisspeicher für Bildstufen.
+
+Jeder Lauf von startskript.py legt einen neuen Datumsordner an und verarbeitet alle
+Bilder neu – auch wenn sich gegenüber dem letzten Lauf nur eine Einstellung einer
+einzigen Stufe geändert hat. Dieser Speicher unter _cache/results merkt sich das
+Ergebnis jeder Stufe je
+
+    (Inhalt der Eingabe (SHA-256), Stufe, normalisierte Parameter, Verfahrensversion)
+
+und stellt es bei einem Treffer per Reflink bzw. Kopie (linkcopy) bereit, statt
+neu zu rechnen.
+
+  - Index: SQLite (_cache/results/index.sqlite) mit Größe, Zugriffszeit und
+    Trefferzahl je Eintrag sowie laufübergreifenden Kennzahlen
+  - Schneller Weg: Prüfsummen werden zuerst aus dem Bildkatalog des Laufs bzw.
+    einer Tabelle (Pfad, Größe, Änderungszeit) übernommen, erst dann berechnet
+  - Größenbegrenzung: beim Überschreiten von max_size_mb werden Einträge nach
+    LRU (zuletzt benutzt) oder LFU (selten benutzt) entfernt
+
+Genutzt von TransBack, Enhancement und den punktweisen Stufen (invert, SwapColors).
+Einstellungen: settings.ini, Abschnitt [ResultCache].
+Aufruf: python init/resultcache.py [--stats | --clear]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from logger import log_message, shorten_path
+from utils import get_cache_dir
+from linkcopy import place_file
+from catalog import lookup, file_sha256
+
+CACHE_POLICIES = ("lru", "lfu")
+# Nach dem Aufräumen bleibt der Speicher höchstens so voll (Anteil von max_size_mb)
+_TRIM_TARGET = 0.9
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS entries (
+        key       TEXT PRIMARY KEY,
+        stage     TEXT,
+        input_sha TEXT,
+        params    TEXT,
+        file      TEXT,
+        size      INTEGER,
+        created   REAL,
+        last_used REAL,
+        hits      INTEGER DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS file_hashes (
+        path     TEXT PRIMARY KEY,
+        size     INTEGER,
+        mtime_ns INTEGER,
+        sha256   TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS stats (
+        name  TEXT PRIMARY KEY,
+        value INTEGER
+    )""",
+)
+
+# ----------------------------------------------------------
+# Öffnen und Einstellungen
+# ----------------------------------------------------------
+def load_result_cache_options(cfg):
+    """Liest [ResultCache] aus der settings.ini."""
+    options = {"enabled": False, "max_size_mb": 2048, "policy": "lru"}
+    if cfg is None or not cfg.has_section("ResultCache"):
+        return options
+    options["enabled"] = cfg.getboolean("ResultCache", "enabled", fallback=False)
+    options["max_size_mb"] = cfg.getint("ResultCache", "max_size_mb", fallback=2048)
+    policy = cfg.get("ResultCache", "policy", fallback="lru").strip().lower()
+    if policy not in CACHE_POLICIES:
+        log_message(f"Ungültige Verdrängungsstrategie '{policy}', verwende lru.", level="warning")
+        policy = "lru"
+    options["policy"] = policy
+    return options
+
+def open_result_cache(cfg=None, options=None):
+    """
+    Öffnet den Ergebnisspeicher.
+
+    :return: Zustand (dict) oder None, wenn der Speicher deaktiviert ist
+    """
+    options = options or load_result_cache_options(cfg)
+    if not options["enabled"]:
+        return None
+    root = get_cache_dir("results")
+    conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    return {
+        "root": root,
+        "conn": conn,
+        "lock": threading.Lock(),
+        "max_bytes": options["max_size_mb"] * 1024 * 1024,
+        "policy": options["policy"],
+        "run": {"hits": 0, "misses": 0, "stores": 0, "evictions": 0},
+    }
+
+def close_result_cache(rc):
+    """Schreibt die Kennzahlen dieses Laufs fort und schließt den Index."""
+    if rc is None:
+        return None
+    with rc["lock"]:
+        for name, value in rc["run"].items():
+            rc["conn"].execute("INSERT INTO stats (name, value) VALUES (?, ?) "
+                               "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, value))
+        rc["conn"].commit()
+        rc["conn"].close()
+    return dict(rc["run"])
+
+# ----------------------------------------------------------
+# Schlüssel
+# ----------------------------------------------------------
+def normalize_params(params):
+    """Parameter als kanonischer JSON-Text (sortierte Schlüssel, Zahlen als float bzw. int)."""
+    def norm(value):
+        if isinstance(value, dict):
+            return {str(k): norm(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [norm(v) for v in value]
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            return value.strip()
+        return value
+    return json.dumps(norm(params or {}), sort_keys=True, separators=(",", ":"))
+
+def result_key(input_sha, stage, params, version):
+    """Schlüssel eines Ergebnisses (SHA-256 über Eingabe, Stufe, Parameter und Version)."""
+    text = "\n".join((input_sha, stage, normalize_params(params), str(version)))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_digest(rc, path, catalog=None, date_folder=None):
+    """
+    SHA-256 einer Datei – zuerst aus dem Bildkatalog (falls aktuell), dann aus der
+    Tabelle file_hashes (gleicher Pfad, gleiche Größe und Änderungszeit), sonst berechnet.
+    """
+    if catalog is not None:
+        entry = lookup(catalog, date_folder, path)
+        if entry and entry.get("sha256"):
+            return entry["sha256"]
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    with rc["lock"]:
+        row = rc["conn"].execute("SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?",
+                                 (abs_path,)).fetchone()
+    if row and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+        return row["sha256"]
+    sha256 = file_sha256(abs_path)
+    with rc["lock"]:
+        rc["conn"].execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                           (abs_path, stat.st_size, stat.st_mtime_ns, sha256))
+        rc["conn"].commit()
+    return sha256
+
+# ----------------------------------------------------------
+# Abrufen und Ablegen
+# ----------------------------------------------------------
+def _count(rc, name, n=1):
+    with rc["lock"]:
+        rc["run"][name] += n
+
+def _object_path(rc, key, ext):
+    return os.path.join(rc["root"], "objects", key[:2], f"{key}{ext}")
+
+def fetch(rc, key, dst):
+    """
+    Stellt ein gespeichertes Ergebnis unter dst bereit (ersetzt dst).
+
+    :return: True bei einem Treffer
+    """
+    with rc["lock"]:
+        row = rc["conn"].execute("SELECT file FROM entries WHERE key = ?", (key,)).fetchone()
+    if row is None or not os.path.exists(os.path.join(rc["root"], row["file"])):
+        _count(rc, "misses")
+        return False
+    # Erst vollständig bereitstellen, dann die Eingabe ersetzen
+    tmp_dst = f"{dst}.{os.getpid()}.tmp"
+    place_file(os.path.join(rc["root"], row["file"]), tmp_dst)
+    # Änderungszeit der bereitgestellten Datei ist die des Abrufs (nicht die des Eintrags)
+    os.utime(tmp_dst)
+    os.replace(tmp_dst, dst)
+    with rc["lock"]:
+        rc["conn"].execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        rc["conn"].commit()
+    _count(rc, "hits")
+    return True
+
+def store(rc, key, stage, input_sha, params, src):
+    """Legt das Ergebnis src unter key ab und räumt bei Bedarf auf."""
+    target = _object_path(rc, key, os.path.splitext(src)[1].lower())
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+    place_file(src, tmp_target)
+    os.replace(tmp_target, target)
+    now = time.time()
+    with rc["lock"]:
+        rc["conn"].execute("INSERT OR REPLACE INTO entries (key, stage, input_sha, params, file, size, created, last_used, hits) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                           (key, stage, input_sha, normalize_params(params),
+                            os.path.relpath(target, rc["root"]), os.path.getsize(target), now, now))
+        rc["conn"].commit()
+    _count(rc, "stores")
+    evict(rc)
+
+def evict(rc):
+    """Entfernt Einträge nach LRU bzw. LFU, bis der Speicher unter der Grenze liegt."""
+    with rc["lock"]:
+        total = rc["conn"].execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= rc["max_bytes"]:
+            return 0
+        order = "hits ASC, last_used ASC" if rc["policy"] == "lfu" else "last_used ASC"
+        rows = rc["conn"].execute(f"SELECT key, file, size FROM entries ORDER BY {order}").fetchall()
+        removed = 0
+        for row in rows:
+            if total <= rc["max_bytes"] * _TRIM_TARGET:
+                break
+            try:
+                os.remove(os.path.join(rc["root"], row["file"]))
+            except OSError:
+                pass
+            rc["conn"].execute("DELETE FROM entries WHERE key = ?", (row["key"],))
+            total -= row["size"]
+            removed += 1
+        rc["conn"].commit()
+    _count(rc, "evictions", removed)
+    return removed
+
+def fetch_result(rc, stage, version, params, path, catalog=None, date_folder=None, input_sha=None):
+    """
+    Erste Hälfte von cached_call für Stufen, die selbst lesen und schreiben (z. B.
+    über die E/A-Pipeline): stellt bei einem Treffer das gespeicherte Ergebnis unter
+    path bereit.
+
+    :param input_sha: bereits bekannte Prüfsumme von path (sonst file_digest)
+    :return: (Schlüssel, Prüfsumme der Eingabe, Treffer ja/nein)
+    """
+    input_sha = input_sha or file_digest(rc, path, catalog, date_folder)
+    key = result_key(input_sha, stage, params, version)
+    try:
+        return key, input_sha, fetch(rc, key, path)
+    except OSError as e:
+        log_message(f"Ergebnisspeicher nicht lesbar für {shorten_path(path)}: {e}", level="warning")
+        return key, input_sha, False
+
+def store_result(rc, key, stage, input_sha, params, path):
+    """Zweite Hälfte von cached_call: legt das fertige Ergebnis path ab."""
+    try:
+        store(rc, key, stage, input_sha, params, path)
+    except OSError as e:
+        log_message(f"Ergebnis konnte nicht gespeichert werden ({shorten_path(path)}): {e}", level="warning")
+
+def cached_call(rc, stage, version, params, path, func, catalog=None, date_folder=None):
+    """
+    Führt eine Stufe, die path in place bearbeitet, über den Ergebnisspeicher aus:
+    bei einem Treffer wird das gespeicherte Ergebnis bereitgestellt, sonst func(path)
+    ausgeführt und dessen Ergebnis (bei Erfolg) gespeichert.
+
+    :return: (Ergebnis von func bzw. True bei Treffer, Treffer ja/nein)
+    """
+    if rc is None:
+        return func(path), False
+    key, input_sha, hit = fetch_result(rc, stage, version, params, path, catalog, date_folder)
+    if hit:
+        return True, True
+    result = func(path)
+    if result:
+        store_result(rc, key, stage, input_sha, params, path)
+    return result, False
+
+def cache_summary(rc):
+    """Kennzahlen dieses Laufs und des gesamten Speichers."""
+    with rc["lock"]:
+        row = rc["conn"].execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size FROM entries").fetchone()
+    return dict(rc["run"], entries=row["n"], size_mb=round(row["size"] / (1024 * 1024), 1))
+
+if __name__ == "__main__":
+    root = os.path.join(get_cache_dir(), "results")
+    if "--clear" in sys.argv:
+        shutil.rmtree(root, ignore_errors=True)
+        print(f"Ergebnisspeicher geleert: {root}")
+        sys.exit(0)
+    rc = open_result_cache(options={"enabled": True, "max_size_mb": 0, "policy": "lru"})
+    summary = cache_summary(rc)
+    summary.update({row["name"]: row["value"] for row in rc["conn"].execute("SELECT name, value FROM stats")})
+    for row in rc["conn"].execute("SELECT stage, COUNT(*) AS n, SUM(hits) AS hits FROM entries GROUP BY stage"):
+        summary[f"stage:{row['stage']}"] = {"entries": row["n"], "hits": row["hits"] or 0}
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+safewrite.py – Bilder atomar schreiben.
+
+  - atomic_imwrite: kodiert das Bild im Speicher, schreibt es in eine temporäre Datei
+    im selben Ordner und ersetzt das Ziel erst danach (os.replace). Ein Abbruch
+    hinterlässt also nie ein halb geschriebenes Bild.
+  - PNG-Kompression: set_png_compression legt die Stufe für alle Schreibvorgänge
+    des Prozesses fest (siehe presets); ohne Angabe gilt der Standard von OpenCV.
+
+Ob sich ein Bild überhaupt geändert hat, prüfen die Stufen selbst vor dem Schreiben
+(pointops, CleanUp) – meist günstiger als ein Pixelvergleich.
+"""
+import os
+import cv2
+from imgio import encode
+
+_png_compression = None
+
+def set_png_compression(level):
+    """PNG-Kompressionsstufe 0–9 für folgende Schreibvorgänge (None = Standard)."""
+    global _png_compression
+    _png_compression = level
+
+def write_params(path):
+    """cv2.imwrite-Parameter für path (PNG-Kompression, falls eingestellt)."""
+    if _png_compression is not None and str(path).lower().endswith(".png"):
+        return [cv2.IMWRITE_PNG_COMPRESSION, _png_compression]
+    return []
+
+def pil_save_params(path):
+    """Image.save-Parameter für path (PNG-Kompression, falls eingestellt)."""
+    if _png_compression is not None and str(path).lower().endswith(".png"):
+        return {"compress_level": _png_compression}
+    return {}
+
+def atomic_write_bytes(path, data):
+    """Schreibt data atomar nach path."""
+    path = str(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def atomic_imwrite(path, img, params=None):
+    """
+    Wie cv2.imwrite, aber atomar (Format anhand der Dateiendung; Kodieren über
+    imgio, auch für Grau + Alpha).
+
+    :return: True bei Erfolg
+    """
+    path = str(path)
+    encoded = encode(img, os.path.splitext(path)[1], params or write_params(path))
+    if encoded is None:
+        return False
+    try:
+        atomic_write_bytes(path, encoded)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+shm.py – Bildtransport zwischen Prozessen über Shared Memory.
+
+Statt ein berechnetes Bild (z. B. 50 MP BGRA = 200 MB) zu pickeln und durch eine
+Pipe zu schieben, schreibt der Kindprozess es einmal in ein Shared-Memory-Segment
+und schickt nur den kleinen Deskriptor (Name, Form, dtype). Der steuernde Prozess
+übernimmt das Ergebnis mit take_array und entfernt das Segment sofort.
+Genutzt vom Watchdog (watchdog.py) für die Ergebnisse seiner Kindprozesse.
+
+Umfang: Das Modul deckt nur diesen Rückweg Kindprozess → Watchdog ab. Eine Verteilung
+eines Bildes vom steuernden Prozess auf mehrere Arbeitsprozesse (mit Referenzzählung
+der Segmente) gibt es bewusst nicht: Die Worker aus Worker.py laden ihre Bilder je
+Aufgabe selbst von der Platte, der Modus "processes" in threads.py wird nur beim
+Kalibrieren gemessen, und die Kollationszweige laufen in Threads eines Prozesses.
+Ohne einen Prozess, der ein Bild an mehrere andere verteilt, hätte die Registry
+keinen Nutzer.
+
+Lebensdauer:
+  - Segmentnamen beginnen mit "bb_<PID des steuernden Prozesses>_<PID des
+    erzeugenden Prozesses>_". Wird ein Kindprozess beendet, bevor sein Ergebnis
+    übernommen ist, entfernt remove_segments(pid) dessen Segmente.
+  - Stürzt der steuernde Prozess ab, entfernt sweep_stale_segments() beim nächsten
+    Start alle Segmente, deren steuernder Prozess nicht mehr läuft. Zusätzlich räumt
+    der resource_tracker von multiprocessing beim Ende des Prozessbaums registrierte
+    Segmente ab.
+  - Reicht der Platz in /dev/shm nicht (segment_fits), bleibt es beim Pickeln –
+    ein volles tmpfs würde den Kindprozess sonst mit SIGBUS beenden.
+"""
+import os
+import secrets
+from multiprocessing import shared_memory
+import numpy as np
+from logger import log_message
+
+SEGMENT_PREFIX = "bb"
+_SHM_DIR = "/dev/shm"
+
+# ----------------------------------------------------------
+# Segmente erzeugen und übernehmen
+# ----------------------------------------------------------
+def _segment_name(owner_pid):
+    return f"{SEGMENT_PREFIX}_{owner_pid}_{os.getpid()}_{secrets.token_hex(6)}"
+
+def _descriptor(shm, arr, owner_pid):
+    return {"name": shm.name, "shape": tuple(arr.shape), "dtype": arr.dtype.str, "owner": owner_pid}
+
+def create_segment(arr, owner_pid=None):
+    """
+    Legt ein Segment an und kopiert arr hinein (die einzige Kopie).
+
+    :return: (SharedMemory, Deskriptor) – der Deskriptor ist klein und picklebar
+    """
+    arr = np.ascontiguousarray(arr)
+    owner_pid = owner_pid or os.getpid()
+    shm = shared_memory.SharedMemory(name=_segment_name(owner_pid), create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, _descriptor(shm, arr, owner_pid)
+
+def as_array(shm, desc):
+    """ndarray-Sicht (ohne Kopie) auf ein Segment."""
+    return np.ndarray(desc["shape"], dtype=np.dtype(desc["dtype"]), buffer=shm.buf)
+
+def take_array(desc):
+    """
+    Übernimmt ein Ergebnis-Segment: kopiert es einmal heraus, schließt und entfernt es.
+    Das Einbinden meldet das Segment beim resource_tracker an, unlink wieder ab.
+    """
+    shm = shared_memory.SharedMemory(name=desc["name"])
+    try:
+        return np.array(as_array(shm, desc))
+    finally:
+        shm.close()
+        shm.unlink()
+
+def segment_fits(nbytes):
+    """True, wenn /dev/shm genug freien Platz für nbytes hat (ohne /dev/shm: True)."""
+    if not os.path.isdir(_SHM_DIR):
+        return True
+    stat = os.statvfs(_SHM_DIR)
+    return stat.f_bavail * stat.f_frsize > nbytes
+
+# ----------------------------------------------------------
+# Aufräumen
+# ----------------------------------------------------------
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def sweep_stale_segments():
+    """
+    Entfernt Segmente abgestürzter Läufe (steuernder Prozess läuft nicht mehr).
+    Nur auf Systemen mit /dev/shm; unter Windows gibt das System Segmente mit dem
+    letzten Handle ohnehin frei.
+
+    :return: Anzahl entfernter Segmente
+    """
+    if not os.path.isdir(_SHM_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(_SHM_DIR):
+        parts = name.split("_")
+        if len(parts) < 3 or parts[0] != SEGMENT_PREFIX or not parts[1].isdigit():
+            continue
+        if _pid_alive(int(parts[1])):
+            continue
+        try:
+            os.remove(os.path.join(_SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        log_message(f"{removed} verwaiste Shared-Memory-Segmente entfernt.", level="warning")
+    return removed
+
+def remove_segments(creator_pid):
+    """
+    Entfernt die Segmente eines (beendeten) Kindprozesses, etwa nach Überschreiten
+    der Zeitgrenze zwischen Anlegen und Übergabe des Ergebnisses.
+    """
+    if not os.path.isdir(_SHM_DIR):
+        return
+    for name in os.listdir(_SHM_DIR):
+        parts = name.split("_")
+        if len(parts) < 4 or parts[0] != SEGMENT_PREFIX or parts[2] != str(creator_pid):
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except OSError:
+            pass
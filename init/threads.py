@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+threads.py – Thread-Budget für OpenCV und BLAS/OpenMP.
+
+OpenCV verteilt bilateralFilter, kmeans, resize usw. auf einen eigenen Thread-Pool,
+NumPys BLAS ggf. ebenfalls. Laufen zusätzlich mehrere Worker (Threads oder
+Prozesse), rechnen N Worker × M interne Threads gegeneinander und der Durchsatz
+sinkt. apply_thread_budget() teilt die Kerne auf:
+
+  Modus "serial"     ein Worker, alle Kerne für die Bibliotheken
+  Modus "threads"    N Worker-Threads in einem Prozess: Kerne / N je Aufruf
+  Modus "processes"  N Worker-Prozesse: jeder Prozess erhält Kerne / N
+                     (worker_env() für neu gestartete Prozesse)
+
+Ist für eine Stufe eine Kalibrierung gespeichert (_cache/threads.json), liefert
+plan_workers() die dort gemessene beste Aufteilung (Worker × Threads).
+
+Aufruf: python init/threads.py [--calibrate [Stufe ...]] – misst alle Aufteilungen
+"""
+import os
+import sys
+import json
+import time
+import multiprocessing
+import cv2
+from logger import log_message
+from utils import get_cache_dir
+
+PARALLEL_MODES = ("serial", "threads", "processes")
+# Umgebungsvariablen der üblichen BLAS-/OpenMP-Implementierungen
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+CALIBRATION_FILE = "threads.json"
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_thread_options(cfg):
+    """Liest [Threads] aus der settings.ini."""
+    options = {"total_threads": 0, "use_calibration": True}
+    if cfg is None or not cfg.has_section("Threads"):
+        return options
+    options["total_threads"] = cfg.getint("Threads", "total_threads", fallback=0)
+    options["use_calibration"] = cfg.getboolean("Threads", "use_calibration", fallback=True)
+    return options
+
+def total_threads(options=None):
+    """Verfügbare Kerne (total_threads aus [Threads], sonst alle dem Prozess zugewiesenen)."""
+    if options and options.get("total_threads", 0) > 0:
+        return options["total_threads"]
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# ----------------------------------------------------------
+# Budget anwenden
+# ----------------------------------------------------------
+def threads_per_worker(workers, options=None):
+    return max(1, total_threads(options) // max(1, workers))
+
+def _set_blas_threads(threads):
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # Bereits geladene BLAS-Bibliotheken lesen die Variablen nicht erneut –
+    # threadpoolctl (falls installiert) stellt sie zur Laufzeit um
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(threads)
+
+def apply_thread_budget(mode="serial", workers=1, options=None):
+    """
+    Stellt OpenCV und BLAS/OpenMP für diesen Prozess passend zur Parallelität ein.
+
+    :param mode: "serial", "threads" oder "processes"
+    :param workers: Anzahl Worker (Threads bzw. Prozesse)
+    :return: Threads je Worker
+    """
+    if mode not in PARALLEL_MODES:
+        raise ValueError(f"Unbekannter Parallelitätsmodus: {mode}")
+    workers = 1 if mode == "serial" else max(1, workers)
+    threads = threads_per_worker(workers, options)
+    cv2.setNumThreads(threads)
+    _set_blas_threads(threads)
+    log_message(f"Thread-Budget: {workers} Worker ({mode}) × {threads} Threads "
+                f"von {total_threads(options)} Kernen", level="info")
+    return threads
+
+def worker_env(workers, options=None, env=None):
+    """Umgebung für neu gestartete Worker-Prozesse (BLAS/OpenMP-Threads je Prozess)."""
+    env = dict(os.environ if env is None else env)
+    threads = threads_per_worker(workers, options)
+    for name in THREAD_ENV_VARS:
+        env[name] = str(threads)
+    env["OPENCV_THREADS"] = str(threads)
+    return env
+
+def apply_env_budget():
+    """
+    Übernimmt in einem gestarteten Worker-Prozess das Budget aus worker_env
+    (OPENCV_THREADS); ohne Vorgabe bleibt OpenCV unverändert.
+    """
+    threads = os.environ.get("OPENCV_THREADS")
+    if threads:
+        cv2.setNumThreads(int(threads))
+    return int(threads) if threads else None
+
+# ----------------------------------------------------------
+# Kalibrierung
+# ----------------------------------------------------------
+def _calibration_path():
+    return os.path.join(get_cache_dir(), CALIBRATION_FILE)
+
+def load_calibration():
+    try:
+        with open(_calibration_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_calibration(calibration):
+    path = _calibration_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp_path, path)
+
+def plan_workers(stage, requested=None, options=None, modes=None):
+    """
+    Anzahl Worker für eine Stufe: requested, falls angegeben (> 0), sonst die
+    kalibrierte Aufteilung (bei gleicher Kernzahl), sonst 1.
+
+    :param modes: Modi, in denen die Stufe laufen kann (Standard: alle); ist die beste
+                  Aufteilung in einem anderen Modus gemessen, gilt die beste gemessene
+                  in einem dieser Modi
+    :return: (Worker, Modus der Kalibrierung oder None)
+    """
+    if requested:
+        return requested, None
+    if options is None or options.get("use_calibration", True):
+        entry = load_calibration().get(stage)
+        if entry and entry.get("cores") == total_threads(options):
+            candidates = [r for r in [entry] + entry.get("results", []) if modes is None or r.get("mode") in modes]
+            if candidates:
+                best = max(candidates, key=lambda r: r.get("images_per_s", 0))
+                return best["workers"], best.get("mode")
+    return 1, None
+
+def _init_worker(threads):
+    cv2.setNumThreads(threads)
+    _set_blas_threads(threads)
+
+def _splits(cores):
+    """Alle Aufteilungen Worker × Threads mit Worker × Threads = Kerne (und 1 × 1)."""
+    splits = {(w, max(1, cores // w)) for w in range(1, cores + 1) if cores % w == 0}
+    splits.add((1, 1))
+    return sorted(splits)
+
+def calibrate(stage, func, items, options=None, modes=("threads", "processes")):
+    """
+    Misst den Durchsatz von func über items für alle Aufteilungen Worker × Threads
+    und speichert die beste für stage.
+
+    :return: Eintrag der Kalibrierung (workers, threads, mode, images_per_s, results)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    cores = total_threads(options)
+    results = []
+    for workers, threads in _splits(cores):
+        for mode in modes:
+            if workers == 1 and mode == "processes":
+                continue
+            started = time.perf_counter()
+            if mode == "processes":
+                with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+                    pool.map(func, items)
+            else:
+                _init_worker(threads)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(func, items))
+            rate = len(items) / (time.perf_counter() - started)
+            results.append({"workers": workers, "threads": threads, "mode": mode, "images_per_s": round(rate, 2)})
+            log_message(f"{stage}: {workers} × {threads} ({mode}): {rate:.2f} Bilder/s", level="info")
+    best = max(results, key=lambda r: r["images_per_s"])
+    entry = dict(best, cores=cores, calibrated=time.strftime("%Y-%m-%d %H:%M:%S"), results=results)
+    calibration = load_calibration()
+    calibration[stage] = entry
+    save_calibration(calibration)
+    _init_worker(cores)
+    return entry
+
+if __name__ == "__main__":
+    if "--calibrate" not in sys.argv:
+        print(json.dumps(load_calibration(), indent=2, ensure_ascii=False))
+        sys.exit(0)
+    # Kalibrierung auf dem synthetischen Korpus mit den Kernschritten (siehe presets)
+    from functools import partial
+    from presets import synthetic_corpus, load_presets, _bench_enhancement, _bench_transback
+    stages = {"Enhancement": _bench_enhancement, "TransBack": _bench_transback}
+    # Enhancement bearbeitet Bilder nur in Threads eines Prozesses
+    stage_modes = {"Enhancement": ("threads",)}
+    requested = sys.argv[sys.argv.index("--calibrate") + 1:] or list(stages)
+    settings = load_presets({})["balanced"]["Settings"]
+    corpus = synthetic_corpus(16, 384)
+    for stage in requested:
+        if stage not in stages:
+            print(f"Keine Kalibrierung für Stufe '{stage}' (verfügbar: {', '.join(stages)})")
+            continue
+        entry = calibrate(stage, partial(stages[stage], settings=settings), corpus,
+                          modes=stage_modes.get(stage, ("threads", "processes")))
+        print(f"{stage}: beste Aufteilung {entry['workers']} × {entry['threads']} ({entry['mode']}), "
+              f"{entry['images_per_s']} Bilder/s")
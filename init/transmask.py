@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+transmask.py – Objektmaske von TransBack (transparenter Hintergrund).
+
+Ein Pixel bleibt sichtbar, wenn es dunkel ist (unter dem dynamischen Schwellenwert),
+an einer (dilatierten) Canny-Kante liegt und zu einem Objekt gehört, dessen äußere
+Kontur größer als min_icon_size ist. Alles andere wird transparent.
+
+Die Parameter kommen als dict (params) aus dem [Settings]-Abschnitt der
+settings.ini:
+
+  weight_factor, dark_threshold_offset   dynamischer Schwellenwert
+  canny_threshold1, canny_threshold2     Kantenerkennung
+  kernel_size, iterations                Dilatation der Kanten
+  min_icon_size                          Mindestfläche der Objektkontur
+  mask_pyramid_level, mask_boundary_px   Grob-zu-fein-Berechnung (siehe multires)
+
+Die Gleichheit mit der früheren Konturschleife (findContours, contourArea,
+drawContours je Kontur) prüft tests/test_transback_parity.py.
+"""
+import numpy as np
+import cv2
+from multires import effective_level, candidate_rects
+
+# ----------------------------------------------------------
+# Maske
+# ----------------------------------------------------------
+def calculate_dark_threshold(gray, params):
+    """
+    Dynamischer Schwellenwert für dunkle Bereiche (weight_factor und
+    dark_threshold_offset).
+    """
+    min_b = np.min(gray)
+    max_b = np.max(gray)
+    calculated = min_b + params["weight_factor"] * (max_b - min_b)
+    return int(calculated + params["dark_threshold_offset"])
+
+def filter_mask_by_contour_area(mask, min_area):
+    """
+    Behält nur Objekte, deren äußere Kontur eine Fläche > min_area hat, und füllt sie.
+
+    Liefert exakt dasselbe Ergebnis wie findContours + contourArea + drawContours je
+    Kontur, aber ohne Python-Schleife über tausende Kleinstkonturen:
+      - Objekte werden einmal per connectedComponentsWithStats gelabelt
+      - die Konturfläche liegt innerhalb der Pixelmittelpunkte, ist also höchstens
+        (Breite - 1) * (Höhe - 1) – alle Objekte darunter werden vektorisiert verworfen
+      - nur die verbleibenden (wenigen, großen) Kandidaten werden per Label-LUT
+        freigestellt, exakt vermessen und in einem einzigen Aufruf gefüllt
+    """
+    filtered_mask = np.zeros_like(mask)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if num_labels <= 1:
+        return filtered_mask
+
+    widths = stats[:, cv2.CC_STAT_WIDTH].astype(np.int64)
+    heights = stats[:, cv2.CC_STAT_HEIGHT].astype(np.int64)
+    candidates = (widths - 1) * (heights - 1) > min_area
+    candidates[0] = False  # Hintergrund
+    if not candidates.any():
+        return filtered_mask
+
+    label_lut = np.where(candidates, 255, 0).astype(np.uint8)
+    candidate_mask = label_lut[labels]
+    contours, _ = cv2.findContours(candidate_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    keep = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
+    if keep:
+        cv2.drawContours(filtered_mask, keep, -1, 255, thickness=cv2.FILLED)
+    return filtered_mask
+
+def compute_filtered_mask(gray, dark_threshold, params, edges=None):
+    """
+    Maske der erkannten Objekte in voller Auflösung: dunkle Bereiche, die an
+    (dilatierten) Kanten liegen und deren Kontur größer als min_icon_size ist.
+
+    :param edges: bereits berechnete Canny-Kanten von gray (z. B. aus derived.get_edges)
+    """
+    # Dunkelbereichsmaskierung
+    _, dark_mask = cv2.threshold(gray, dark_threshold, 255, cv2.THRESH_BINARY_INV)
+
+    # Kantenerkennung
+    if edges is None:
+        edges = cv2.Canny(gray, params["canny_threshold1"], params["canny_threshold2"])
+
+    # Maskenoptimierung: Dilatation
+    kernel_size = params["kernel_size"]
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    edges_dilated = cv2.dilate(edges, kernel, iterations=params["iterations"])
+
+    # Kombinierte Maske aus dunkler Maske und Kanten, kleine Objekte verwerfen
+    combined_mask = cv2.bitwise_and(dark_mask, edges_dilated)
+    return filter_mask_by_contour_area(combined_mask, params["min_icon_size"])
+
+def compute_filtered_mask_multires(gray, dark_threshold, params, edges_fn=None):
+    """
+    Grob-zu-fein-Variante von compute_filtered_mask (mask_pyramid_level > 0).
+    Wird in voller Auflösung gerechnet, liefert edges_fn() (falls angegeben) die
+    Canny-Kanten des ganzen Bildes.
+
+    Jedes erkannte Objekt liegt innerhalb eines zusammenhängenden dunklen Bereichs.
+    Diese Bereiche werden auf der groben Stufe (1/2^level) gesucht; zu kleine werden
+    verworfen. Kanten, Dilatation und Konturen werden anschließend nur in den
+    Rahmen der übrigen Bereiche berechnet, erweitert um den Einflussradius von
+    Canny und Dilatation sowie mask_boundary_px.
+
+    Abweichungen zur vollen Auflösung sind nur über die Hysterese von Canny möglich
+    (schwache Kantenzüge, die erst außerhalb des erweiterten Rahmens an eine starke
+    Kante anschließen); mask_boundary_px begrenzt diesen Randfehler.
+    """
+    def full_resolution():
+        return compute_filtered_mask(gray, dark_threshold, params, edges_fn() if edges_fn else None)
+
+    level = effective_level(gray.shape, params["mask_pyramid_level"])
+    if level == 0:
+        return full_resolution()
+
+    _, dark_mask = cv2.threshold(gray, dark_threshold, 255, cv2.THRESH_BINARY_INV)
+    pad = (params["kernel_size"] // 2) * params["iterations"] + 3 + params["mask_boundary_px"]
+    rects = candidate_rects(dark_mask, level, params["min_icon_size"], pad)
+
+    # Decken die Rahmen fast das ganze Bild ab, lohnt sich die Aufteilung nicht
+    covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+    if covered > 0.75 * gray.size:
+        return full_resolution()
+
+    filtered_mask = np.zeros_like(gray)
+    for x0, y0, x1, y1 in rects:
+        filtered_mask[y0:y1, x0:x1] = compute_filtered_mask(gray[y0:y1, x0:x1], dark_threshold, params)
+    return filtered_mask
+
+def apply_mask(img, mask):
+    """Pixel außerhalb der Maske werden transparent (BGRA, in place)."""
+    img[mask == 0] = 0
+    return img
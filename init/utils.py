@@ -3,6 +3,7 @@ import os
 import re
 import json
 import sys
+import configparser
 from pathlib import Path
 
 # Prüfen, ob Logger bereits importiert werden kann
@@ -68,6 +69,29 @@ def load_json_config(file_name):
         log_message(f"Fehler beim Laden von {file_name}: {e}", level="error")
         return {}
 
+def load_settings_ini():
+    """
+    Lädt die settings.ini aus dem Einstellungsverzeichnis (settings/settings.ini,
+    sonst settings/_archive/settings.ini). Fehlt die Datei, wird eine Warnung
+    ausgegeben und eine leere Konfiguration zurückgegeben – es gelten dann die
+    Standardwerte der Module.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.path.dirname(script_dir)
+    config = configparser.ConfigParser(inline_comment_prefixes=("#", ";"))
+    for config_path in (os.path.join(base_dir, "settings", "settings.ini"),
+                        os.path.join(base_dir, "settings", "_archive", "settings.ini")):
+        if not os.path.exists(config_path):
+            continue
+        try:
+            config.read(config_path, encoding="utf-8")
+            log_message(f"settings.ini geladen: {shorten_path(config_path)}", level="info")
+        except configparser.Error as e:
+            log_message(f"Fehler beim Laden von settings.ini: {e}", level="error")
+        return config
+    log_message("settings.ini nicht gefunden – verwende Standardwerte.", level="warning")
+    return config
+
 def get_folder_config():
     """
     Lädt die Ordnerkonfiguration aus start.json und gibt sie zurück.
@@ -179,6 +203,24 @@ def find_latest_date_folder(search_dir):
     log_message(f"Neuester Datumsordner: {shorten_path(latest_folder)}", level="info")
     return latest_folder
 
+# ----------------------------------------------------------
+# Cache-Verzeichnis (außerhalb der Datumsordner)
+# ----------------------------------------------------------
+
+def get_cache_dir(sub_folder=None):
+    """
+    Liefert das Cache-Verzeichnis "_cache" im Projektordner (bzw. einen Unterordner davon)
+    und legt es bei Bedarf an. Der Cache überlebt einzelne Läufe und wird von
+    Modulen genutzt, die teure Zwischenergebnisse wiederverwenden.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.path.dirname(script_dir)
+    cache_dir = os.path.join(base_dir, "_cache")
+    if sub_folder:
+        cache_dir = os.path.join(cache_dir, sub_folder)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
 # ----------------------------------------------------------
 # Unterstützte Dateiformate
 # ----------------------------------------------------------
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+watchdog.py – Zeit- und Speichergrenzen je Bild, Quarantäne und günstiger Wiederholungsversuch.
+
+Ein einziges ungünstiges Bild (z. B. ein riesiger, verrauschter Scan im k-Means von
+Enhancement) kann eine Stufe minutenlang aufhalten. Mit dem Watchdog läuft die
+Berechnung eines Bildes in einem Kindprozess, der nach time_limit_s beendet wird;
+memory_limit_mb begrenzt dessen Adressraum. Überschreitet ein Bild eine Grenze,
+
+  - wird es nach {Datumsordner}/_quarantine verschoben (Grund im Katalog),
+  - die Stufe arbeitet mit den übrigen Bildern weiter,
+  - am Ende wird es einmal mit einer günstigeren Einstellung erneut versucht
+    (retry_quarantined); gelingt das, kehrt das Ergebnis an den alten Platz zurück.
+
+Bleiben Bilder in Quarantäne, endet die Stufe mit EXIT_PARTIAL – startskript.py
+führt die übrigen Module trotzdem aus und meldet den Teilerfolg im Exit-Code.
+
+Kindprozesse werden per fork gestartet (Linux/macOS). fork aus einem Prozess mit
+weiteren laufenden Threads kann im Kind an einer geerbten Sperre hängen bleiben; die
+Stufe bearbeitet unter dem Watchdog daher nur ein Bild zur Zeit (guarded_workers).
+Bild-Ergebnisse (ndarray)
+kommen über ein Shared-Memory-Segment zurück statt gepickelt durch die Pipe (shm.py);
+verwaiste Segmente abgestürzter Läufe entfernt create_watchdog beim Start.
+
+Ohne fork (Windows) wird die Zeitgrenze über einen Thread überwacht: das Bild wird nach Ablauf verworfen, die
+Berechnung selbst läuft im Hintergrund zu Ende. Die Speichergrenze wird dann nur
+anhand der Schätzung aus membudget geprüft.
+
+Einstellungen: settings.ini, Abschnitt [Watchdog].
+"""
+import os
+import threading
+import tracemalloc
+import multiprocessing
+from multiprocessing import resource_tracker
+import numpy as np
+from logger import log_message, shorten_path
+from catalog import open_catalog, quarantine, forget
+from membudget import estimate_bytes, report_peak
+from report import EXIT_PARTIAL
+from shm import create_segment, take_array, segment_fits, remove_segments, sweep_stale_segments
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_MEMORY_ERRORS = ("insufficient memory", "failed to allocate", "out of memory", "bad_alloc")
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_watchdog_options(cfg, stage):
+    """
+    Liest [Watchdog] aus der settings.ini. Grenzen lassen sich je Stufe überschreiben
+    ({stufe}_time_limit_s, {stufe}_memory_limit_mb, Stufenname in Kleinbuchstaben).
+    """
+    options = {"enabled": False, "time_limit_s": 300.0, "memory_limit_mb": 0, "retry_cheaper": True}
+    if cfg is None or not cfg.has_section("Watchdog"):
+        return options
+    prefix = stage.lower()
+    options["enabled"] = cfg.getboolean("Watchdog", "enabled", fallback=False)
+    options["time_limit_s"] = cfg.getfloat("Watchdog", f"{prefix}_time_limit_s",
+                                           fallback=cfg.getfloat("Watchdog", "time_limit_s", fallback=300.0))
+    options["memory_limit_mb"] = cfg.getint("Watchdog", f"{prefix}_memory_limit_mb",
+                                            fallback=cfg.getint("Watchdog", "memory_limit_mb", fallback=0))
+    options["retry_cheaper"] = cfg.getboolean("Watchdog", "retry_cheaper", fallback=True)
+    return options
+
+# ----------------------------------------------------------
+# Ausführung mit Grenzen
+# ----------------------------------------------------------
+def _virtual_memory():
+    """Aktuelle Größe des Adressraums in Bytes (Linux), sonst 0."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _is_memory_error(error):
+    return isinstance(error, MemoryError) or any(text in str(error).lower() for text in _MEMORY_ERRORS)
+
+def _child(conn, func, args, memory_limit):
+    if memory_limit and resource is not None:
+        limit = _virtual_memory() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    measuring = tracemalloc.is_tracing()
+    if measuring:
+        tracemalloc.reset_peak()
+    try:
+        value = func(*args)
+        peak = tracemalloc.get_traced_memory()[1] if measuring else 0
+        if isinstance(value, np.ndarray) and segment_fits(value.nbytes):
+            shm, desc = create_segment(value, owner_pid=os.getppid())
+            shm.close()
+            conn.send(("shm", desc, peak))
+        else:
+            conn.send(("ok", value, peak))
+    except Exception as e:
+        conn.send(("memory" if _is_memory_error(e) else "error", str(e), 0))
+    finally:
+        conn.close()
+
+def _run_forked(func, args, time_limit, memory_limit):
+    ctx = multiprocessing.get_context("fork")
+    # Der Kindprozess soll den resource_tracker erben, bei dem take_array sein Segment abmeldet
+    resource_tracker.ensure_running()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child, args=(child_conn, func, args, memory_limit), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(time_limit):
+            process.kill()
+            process.join()
+            remove_segments(process.pid)
+            return "timeout", f"Zeitgrenze von {time_limit:g} s überschritten"
+        try:
+            status, value, peak = parent_conn.recv()
+        except EOFError:
+            process.join()
+            remove_segments(process.pid)
+            # Ohne Antwort beendet: meist vom Betriebssystem wegen Speichermangels
+            return "memory", f"Kindprozess beendet (Exit-Code {process.exitcode})"
+        process.join()
+        if peak:
+            report_peak(peak)
+        if status == "shm":
+            return "ok", take_array(value)
+        return status, value
+    finally:
+        parent_conn.close()
+
+def _run_threaded(func, args, time_limit):
+    box = {}
+    def target():
+        try:
+            box["result"] = ("ok", func(*args))
+        except Exception as e:
+            box["result"] = ("memory" if _is_memory_error(e) else "error", str(e))
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(time_limit)
+    if thread.is_alive():
+        return "timeout", f"Zeitgrenze von {time_limit:g} s überschritten"
+    return box["result"]
+
+def _uses_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def run_guarded(func, args, time_limit, memory_limit_bytes=0):
+    """
+    Führt func(*args) mit Zeit- und Speichergrenze aus.
+
+    :return: (Status, Wert) – Status "ok" (Wert = Ergebnis) oder "timeout", "memory",
+             "error" (Wert = Beschreibung)
+    """
+    if _uses_fork():
+        return _run_forked(func, args, time_limit, memory_limit_bytes)
+    return _run_threaded(func, args, time_limit)
+
+# ----------------------------------------------------------
+# Watchdog einer Stufe
+# ----------------------------------------------------------
+def create_watchdog(stage, options, date_folder, budget=None):
+    """Neuer Watchdog (dict) für eine Stufe; budget liefert die Speicherschätzung."""
+    if options["enabled"]:
+        sweep_stale_segments()
+    if options["enabled"] and not _uses_fork():
+        log_message("Watchdog ohne fork: Zeitgrenze per Thread, Speichergrenze nur geschätzt.", level="info")
+    return {
+        "stage": stage,
+        "options": options,
+        "date_folder": str(date_folder),
+        "budget": budget,
+        "lock": threading.Lock(),
+        "quarantined": [],
+        "recovered": [],
+    }
+
+def guarded_workers(wd, workers):
+    """
+    Anzahl gleichzeitig bearbeiteter Bilder unter dem Watchdog. Mit fork nur eines:
+    fork aus einem Worker-Thread erbt Sperren, die andere Threads gerade halten
+    (Thread-Pool, Zwischenspeicher, sqlite) – das Kind bliebe hängen, liefe in die
+    Zeitgrenze und ein gutes Bild landete in Quarantäne.
+    """
+    if workers > 1 and wd["options"]["enabled"] and _uses_fork():
+        log_message(f"Watchdog aktiv: {wd['stage']} bearbeitet ein Bild zur Zeit statt {workers}.", level="info")
+        return 1
+    return workers
+
+def _quarantine(wd, path, kind, detail):
+    reason = f"{wd['stage']}: {kind} ({detail})"
+    # Eigene Katalogverbindung: guard_image kann aus mehreren Threads aufgerufen werden
+    with wd["lock"]:
+        catalog = open_catalog(wd["date_folder"])
+        try:
+            target = quarantine(catalog, wd["date_folder"], path, reason)
+        finally:
+            catalog.close()
+        wd["quarantined"].append({"path": path, "quarantine": target, "kind": kind, "reason": reason})
+
+def guard_image(wd, path, compute, *args):
+    """
+    Berechnet compute(path, *args) unter den Grenzen der Stufe. Bei Überschreitung
+    wandert das Bild in Quarantäne.
+
+    :return: Ergebnis von compute oder None (Quarantäne); Fehler in compute werden
+             als RuntimeError weitergegeben
+    """
+    options = wd["options"]
+    if not options["enabled"]:
+        return compute(path, *args)
+    memory_limit = options["memory_limit_mb"] * 1024 * 1024
+    if memory_limit and wd["budget"] is not None:
+        estimate = estimate_bytes(wd["budget"], path, wd["stage"])
+        if estimate > memory_limit:
+            _quarantine(wd, path, "memory", f"geschätzt {estimate // (1024 * 1024)} MB > {options['memory_limit_mb']} MB")
+            return None
+    status, value = run_guarded(compute, (path, *args), options["time_limit_s"], memory_limit)
+    if status == "ok":
+        return value
+    if status == "error":
+        raise RuntimeError(value)
+    _quarantine(wd, path, status, value)
+    return None
+
+def retry_quarantined(wd, compute, write):
+    """
+    Versucht die Bilder dieses Laufs aus der Quarantäne erneut – mit compute (einer
+    günstigeren Einstellung) und denselben Grenzen. Gelingt es, schreibt
+    write(ursprünglicher Pfad, Ergebnis) das Bild an den alten Platz zurück.
+
+    :return: Anzahl zurückgeholter Bilder
+    """
+    if not wd["quarantined"] or not wd["options"]["retry_cheaper"]:
+        return 0
+    options = wd["options"]
+    catalog = open_catalog(wd["date_folder"])
+    remaining = []
+    for entry in wd["quarantined"]:
+        log_message(f"Neuer Versuch mit günstiger Einstellung: {shorten_path(entry['path'])}", level="info")
+        status, value = run_guarded(compute, (entry["quarantine"],), options["time_limit_s"],
+                                    options["memory_limit_mb"] * 1024 * 1024)
+        if status == "ok" and write(entry["path"], value):
+            os.remove(entry["quarantine"])
+            forget(catalog, wd["date_folder"], entry["quarantine"])
+            wd["recovered"].append(entry)
+            log_message(f"Mit günstiger Einstellung verarbeitet: {shorten_path(entry['path'])}", level="info")
+        else:
+            entry["retry"] = value if status != "ok" else "Schreiben fehlgeschlagen"
+            remaining.append(entry)
+            log_message(f"Bleibt in Quarantäne: {shorten_path(entry['quarantine'])} ({entry['reason']})",
+                        level="warning")
+    catalog.close()
+    wd["quarantined"] = remaining
+    return len(wd["recovered"])
+
+def watchdog_summary(wd):
+    """Zahlen und verbliebene Quarantäne-Bilder (für den Laufbericht)."""
+    return {
+        "recovered": len(wd["recovered"]),
+        "quarantined": [{"path": e["path"], "quarantine": e["quarantine"], "reason": e["reason"]}
+                        for e in wd["quarantined"]],
+    }
+
+def exit_code(wd):
+    """0, wenn kein Bild in Quarantäne geblieben ist, sonst EXIT_PARTIAL."""
+    return EXIT_PARTIAL if wd["quarantined"] else 0
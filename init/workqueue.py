@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+workqueue.py – Arbeitswarteschlange (SQLite) im Datumsordner für mehrere Worker.
+
+Statt dass ein Prozess einen Datumsordner allein bearbeitet, trägt ein steuernder
+Prozess Aufgaben ein (enqueue) und wartet (wait_for_queue). Beliebig viele Worker –
+auf einem Rechner oder auf mehreren Rechnern mit demselben eingebundenen Laufwerk –
+holen sich Aufgaben per Lease (lease_task), bearbeiten sie und melden das Ergebnis.
+
+Eine Aufgabe ist ein Bild mit einer Folge von Stufen; bearbeitet wird immer die
+aktuelle Stufe (step). Danach wird die Aufgabe für die nächste Stufe wieder
+freigegeben – die Stufen eines Bildes laufen also in Reihenfolge, verschiedene
+Bilder parallel.
+
+  - Lease: ein Worker reserviert eine Aufgabe für lease_seconds; ein Heartbeat-Thread
+    verlängert die Reservierung, solange die Stufe läuft
+  - Fällt ein Worker aus, läuft sein Lease ab und ein anderer Worker übernimmt
+  - Fehler werden bis zu max_attempts-mal wiederholt, danach ist die Aufgabe "failed"
+
+run_local startet Worker-Prozesse auf diesem Rechner und wartet auf sie. Enden alle
+Worker, solange noch Aufgaben offen sind (Absturz, Speichermangel, Importfehler),
+gelten diese als fehlgeschlagen – der steuernde Prozess wartet nicht endlos.
+
+Die Datenbank {Datumsordner}/workqueue.sqlite wird im Rollback-Journal-Modus
+betrieben (WAL setzt gemeinsamen Speicher voraus und funktioniert nicht über
+Netzlaufwerke). Das Dateisystem muss Dateisperren unterstützen (z. B. NFSv4, SMB).
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import subprocess
+from logger import log_message, shorten_path
+
+QUEUE_NAME = "workqueue.sqlite"
+TASK_STATES = ("pending", "leased", "done", "failed")
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    path          TEXT,
+    stages        TEXT,
+    step          INTEGER DEFAULT 0,
+    status        TEXT DEFAULT 'pending',
+    attempts      INTEGER DEFAULT 0,
+    max_attempts  INTEGER,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    last_error    TEXT,
+    updated       REAL,
+    UNIQUE (path, stages)
+)
+"""
+
+# ----------------------------------------------------------
+# Datenbank
+# ----------------------------------------------------------
+def queue_path(date_folder):
+    return os.path.join(str(date_folder), QUEUE_NAME)
+
+def open_queue(date_folder):
+    """Öffnet (bzw. erzeugt) die Warteschlange eines Datumsordners."""
+    conn = sqlite3.connect(queue_path(date_folder), timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute(_SCHEMA)
+    return conn
+
+def default_worker_id():
+    """Eindeutige Kennung eines Workers: Rechnername und Prozess-ID."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _rel_path(date_folder, path):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(date_folder)).replace(os.sep, "/")
+
+# ----------------------------------------------------------
+# Steuernder Prozess
+# ----------------------------------------------------------
+def enqueue(conn, date_folder, paths, stages, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Trägt je Bild eine Aufgabe mit der Stufenfolge stages ein. Bereits eingetragene
+    Kombinationen (Bild, Stufenfolge) werden nicht doppelt angelegt.
+
+    :return: Anzahl neu eingetragener Aufgaben
+    """
+    stages_json = json.dumps(list(stages))
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO tasks (path, stages, max_attempts, updated) VALUES (?, ?, ?, ?)",
+                         [(_rel_path(date_folder, p), stages_json, max_attempts, now) for p in paths])
+        added = conn.total_changes - before
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+def queue_status(conn):
+    """Anzahl Aufgaben je Status (pending, leased, done, failed)."""
+    status = {state: 0 for state in TASK_STATES}
+    for row in conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status"):
+        status[row["status"]] = row["n"]
+    return status
+
+def failed_tasks(conn):
+    """Endgültig fehlgeschlagene Aufgaben mit Stufe und letztem Fehler."""
+    rows = conn.execute("SELECT path, stages, step, attempts, last_error FROM tasks WHERE status = 'failed'")
+    return [dict(row, stage=json.loads(row["stages"])[row["step"]]) for row in rows]
+
+def fail_open_tasks(conn, error):
+    """Markiert alle offenen und reservierten Aufgaben als fehlgeschlagen."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute("UPDATE tasks SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                              "last_error = ?, updated = ? WHERE status IN ('pending', 'leased')",
+                              (str(error)[:500], time.time()))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount
+
+def wait_for_queue(conn, poll_seconds=2.0, timeout=None, alive=None):
+    """
+    Wartet, bis keine Aufgabe mehr offen oder reserviert ist.
+
+    :param alive: alive() – False, sobald kein Worker mehr läuft; dann endet das
+                  Warten auch mit offenen Aufgaben
+    :return: Endstatus (queue_status)
+    """
+    started = time.time()
+    last = None
+    while True:
+        # Erst die Worker prüfen, dann den Status: ein Worker, der gerade die letzte
+        # Aufgabe abschließt und endet, zählt so nicht als ausgefallen
+        running = alive() if alive is not None else True
+        status = queue_status(conn)
+        if status != last:
+            log_message(f"Warteschlange: {status['pending']} offen, {status['leased']} in Arbeit, "
+                        f"{status['done']} fertig, {status['failed']} fehlgeschlagen", level="info")
+            last = status
+        if status["pending"] == 0 and status["leased"] == 0:
+            return status
+        if not running:
+            log_message("Kein Worker läuft mehr, obwohl noch Aufgaben offen sind.", level="error")
+            return status
+        if timeout is not None and time.time() - started > timeout:
+            return status
+        time.sleep(poll_seconds)
+
+def run_local(date_folder, command, workers, env=None, poll_seconds=2.0):
+    """
+    Startet workers lokale Worker-Prozesse (command, ergänzt um "--id <Kennung>") und
+    wartet, bis die Warteschlange leer ist. Enden alle Worker vorher, werden die noch
+    offenen Aufgaben als fehlgeschlagen markiert.
+
+    :return: Endstatus (queue_status) mit den Exit-Codes der Worker unter "exit_codes"
+    """
+    procs = [subprocess.Popen(list(command) + ["--id", f"{default_worker_id()}-{i + 1}"], env=env)
+             for i in range(workers)]
+    conn = open_queue(date_folder)
+    try:
+        final = wait_for_queue(conn, poll_seconds, alive=lambda: any(proc.poll() is None for proc in procs))
+        if final["pending"] or final["leased"]:
+            failed = fail_open_tasks(conn, "Alle Worker beendet, Aufgabe nicht bearbeitet")
+            log_message(f"{failed} offene Aufgaben als fehlgeschlagen markiert.", level="error")
+            final = queue_status(conn)
+    finally:
+        conn.close()
+    final["exit_codes"] = [proc.wait() for proc in procs]
+    for index, code in enumerate(final["exit_codes"]):
+        if code != 0:
+            log_message(f"Worker {index + 1} endete mit Exit-Code {code}.", level="error")
+    return final
+
+# ----------------------------------------------------------
+# Worker
+# ----------------------------------------------------------
+def lease_task(conn, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Reserviert die nächste offene Aufgabe (oder eine mit abgelaufenem Lease).
+
+    :return: Aufgabe (dict mit id, path, stage, step, attempts) oder None
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Abgelaufene Leases nach dem letzten Versuch auf einmal aufgeben
+        conn.execute("UPDATE tasks SET status = 'failed', lease_owner = NULL, lease_expires = NULL, updated = ? "
+                     "WHERE attempts >= max_attempts AND (status = 'pending' "
+                     "OR (status = 'leased' AND lease_expires < ?))", (now, now))
+        row = conn.execute("SELECT * FROM tasks WHERE status = 'pending' "
+                           "OR (status = 'leased' AND lease_expires < ?) ORDER BY step, id LIMIT 1",
+                           (now,)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        if row["status"] == "leased":
+            log_message(f"Lease von {row['lease_owner']} abgelaufen, übernehme {row['path']}", level="warning")
+        attempts = row["attempts"] + 1
+        conn.execute("UPDATE tasks SET status = 'leased', attempts = ?, lease_owner = ?, lease_expires = ?, "
+                     "updated = ? WHERE id = ?", (attempts, worker_id, now + lease_seconds, now, row["id"]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    stages = json.loads(row["stages"])
+    return {"id": row["id"], "path": row["path"], "stage": stages[row["step"]], "step": row["step"],
+            "stages": stages, "attempts": attempts}
+
+def heartbeat(conn, task, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Verlängert das Lease. Liefert False, wenn die Aufgabe nicht mehr diesem Worker gehört."""
+    cursor = conn.execute("UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ? "
+                          "AND status = 'leased'", (time.time() + lease_seconds, time.time(), task["id"], worker_id))
+    return cursor.rowcount == 1
+
+def complete_task(conn, task, worker_id):
+    """Schließt die aktuelle Stufe ab; die Aufgabe wird für die nächste Stufe freigegeben."""
+    next_step = task["step"] + 1
+    done = next_step >= len(task["stages"])
+    conn.execute("UPDATE tasks SET step = ?, status = ?, attempts = 0, lease_owner = NULL, lease_expires = NULL, "
+                 "last_error = NULL, updated = ? WHERE id = ? AND lease_owner = ?",
+                 (task["step"] if done else next_step, "done" if done else "pending", time.time(),
+                  task["id"], worker_id))
+
+def fail_task(conn, task, worker_id, error):
+    """Gibt die Aufgabe nach einem Fehler frei (erneuter Versuch bis max_attempts)."""
+    conn.execute("UPDATE tasks SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                 "lease_owner = NULL, lease_expires = NULL, last_error = ?, updated = ? "
+                 "WHERE id = ? AND lease_owner = ?", (str(error)[:500], time.time(), task["id"], worker_id))
+
+def _heartbeat_loop(date_folder, task, worker_id, lease_seconds, stop):
+    conn = open_queue(date_folder)
+    try:
+        while not stop.wait(lease_seconds / 3):
+            if not heartbeat(conn, task, worker_id, lease_seconds):
+                log_message(f"Lease für {task['path']} verloren.", level="warning")
+                return
+    finally:
+        conn.close()
+
+def run_worker(date_folder, handlers, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               poll_seconds=1.0, exit_when_idle=True):
+    """
+    Bearbeitet Aufgaben, bis die Warteschlange leer ist (bzw. endlos ohne exit_when_idle).
+
+    :param handlers: dict {Stufe: Funktion(Bildpfad, Datumsordner)}; die Funktion löst bei
+                     Fehlern eine Ausnahme aus oder liefert None
+    :return: dict mit Anzahl erledigter und fehlgeschlagener Schritte
+    """
+    worker_id = worker_id or default_worker_id()
+    conn = open_queue(date_folder)
+    counts = {"done": 0, "failed": 0}
+    log_message(f"Worker {worker_id} gestartet auf {shorten_path(str(date_folder))}", level="info")
+    try:
+        while True:
+            task = lease_task(conn, worker_id, lease_seconds)
+            if task is None:
+                status = queue_status(conn)
+                if exit_when_idle and status["pending"] == 0 and status["leased"] == 0:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            stop = threading.Event()
+            beat = threading.Thread(target=_heartbeat_loop,
+                                    args=(date_folder, task, worker_id, lease_seconds, stop), daemon=True)
+            beat.start()
+            try:
+                handler = handlers.get(task["stage"])
+                if handler is None:
+                    raise ValueError(f"Keine Verarbeitung für Stufe '{task['stage']}' registriert")
+                result = handler(os.path.join(str(date_folder), task["path"]), date_folder)
+                if result is None:
+                    raise RuntimeError("Stufe lieferte kein Ergebnis")
+                complete_task(conn, task, worker_id)
+                counts["done"] += 1
+            except Exception as e:
+                log_message(f"{task['stage']} fehlgeschlagen für {task['path']} "
+                            f"(Versuch {task['attempts']}): {e}", level="error")
+                fail_task(conn, task, worker_id, e)
+                counts["failed"] += 1
+            finally:
+                stop.set()
+                beat.join()
+    finally:
+        conn.close()
+    log_message(f"Worker {worker_id} beendet: {counts['done']} Schritte erledigt, "
+                f"{counts['failed']} fehlgeschlagen", level="info")
+    return counts
@@ -3,7 +3,6 @@ import os
 import sys
 import datetime
 import json
-from PIL import Image
 from pathlib import Path
 
 # Pfad zum modules-Verzeichnis hinzufügen
@@ -17,7 +16,9 @@ sys.path.append(init_directory)  # DIESE ZEILE HINZUFÜGEN
 # Module importieren
 try:
     from logger import log_message, log_separator, shorten_path, init_logger
-    from utils import load_start_config, get_output_format, get_folders_mapping
+    from utils import load_start_config, load_settings_ini, get_output_format, get_folders_mapping
+    from catalog import open_catalog, catalog_file, catalog_copy, quarantine, summary
+    from backends import load_backend_options, choose_backend
 except ImportError as e:
     print(f"Fehler beim Importieren von Modulen: {e}")
     sys.exit(1)
@@ -94,6 +95,21 @@ for file in files_to_convert:
         file_dict[file_ext] = []
     file_dict[file_ext].append(new_path)
 
+# Kopfdaten aller Eingangsdateien im Katalog erfassen (ohne Dekodieren);
+# beschädigte Dateien kommen vor der Konvertierung in die Quarantäne
+log_separator()
+log_message("Erfasse Kopfdaten im Katalog:", level="info")
+catalog = open_catalog(base_folder)
+for file_ext, files in file_dict.items():
+    intact_files = []
+    for file_path in files:
+        entry = catalog_file(catalog, base_folder, file_path)
+        if entry["status"] == "corrupt":
+            quarantine(catalog, base_folder, file_path, entry["error"])
+            continue
+        intact_files.append(file_path)
+    file_dict[file_ext] = intact_files
+
 # Ausgabeordner erstellen
 output_folder = os.path.join(base_folder, f"02-{output_format.strip('.')}")
 os.makedirs(output_folder, exist_ok=True)
@@ -104,6 +120,8 @@ log_message(f"Starte Konvertierung nach {output_format.upper()}", level="info")
 
 # Ordnerzuordnungen holen
 folders_mapping = get_folders_mapping()
+# Bild-Engine aus [Backend] der settings.ini
+backend_options = load_backend_options(load_settings_ini())
 
 for file_ext, files in file_dict.items():
     for file_path in files:
@@ -112,10 +130,11 @@ for file_ext, files in file_dict.items():
         output_path = os.path.join(output_folder, output_file)
 
         try:
-            # Bild konvertieren
-            with Image.open(file_path) as img:
-                img.save(output_path, output_format.strip(".").upper())
+            # Bild konvertieren (PIL; große Bilder bedarfsgesteuert mit libvips, falls installiert)
+            backend = choose_backend(backend_options, file_path, default="pil")
+            backend["write"](backend["open"](file_path), output_path)
             log_message(f"  - {file_name} -> {output_file} erfolgreich konvertiert", level="info")
+            output_entry = catalog_file(catalog, base_folder, output_path, check=False)
             
             # Bild in alle 03-Ordner kopieren
             for folder_key, folder_name in folders_mapping.items():
@@ -124,11 +143,17 @@ for file_ext, files in file_dict.items():
                     target_path = os.path.join(target_folder, output_file)
                     import shutil
                     shutil.copy2(output_path, target_path)
+                    catalog_copy(catalog, base_folder, output_entry, target_path)
                     log_message(f"  - {output_file} -> {shorten_path(target_folder)} kopiert", level="info")
                 
         except Exception as e:
             log_message(f"  - {file_name} Fehler: {e}", level="error")
 
+catalog_stats = summary(catalog)
+catalog.close()
+log_message(f"Katalog: {catalog_stats['images']} Bilder, davon {catalog_stats['with_alpha']} mit Alphakanal, "
+            f"{catalog_stats['status'].get('quarantined', 0)} in Quarantäne", level="info")
+
 log_separator()
 log_message(f"Alle konvertierten Dateien wurden gespeichert in\n'{shorten_path(output_folder)}'.", level="info")
 log_message("Bilder wurden in alle 03-Ordner kopiert", level="info")
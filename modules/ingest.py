@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+ingest.py – Eingangsbilder in einem Durchgang einlesen und konvertieren.
+
+Ersetzt prepareInput und convert: bisher wurde jede Eingangsdatei nach 01-<ext>
+kopiert und dort für Katalog und Konvertierung noch zweimal gelesen. ingest
+
+  1. durchsucht die Quelle (entrancepath bzw. den Datumsordner) genau einmal,
+  2. liest jede Datei genau einmal (vorausgelesen im Lese-Pool der E/A-Pipeline),
+  3. erfasst Kopf, Prüfsumme und Integrität aus diesem Puffer im Katalog,
+  4. konvertiert aus demselben Puffer nach 02-<Format> und kopiert das Ergebnis in
+     vorhandene 03-Ordner (Schreib-Pool; Kopien per reflink/Kernel-Kopie).
+
+Liegt eine Datei bereits im Ausgabeformat vor (PNG → PNG), wird sie nicht neu
+kodiert, sondern nach einer günstigen Prüfung (Signatur, Kopf, Dateiende, optional
+CRC aller PNG-Chunks) unverändert nach 02-<Format> durchgereicht (reflink/Kopie).
+Neu kodiert wird nur, wenn eine Normalisierung nötig ist: anderes Format, mehr als
+8 Bit je Kanal, ein Modus außerhalb von passthrough_modes oder – mit
+strip_metadata – Metadaten in der Datei. Der Weg je Datei steht im Manifest
+("method") und im Laufbericht ("methods", "reencode_reasons").
+
+Die Originale bleiben standardmäßig an ihrem Platz; ingest_manifest.json im
+Datumsordner verweist auf sie (Quelle, Prüfsumme, Ergebnis). Mit
+"layout": "copy" entstehen wie bisher die Ordner 01-<ext> mit Kopien der Originale.
+Liegen die Eingangsdateien direkt im Datumsordner (kein entrancepath), werden sie
+wie bei convert nach 01-<ext> verschoben.
+
+zip- und tar-Archive (auch .tar.gz/.tgz, .tar.bz2, .tar.xz) in der Quelle – oder
+ein Archiv als Quelle selbst – werden ohne Entpacken auf die Platte eingelesen:
+zip über das zentrale Verzeichnis (jedes Bildmitglied einzeln im Lese-Pool),
+tar fortlaufend in einem Durchgang (komprimierte Archive als Datenstrom).
+Andere Mitglieder werden übersprungen, ohne ihre Daten zu lesen bzw. zu puffern.
+Im Speicher liegen höchstens so viele Bilder wie die E/A-Pipeline vorausliest
+([IO] read_ahead), unabhängig von der Größe des Archivs. Das Archiv selbst bleibt
+das Original; das Manifest verweist auf "<Archiv>!/<Mitglied>".
+
+Einstellungen: start.json, Abschnitt "ingest" ("layout": "manifest" oder "copy",
+"recursive": Unterordner der Quelle mit einlesen, "archives": Archive einlesen,
+"passthrough", "verify_crc", "strip_metadata", "passthrough_modes").
+
+Aufruf: python modules/ingest.py <Datumsordner> [Quelle (Ordner oder Archiv)]
+"""
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import tarfile
+import zipfile
+import itertools
+from types import SimpleNamespace
+from pathlib import Path
+from PIL import Image
+
+# Pfad zum modules- und init-Verzeichnis hinzufügen
+script_directory = os.path.dirname(os.path.abspath(__file__))
+base_directory = os.path.dirname(script_directory)
+sys.path.append(script_directory)
+sys.path.append(os.path.join(base_directory, "init"))
+
+# Module importieren
+try:
+    from logger import log_message, log_separator, shorten_path, init_logger
+    from utils import load_start_config, load_settings_ini, get_output_format, get_folders_mapping
+    from catalog import open_catalog, catalog_data, catalog_copy, quarantine, summary
+    from iopipeline import run_pipeline, load_io_options
+    from linkcopy import place_file
+    from safewrite import atomic_write_bytes, pil_save_params, write_params
+    from imgio import decode, encode
+    from report import stage_counter, count, write_stage_report
+    from backends import BACKENDS, load_backend_options, vips_available
+except ImportError as e:
+    print(f"Fehler beim Importieren von Modulen: {e}")
+    sys.exit(1)
+
+SUPPORTED_FORMATS = {".webp", ".bmp", ".jpg", ".jpeg", ".png", ".tiff"}
+MANIFEST_NAME = "ingest_manifest.json"
+LAYOUTS = ("manifest", "copy")
+METHODS = ("passthrough", "reencode", "stream")
+ZIP_EXTENSIONS = (".zip",)
+# Unkomprimierte tar-Archive werden mit Sprüngen über die Mitglieder gelesen,
+# komprimierte als fortlaufender Datenstrom
+TAR_EXTENSIONS = (".tar",)
+TAR_STREAM_EXTENSIONS = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Metadaten, die strip_metadata entfernt: PNG-Chunks bzw. JPEG-Marker
+# (APP1 Exif/XMP, APP2 ICC, APP13 IPTC, COM; APP0 JFIF und APP14 Adobe bleiben)
+_PNG_METADATA = {b"tEXt", b"zTXt", b"iTXt", b"eXIf", b"iCCP", b"tIME"}
+_JPEG_METADATA = {0xE1, 0xE2, 0xED, 0xFE}
+# PIL-Modi mit mehr als 8 Bit je Kanal bzw. mit nur einem Grauwert je Pixel
+_DEEP_MODES = ("I;16", "I;16B", "I;16L", "I", "F")
+_GRAY_MODES = ("1", "L", "LA", "La") + _DEEP_MODES
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_ingest_options(start_config):
+    """Liest den Abschnitt "ingest" aus der start.json."""
+    options = {"layout": "manifest", "recursive": True, "archives": True, "passthrough": True, "verify_crc": True,
+               "strip_metadata": False, "passthrough_modes": ["L", "LA", "RGB", "RGBA", "P"]}
+    options.update(start_config.get("ingest", {}))
+    if options["layout"] not in LAYOUTS:
+        log_message(f"Unbekanntes Layout '{options['layout']}' – verwende 'manifest'.", level="warning")
+        options["layout"] = "manifest"
+    return options
+
+# ----------------------------------------------------------
+# Durchsuchen
+# ----------------------------------------------------------
+def is_archive(path):
+    return str(path).lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS + TAR_STREAM_EXTENSIONS)
+
+def scan_source(source_folder, recursive=True, exclude=(), archives=True):
+    """
+    Durchsucht die Quelle einmal und liefert die Bilddateien samt os.stat
+    (sortiert nach Pfad) und die gefundenen Archive. Ordner in exclude (z. B. der
+    Datumsordner) werden ausgelassen; ist die Quelle selbst ein Archiv, wird nur
+    dieses geliefert.
+
+    :return: (Bilddateien, Archivpfade)
+    """
+    items, found = [], []
+    if os.path.isfile(source_folder):
+        return items, [str(source_folder)] if archives and is_archive(source_folder) else []
+    exclude = {os.path.abspath(folder) for folder in exclude}
+    pending = [str(source_folder)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and os.path.abspath(entry.path) not in exclude:
+                        pending.append(entry.path)
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in SUPPORTED_FORMATS and entry.is_file():
+                    items.append({"path": entry.path, "source": os.path.abspath(entry.path), "name": entry.name,
+                                  "ext": ext, "stat": entry.stat()})
+                elif archives and is_archive(entry.name) and entry.is_file():
+                    found.append(entry.path)
+    items.sort(key=lambda item: item["path"])
+    return items, sorted(found)
+
+# ----------------------------------------------------------
+# Archive
+# ----------------------------------------------------------
+def _member_item(archive_path, name, size, mtime, **fields):
+    """Eintrag für ein Archivmitglied (wie scan_source; stat nur mit Größe und Zeit)."""
+    source = f"{os.path.abspath(archive_path)}!/{name}"
+    item = {"path": source, "source": source, "archive": archive_path, "member": name,
+            "name": os.path.basename(name), "ext": os.path.splitext(name)[1].lower(),
+            "stat": SimpleNamespace(st_size=size, st_mtime=mtime)}
+    item.update(fields)
+    return item
+
+def archive_items(archive_path, handles, errors):
+    """
+    Bildmitglieder eines Archivs als Einträge, nacheinander erzeugt (Generator).
+
+    zip: Einträge aus dem zentralen Verzeichnis; gelesen wird erst im Lese-Pool
+    (read_source), das geöffnete Archiv landet in handles. tar: ein Durchgang
+    durch das Archiv, die Daten jedes Bildmitglieds werden beim Erzeugen gelesen
+    ("data") – die begrenzte Warteschlange der Pipeline hält den Durchgang an.
+    Andere Mitglieder werden übersprungen, ohne ihre Daten zu lesen.
+    Fehler beim Öffnen bzw. Durchlaufen landen in errors (Pfad, Meldung).
+    """
+    lower = archive_path.lower()
+    try:
+        if lower.endswith(ZIP_EXTENSIONS):
+            archive = zipfile.ZipFile(archive_path)
+            handles.append(archive)
+            for info in archive.infolist():
+                ext = os.path.splitext(info.filename)[1].lower()
+                if info.is_dir() or ext not in SUPPORTED_FORMATS:
+                    continue
+                yield _member_item(archive_path, info.filename, info.file_size,
+                                   time.mktime(info.date_time + (0, 0, -1)), zip=archive)
+            return
+        with tarfile.open(archive_path, "r:" if lower.endswith(TAR_EXTENSIONS) else "r|*") as archive:
+            for member in archive:
+                # Bereits gelesene Köpfe nicht sammeln (Speicher bleibt begrenzt)
+                archive.members = []
+                ext = os.path.splitext(member.name)[1].lower()
+                if not member.isfile() or ext not in SUPPORTED_FORMATS:
+                    continue
+                data = archive.extractfile(member).read()
+                yield _member_item(archive_path, member.name, member.size, member.mtime, data=data)
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+        log_message(f"  - Archiv {os.path.basename(archive_path)} nicht lesbar: {e}", level="error")
+        errors.append((archive_path, str(e)))
+
+def unique_name(name, used):
+    """Dateiname, der in used noch nicht vorkommt (name_1, name_2, ...); wird in used eingetragen."""
+    base, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate.lower() in used:
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+def place_originals(items, date_folder, move=False):
+    """
+    Legt die Originale in 01-<ext> ab: verschieben (move) oder kopieren ohne
+    Umweg über Python (reflink/Kernel-Kopie, siehe linkcopy).
+    """
+    used = {}
+    for item in items:
+        folder = os.path.join(date_folder, f"01-{item['ext'].strip('.')}")
+        os.makedirs(folder, exist_ok=True)
+        if folder not in used:
+            used[folder] = {name.lower() for name in os.listdir(folder)}
+        target = os.path.join(folder, unique_name(item["name"], used[folder]))
+        if move:
+            os.replace(item["path"], target)
+            item["path"], item["stat"] = target, os.stat(target)
+            log_message(f"  - {item['name']} -> {shorten_path(folder)} (verschoben)", level="info")
+        else:
+            place_file(item["path"], target)
+            log_message(f"  - {item['name']} -> {shorten_path(folder)} (kopiert)", level="info")
+        item["original"] = target
+
+# ----------------------------------------------------------
+# Durchreichen
+# ----------------------------------------------------------
+def png_chunks(data, verify_crc=False):
+    """
+    Chunk-Typen einer PNG-Datei (bytes) in Dateireihenfolge, ohne zu dekodieren.
+
+    :param verify_crc: CRC jedes Chunks prüfen
+    :raises: ValueError bei abgeschnittenen Chunks oder falscher CRC
+    """
+    view = memoryview(data)
+    offset, chunks = len(_PNG_SIGNATURE), []
+    while offset + 12 <= len(data):
+        length, chunk_type = struct.unpack_from(">I4s", data, offset)
+        end = offset + 8 + length
+        if end + 4 > len(data):
+            raise ValueError(f"PNG-Chunk {chunk_type!r} abgeschnitten")
+        if verify_crc and zlib.crc32(view[offset + 4:end]) != struct.unpack_from(">I", data, end)[0]:
+            raise ValueError(f"PNG-Chunk {chunk_type.decode('latin-1')} mit falscher CRC")
+        chunks.append(chunk_type)
+        if chunk_type == b"IEND":
+            break
+        offset = end + 4
+    return chunks
+
+def jpeg_markers(data):
+    """Marker der JPEG-Segmente bis zum Beginn der Bilddaten (SOS)."""
+    offset, markers = 2, []
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise ValueError("JPEG-Segment ohne Marker")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        markers.append(marker)
+        if marker == 0xDA:
+            break
+        offset += 2 + struct.unpack_from(">H", data, offset + 2)[0]
+    return markers
+
+def has_metadata(data, info):
+    """True, wenn die Datei Metadaten enthält, die strip_metadata entfernt (andere Formate: immer)."""
+    if info["format"] == "PNG":
+        return bool(_PNG_METADATA.intersection(png_chunks(data)))
+    if info["format"] == "JPEG":
+        return bool(_JPEG_METADATA.intersection(jpeg_markers(data)))
+    return True
+
+def reencode_reason(entry, data, output_format, options):
+    """
+    Grund, warum eine Datei neu kodiert werden muss, oder None, wenn sie unverändert
+    durchgereicht werden kann.
+
+    :return: "disabled", "format", "bit_depth", "mode", "metadata", "crc" oder None
+    """
+    if not options["passthrough"]:
+        return "disabled"
+    if entry.get("format") != Image.registered_extensions().get(output_format):
+        return "format"
+    if (entry.get("bit_depth") or 8) > 8:
+        return "bit_depth"
+    if entry.get("mode") not in options["passthrough_modes"]:
+        return "mode"
+    try:
+        if entry["format"] == "PNG" and options["verify_crc"]:
+            png_chunks(data, verify_crc=True)
+        if options["strip_metadata"] and has_metadata(data, entry):
+            return "metadata"
+    except (ValueError, struct.error):
+        return "crc"
+    return None
+
+# ----------------------------------------------------------
+# Konvertieren
+# ----------------------------------------------------------
+def read_source(item):
+    if "data" in item:
+        return item.pop("data")
+    if "zip" in item:
+        return item["zip"].read(item["member"])
+    with open(item["path"], "rb") as f:
+        return f.read()
+
+def encode_image(data, output_path, options=None, info=None):
+    """
+    Konvertiert Dateidaten (bytes) in das Format von output_path. Normalisiert wird über
+    imgio: mehr als 8 Bit je Kanal auf 8 Bit, Modi außerhalb von passthrough_modes nach
+    BGR(A), Grau bzw. Grau + Alpha. Alle übrigen Bilder schreibt PIL (siehe unten).
+
+    :param info: Kopfdaten (catalog), für die Bittiefe
+    """
+    options = options or load_ingest_options({})
+    ext = os.path.splitext(output_path)[1].lower()
+    buffer = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as img:
+        # LAB hat einen Kanal "A", aber keine Transparenz
+        has_transparency = ("A" in img.getbands() and img.mode != "LAB") or "transparency" in img.info
+        deep = img.mode in _DEEP_MODES or (info and (info.get("bit_depth") or 8) > 8)
+        if deep or img.mode not in options["passthrough_modes"]:
+            gray = img.mode in _GRAY_MODES
+            layout = ("gray_alpha" if gray else "bgra") if has_transparency else ("gray" if gray else "color")
+            pixels = decode(data, layout)
+            encoded = encode(pixels, ext, write_params(output_path)) if pixels is not None else None
+            if encoded is not None:
+                return encoded
+            # Nur wenn OpenCV die Datei nicht dekodieren kann: Umwandlung in PIL
+            if img.mode not in options["passthrough_modes"]:
+                img = img.convert("RGBA" if has_transparency else "L" if gray else "RGB")
+        # Modus bleibt erhalten: PIL reicht Palette ("P") und Metadaten (ICC-Profil)
+        # unverändert durch, die bei imgio (OpenCV) verloren gingen
+        params = pil_save_params(output_path)
+        if options["strip_metadata"]:
+            params["icc_profile"] = None
+        img.save(buffer, Image.registered_extensions()[ext], **params)
+    return buffer.getvalue()
+
+def write_output(item, result, collation_folders):
+    """Schreibt das Ergebnis nach 02-<Format> und stellt es in den 03-Ordnern bereit."""
+    output_path, encoded, method = result
+    if method == "passthrough" and encoded is None:
+        # Bytes unverändert übernehmen (reflink/Kernel-Kopie, ohne Umweg über Python)
+        place_file(item["path"], output_path)
+    elif method == "stream":
+        # Große Bilder: libvips liest die Quelle bedarfsgesteuert und schreibt direkt
+        vips = BACKENDS["vips"]
+        vips["write"](vips["open"](item["path"]), output_path)
+    else:
+        atomic_write_bytes(output_path, encoded)
+    copies = []
+    for folder in collation_folders:
+        target_path = os.path.join(folder, os.path.basename(output_path))
+        place_file(output_path, target_path)
+        copies.append(target_path)
+    return method, encoded, copies
+
+def ingest(date_folder, source_folder, start_config=None, cfg=None):
+    """
+    Liest die Quelle ein, konvertiert in das Ausgabeformat und schreibt Manifest,
+    Katalog und Laufbericht.
+
+    :param cfg: geladene settings.ini ([IO], [Backend]); Standard: load_settings_ini()
+    :return: Zähler der Stufe (siehe report)
+    """
+    start_config = load_start_config() if start_config is None else start_config
+    cfg = load_settings_ini() if cfg is None else cfg
+    options = load_ingest_options(start_config)
+    date_folder, source_folder = str(date_folder), str(source_folder)
+    in_place = os.path.abspath(source_folder) == os.path.abspath(date_folder)
+
+    output_format = get_output_format()
+    if not output_format.startswith("."):
+        output_format = "." + output_format
+    output_format = output_format.lower()
+
+    # 1. Einmal durchsuchen (im Datumsordner selbst nur die oberste Ebene)
+    items, archives = scan_source(source_folder, recursive=options["recursive"] and not in_place,
+                                  exclude=[date_folder], archives=options["archives"])
+    if not items and not archives:
+        log_message(f"Keine konvertierbaren Dateien in '{shorten_path(source_folder)}' gefunden.", level="info")
+        return None
+    log_message(f"{len(items)} Eingangsdateien und {len(archives)} Archive in {shorten_path(source_folder)} "
+                f"gefunden.", level="info")
+
+    layout = "copy" if in_place else options["layout"]
+    if layout == "copy":
+        log_separator()
+        log_message("Sortiere Dateien:", level="info")
+        place_originals(items, date_folder, move=in_place)
+
+    output_folder = os.path.join(date_folder, f"02-{output_format.strip('.')}")
+    os.makedirs(output_folder, exist_ok=True)
+    collation_folders = [os.path.join(date_folder, f"03-{name}") for name in get_folders_mapping().values()]
+    collation_folders = [folder for folder in collation_folders if os.path.isdir(folder)]
+    used_names = {name.lower() for name in os.listdir(output_folder)}
+
+    def named(sources):
+        # Ausgabenamen erst beim Einlesen vergeben: Archivmitglieder sind vorab unbekannt
+        for item in sources:
+            item["output"] = os.path.join(output_folder,
+                                          unique_name(os.path.splitext(item["name"])[0] + output_format, used_names))
+            yield item
+
+    backend_options = load_backend_options(cfg)
+    catalog = open_catalog(date_folder)
+    counter = stage_counter("Ingest")
+    methods = {method: 0 for method in METHODS}
+    reencode_reasons = {}
+    manifest = []
+
+    def record(item, status, entry=None, error=None, method=None):
+        manifest.append({
+            "source": item["source"],
+            "original": os.path.relpath(item["original"], date_folder) if item.get("original") else None,
+            "output": os.path.relpath(item["output"], date_folder) if status == "converted" else None,
+            "format": entry.get("format") if entry else None,
+            "size": item["stat"].st_size,
+            "sha256": entry.get("sha256") if entry else None,
+            "status": status,
+            "method": method,
+            "error": error,
+        })
+
+    def convert(item, data, error):
+        # Kopf, Prüfsumme und Integrität aus dem gelesenen Puffer (Katalog nur in diesem Thread)
+        if error is not None:
+            log_message(f"  - {item['name']} Fehler beim Lesen: {error}", level="error")
+            count(counter, "failed")
+            record(item, "failed", error=str(error))
+            return None
+        entry = catalog_data(catalog, date_folder, item["path"], data, stat=item["stat"])
+        item["entry"] = entry
+        if entry["status"] == "corrupt":
+            # Nur eigene Kopien wandern in Quarantäne, Originale bleiben unangetastet
+            if item.get("original"):
+                item["original"] = quarantine(catalog, date_folder, item["path"], entry["error"])
+            else:
+                log_message(f"  - {item['name']} beschädigt, übersprungen: {entry['error']}", level="warning")
+            count(counter, "skipped", "corrupt")
+            record(item, "corrupt", entry, entry["error"])
+            return None
+        reason = reencode_reason(entry, data, output_format, options)
+        if reason is None:
+            # Archivmitglieder liegen nicht als Datei vor: die gelesenen Bytes schreiben
+            return item["output"], data if "archive" in item else None, "passthrough"
+        reencode_reasons[reason] = reencode_reasons.get(reason, 0) + 1
+        megapixels = (entry.get("width") or 0) * (entry.get("height") or 0) / 1e6
+        if vips_available() and megapixels >= backend_options["streaming_megapixels"] and "archive" not in item:
+            return item["output"], None, "stream"
+        try:
+            return item["output"], encode_image(data, item["output"], options, entry), "reencode"
+        except Exception as e:
+            log_message(f"  - {item['name']} Fehler: {e}", level="error")
+            count(counter, "failed")
+            record(item, "failed", entry, str(e))
+            return None
+
+    def written(item, value, error):
+        if error is not None:
+            log_message(f"  - {item['name']} Fehler: {error}", level="error")
+            count(counter, "failed")
+            record(item, "failed", item.get("entry"), str(error))
+            return
+        method, encoded, copies = value
+        if method == "passthrough":
+            # Identische Bytes: Eintrag der Quelle übernehmen statt erneut zu lesen
+            output_entry = catalog_copy(catalog, date_folder, item["entry"], item["output"])
+        else:
+            if encoded is None:
+                with open(item["output"], "rb") as f:
+                    encoded = f.read()
+            output_entry = catalog_data(catalog, date_folder, item["output"], encoded, check=False)
+        for target_path in copies:
+            catalog_copy(catalog, date_folder, output_entry, target_path)
+        action = "unverändert übernommen" if method == "passthrough" else "erfolgreich konvertiert"
+        log_message(f"  - {item['name']} -> {os.path.basename(item['output'])} {action}", level="info")
+        methods[method] += 1
+        count(counter, "written")
+        record(item, "converted", item["entry"], method=method)
+
+    if layout == "copy" and not in_place:
+        # Lesen, Katalog und Quarantäne beziehen sich auf die Kopie in 01-<ext>
+        for item in items:
+            item["path"], item["stat"] = item["original"], os.stat(item["original"])
+
+    log_separator()
+    log_message(f"Starte Konvertierung nach {output_format.upper()}", level="info")
+    handles, archive_errors = [], []
+    sources = itertools.chain(items, *(archive_items(path, handles, archive_errors) for path in archives))
+    try:
+        io_metrics = run_pipeline(named(sources), read_source, convert,
+                                  lambda item, result: write_output(item, result, collation_folders),
+                                  written, load_io_options(cfg))
+    finally:
+        for handle in handles:
+            handle.close()
+    for archive_path, error in archive_errors:
+        count(counter, "failed")
+        manifest.append({"source": os.path.abspath(archive_path), "original": None, "output": None,
+                         "format": None, "size": os.path.getsize(archive_path), "sha256": None,
+                         "status": "failed", "method": None, "error": error})
+
+    manifest_path = os.path.join(date_folder, MANIFEST_NAME)
+    atomic_write_bytes(manifest_path, json.dumps({
+        "version": 1, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "source": os.path.abspath(source_folder),
+        "layout": layout, "output_format": output_format, "files": manifest,
+    }, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    catalog_stats = summary(catalog)
+    catalog.close()
+    write_stage_report(date_folder, counter, {"layout": layout, "archives": len(archives), "methods": methods,
+                                              "reencode_reasons": reencode_reasons, "io": io_metrics})
+    log_message(f"Katalog: {catalog_stats['images']} Bilder, davon {catalog_stats['with_alpha']} mit Alphakanal, "
+                f"{catalog_stats['status'].get('quarantined', 0)} in Quarantäne", level="info")
+    log_message(f"Manifest: {shorten_path(manifest_path)}", level="info")
+    return counter
+
+def load_manifest(date_folder):
+    """Manifest eines Datumsordners (dict) oder None."""
+    try:
+        with open(os.path.join(date_folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    init_logger(base_folder)
+    log_message(f"{os.path.basename(__file__)} gestartet mit Zielordner: {shorten_path(base_folder)}", level="info")
+
+    start_config = load_start_config()
+    entrance_path = start_config.get("folder", {}).get("entrancepath")
+    if len(sys.argv) > 2:
+        entrance_path = sys.argv[2]
+    source_folder = Path(entrance_path if entrance_path else base_folder)
+    if not source_folder.exists():
+        log_message(f"Fehler: Das Eingangsverzeichnis '{source_folder}' existiert nicht.", level="error")
+        sys.exit(1)
+
+    counter = ingest(base_folder, source_folder, start_config)
+    log_separator()
+    sys.exit(1 if counter and counter["failed"] else 0)
@@ -10,10 +10,13 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 base_dir = os.path.dirname(script_dir)
 modules_dir = os.path.join(base_dir, "modules")  # Korrigiert von "mdouls" zu "modules"
 sys.path.append(modules_dir)
+sys.path.append(os.path.join(base_dir, "init"))
 
 try:
     from logger import log_message, log_separator, shorten_path
     from utils import load_json_config, find_latest_date_folder
+    # Exit-Code eines Skripts, das fertig ist, aber Bilder in Quarantäne lassen musste
+    from report import EXIT_PARTIAL
 except ImportError as e:
     print(f"Fehler beim Importieren von Modulen: {e}")
     sys.exit(1)
@@ -25,7 +28,7 @@ def run_spelling_script(script_name, target_folder, enabled=True):
     :param script_name: Name des auszuführenden Skripts (ohne .py)
     :param target_folder: Zielordner, auf dem das Skript ausgeführt werden soll
     :param enabled: Gibt an, ob das Skript ausgeführt werden soll
-    :return: True bei Erfolg, False bei Fehlern
+    :return: True bei Erfolg, False bei Fehlern, "partial" bei Bildern in Quarantäne
     """
     if not enabled:
         log_message(f"Skript {script_name} ist deaktiviert. Wird übersprungen.", level="info")
@@ -44,6 +47,9 @@ def run_spelling_script(script_name, target_folder, enabled=True):
         log_message(f"Skript {script_name}.py erfolgreich ausgeführt", level="info")
         return True
     except subprocess.CalledProcessError as e:
+        if e.returncode == EXIT_PARTIAL:
+            log_message(f"Skript {script_name}.py beendet, einzelne Bilder in Quarantäne", level="warning")
+            return "partial"
         log_message(f"Fehler bei der Ausführung von {script_name}.py: {e}", level="error")
         return False
 
@@ -83,6 +89,7 @@ def main():
     target_folder = find_latest_date_folder(working_dir) if os.path.isdir(working_dir) else working_dir
     
     # Führe die aktivierten Skripte aus
+    results = []
     for script_config in spelling_config:
         script_name = script_config.get("name")
         enabled = script_config.get("enabled", False)
@@ -94,10 +101,15 @@ def main():
         log_message(f"Verarbeite Skript: {script_name} (aktiviert: {enabled})", level="info")
         
         if enabled:
-            run_spelling_script(script_name, target_folder, enabled=True)
+            results.append(run_spelling_script(script_name, target_folder, enabled=True))
     
     log_separator()
     log_message("Spelling-Verarbeitung abgeschlossen", level="info")
+    if False in results:
+        return 1
+    if "partial" in results:
+        return EXIT_PARTIAL
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
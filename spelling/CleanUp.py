@@ -1,4 +1,5 @@
 import os
+import sys
 import configparser
 import numpy as np
 import cv2
@@ -7,6 +8,17 @@ from pathlib import Path
 from _logger import log_message, shorten_path  # Zentrale Logging-Funktion und Hilfsfunktion
 from _utils import load_settings_ini, get_output_format, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (Grob-zu-fein-Masken)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from multires import select_component
+from safewrite import atomic_imwrite
+from imgio import read, to_layout, color_view, has_alpha
+from report import stage_counter, count, write_stage_report
+from catalog import open_catalog
+from derived import load_derived_cache, content_key, derive, get_gray
+from iopipeline import run_pipeline, load_io_options
+from presets import apply_preset
+
 # -------------------------------------------------------------------
 # Hilfsfunktion: Collation-Ordner suchen
 # -------------------------------------------------------------------
@@ -41,7 +53,7 @@ def find_all_images_in_directory(directory):
 # -------------------------------------------------------------------
 # Funktion: Bild bereinigen – Hauptobjekt isolieren
 # -------------------------------------------------------------------
-def process_image(image_path, tolerance_lower, tolerance_upper):
+def process_image(image_path, tolerance_lower, tolerance_upper, img=None):
     """
     Öffnet ein Bild, sucht per binärer Segmentierung (mittels cv2.inRange)
     das größte zusammenhängende Objekt (oder das Objekt am Seedpunkt in der Bildmitte)
@@ -50,58 +62,53 @@ def process_image(image_path, tolerance_lower, tolerance_upper):
     :param image_path: Pfad zum zu verarbeitenden Bild.
     :param tolerance_lower: Untere Grenze der Intensitätswerte.
     :param tolerance_upper: Obere Grenze der Intensitätswerte.
-    :return: Das bereinigte Bild (als BGRA), oder None bei Fehlern.
+    :param img: bereits gelesenes Bild (z. B. aus der E/A-Pipeline); sonst wird gelesen.
+    :return: (bereinigtes Bild als BGRA, geändert) – geändert ist False, wenn das Objekt
+             bereits alle sichtbaren Pixel umfasst; bei Fehlern bzw. ohne passendes
+             Objekt (None, "failed") bzw. (None, "no_object").
     """
     log_message(f"Verarbeite Bild: {shorten_path(image_path)}", level="info")
-    img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    key = content_key(image_path, catalog, latest_date_folder)
+    if img is None:
+        img = read(image_path, "color")
     if img is None:
         log_message(f"Fehler beim Laden des Bildes: {shorten_path(image_path)}", level="error")
-        return None
+        return None, "failed"
 
-    # Sicherstellen, dass ein Alpha-Kanal vorhanden ist
-    if len(img.shape) == 2:
-        img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-        alpha_channel = np.full(img.shape, 255, dtype=np.uint8)
-        img = cv2.merge([img_color[:,:,0], img_color[:,:,1], img_color[:,:,2], alpha_channel])
-    elif img.shape[2] == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-    # Falls bereits BGRA, keine Änderung nötig
+    # Sicherstellen, dass ein Alpha-Kanal vorhanden ist (BGRA ohne Kopie übernommen)
+    had_alpha = has_alpha(img)
+    img = to_layout(img, "bgra")
 
     # Umrechnung in Graustufen (nur für BGR, ohne Alpha)
-    bgr = img[:, :, :3]
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    gray = get_gray(derived_cache, key, color_view(img))
 
-    # Erzeuge eine binäre Maske mittels cv2.inRange mit den angegebenen Toleranzwerten
-    mask = cv2.inRange(gray, tolerance_lower, tolerance_upper)
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
-    if num_labels <= 1:
-        log_message(f"Keine zusammenhängenden Objekte im Bild gefunden: {shorten_path(image_path)}", level="warning")
-        return None
-
-    # Ermittele den Seedpunkt (Mitte des Bildes) und bestimme, welchem Objekt dieser angehört.
+    # Seedpunkt (Mitte des Bildes): liegt dort ein Objekt, wird dieses gewählt,
+    # ansonsten das größte Objekt. Mit mask_pyramid_level > 0 wird das Objekt zuerst
+    # auf der groben Stufe gesucht und nur in dessen Rahmen exakt gelabelt.
     h, w = gray.shape
     center = (w // 2, h // 2)
-    seed_label = labels[center[1], center[0]]
-    if seed_label != 0:
-        chosen_label = seed_label
-    else:
-        areas = stats[1:, cv2.CC_STAT_AREA]  # Hintergrund (Label 0) wird ignoriert
-        if areas.size == 0:
-            log_message(f"Keine gültigen Objekte gefunden im Bild: {shorten_path(image_path)}", level="warning")
-            return None
-        chosen_label = np.argmax(areas) + 1  # +1, da Hintergrund ausgeschlossen
+    # Erzeuge eine binäre Maske mittels cv2.inRange mit den angegebenen Toleranzwerten;
+    # für identische Bilder wird die Auswahl aus dem Ableitungsspeicher übernommen
+    selection = derive(derived_cache, key, "cleanup_component",
+                       (tolerance_lower, tolerance_upper, mask_pyramid_level),
+                       lambda: select_component(cv2.inRange(gray, tolerance_lower, tolerance_upper),
+                                                level=mask_pyramid_level, seed=center))
+    if selection is None:
+        log_message(f"Keine zusammenhängenden Objekte im Bild gefunden: {shorten_path(image_path)}", level="warning")
+        return None, "no_object"
 
-    # Erzeuge eine Binärmaske, die genau das gewählte Objekt markiert
-    component_mask = (labels == chosen_label).astype(np.uint8) * 255
-    area = stats[chosen_label, cv2.CC_STAT_AREA]
+    (x0, y0, x1, y1), component, area = selection
     if area < extract_size:
         log_message(f"Extrahiertes Objekt zu klein ({area} Pixel): {shorten_path(image_path)}", level="warning")
-        return None
+        return None, "no_object"
 
-    # Alle Bereiche außerhalb des Hauptobjekts werden entfernt (Alpha auf 0 setzen)
-    remove_mask = cv2.bitwise_not(component_mask)
-    img[:, :, 3] = np.where(remove_mask == 255, 0, img[:, :, 3])
-    return img
+    # Alle Bereiche außerhalb des Hauptobjekts werden entfernt (Alpha auf 0 setzen);
+    # gearbeitet wird nur im Begrenzungsrahmen des Objekts
+    alpha = np.zeros((h, w), dtype=np.uint8)
+    alpha[y0:y1, x0:x1] = np.where(component, img[y0:y1, x0:x1, 3], 0)
+    changed = not (had_alpha and np.array_equal(alpha, img[:, :, 3]))
+    img[:, :, 3] = alpha
+    return img, changed
 
 # -------------------------------------------------------------------
 # STARTRUTINE
@@ -117,6 +124,8 @@ if __name__ == "__main__":
 
     # 2. SETTINGS.INI laden
     config = load_settings_ini()
+    # Voreinstellung aus start.json (draft, balanced, quality) übernehmen
+    apply_preset(config)
     log_message("Lade settings.ini", level="info")
 
     # 3. Ausgabeformat ermitteln
@@ -146,6 +155,10 @@ if __name__ == "__main__":
     extract_size    = get_int("Settings", "extractsize", 10)
     tolerance_lower = get_int("CleanUp", "tolerance_lower", 100)
     tolerance_upper = get_int("CleanUp", "tolerance_upper", 150)
+    # Grob-zu-fein-Maske: 0 = volle Auflösung, 2 = Objektsuche auf 1/4 der Auflösung
+    mask_pyramid_level = get_int("Settings", "mask_pyramid_level", 0)
+    # Speicher für Graustufen und Objektauswahl identischer Bilder (auch stufenübergreifend)
+    derived_cache = load_derived_cache(config, latest_date_folder)
 
     # Definition der akzeptierten Schalterwerte
     valueOn = ["true", "1", "yes", "on"]
@@ -204,13 +217,41 @@ if __name__ == "__main__":
     # -------------------------------------------------------------------
     # Verarbeitung der Bilder in den gefundenen (aktivierten) Collation-Ordnern
     # -------------------------------------------------------------------
+    counter = stage_counter("CleanUp")
+    image_files = []
     for folder_key, folder_path in collation_folders.items():
         log_message(f"Verarbeite Ordner: {shorten_path(folder_path)}", level="info")
-        image_files = find_all_images_in_directory(folder_path)
-        for image_file in image_files:
-            processed_img = process_image(image_file, tolerance_lower, tolerance_upper)
-            if processed_img is not None:
-                if cv2.imwrite(image_file, processed_img):
-                    log_message(f"Überschrieben: {shorten_path(image_file)}", level="info")
-                else:
-                    log_message(f"Fehler beim Überschreiben von: {shorten_path(image_file)}", level="error")
+        image_files.extend(find_all_images_in_directory(folder_path))
+
+    # Lesen und Schreiben laufen über die E/A-Pipeline parallel zur Bereinigung
+    def clean(image_file, img, error):
+        processed_img, outcome = process_image(image_file, tolerance_lower, tolerance_upper, img)
+        if processed_img is None:
+            if outcome == "failed":
+                count(counter, "failed")
+            else:
+                count(counter, "skipped", outcome)
+            return None
+        if not outcome:
+            # Das Objekt umfasst bereits alle sichtbaren Pixel – nicht neu schreiben
+            log_message(f"Unverändert: {shorten_path(image_file)}", level="info")
+            count(counter, "unchanged")
+            return None
+        return processed_img
+
+    def written(image_file, ok, error):
+        if ok:
+            log_message(f"Überschrieben: {shorten_path(image_file)}", level="info")
+            count(counter, "written")
+        else:
+            log_message(f"Fehler beim Überschreiben von: {shorten_path(image_file)}", level="error")
+            count(counter, "failed")
+
+    catalog = open_catalog(latest_date_folder)
+    try:
+        io_metrics = run_pipeline(image_files, lambda path: read(path, "color"), clean,
+                                  atomic_imwrite, written, load_io_options(config))
+    finally:
+        catalog.close()
+
+    write_stage_report(latest_date_folder, counter, {"io": io_metrics})
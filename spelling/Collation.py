@@ -1,9 +1,149 @@
 import os
+import sys
+import json
 import shutil
 import re
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from _logger import log_message, shorten_path  # Zentrale Logging-Funktion und Hilfsfunktion
 from _utils import load_settings_ini, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (Sprite-Atlanten, Links)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from atlas import atlas_stem
+from linkcopy import place_file
+
+# Verfahren: copy (physische Kopien), link (Reflink/Kernel-Kopie, optional Hardlink) oder
+# manifest (nur manifest.json, keine Dateien)
+COLLATION_MODES = ("copy", "link", "manifest")
+MANIFEST_NAME = "manifest.json"
+
+# Einmal kompilierte Muster für Skalierungsordner (x25) und -suffixe (_x25)
+_SCALE_FOLDER = re.compile(r'^x\d+$', re.IGNORECASE)
+_SCALE_SUFFIX = re.compile(r'_x(\d+)$', re.IGNORECASE)
+
+def plan_collation(out_folder):
+    """
+    Ermittelt alle Dateien eines Output-Folders, die nach "+Collation" gehören.
+
+    Gleichnamige Dateien aus verschiedenen Unterordnern (a.png und sub/a.png) landen
+    am selben Ziel; wie beim früheren sequenziellen Kopieren gilt die zuletzt
+    gefundene. Jedes Ziel kommt so nur einmal vor – parallele Threads schreiben nie
+    dieselbe Datei, und Manifest bzw. Export enthalten keine doppelten Pfade.
+
+    :return: Liste von (Quellpfad, Zielpfad relativ zu "+Collation")
+    """
+    plan = {}
+    # Rekursiver Durchlauf über out_folder (den +Collation-Ordner dabei überspringen)
+    for root, dirs, files in os.walk(out_folder):
+        if "+Collation" in dirs:
+            dirs.remove("+Collation")
+        rel_root = os.path.relpath(root, out_folder)
+        first_component = rel_root.split(os.sep)[0] if rel_root != "." else None
+        for file in files:
+            stem = atlas_stem(file)
+            if not (file.lower().endswith(".png") or stem):
+                continue
+            target_subfolder = None
+            # 1. Prüfe, ob die Datei in einem Unterordner liegt, dessen Name exakt "x" gefolgt von Ziffern ist.
+            if first_component and _SCALE_FOLDER.match(first_component):
+                target_subfolder = first_component
+            else:
+                # 2. Falls nicht, prüfe, ob der Dateiname (ohne Extension) ein Muster wie _x25, _x50, etc. enthält.
+                m = _SCALE_SUFFIX.search(stem or os.path.splitext(file)[0])
+                if m:
+                    target_subfolder = "x" + m.group(1)
+            target = os.path.join(target_subfolder, file) if target_subfolder else file
+            src = os.path.join(root, file)
+            if target in plan:
+                log_message(f"{shorten_path(plan[target])} wird in +Collation durch {shorten_path(src)} ersetzt "
+                            f"(gleicher Zielname {target})", level="warning")
+            plan[target] = src
+    return [(src, target) for target, src in plan.items()]
+
+def write_manifest(collation_dir, out_folder, entries, mode):
+    """
+    Schreibt "+Collation/manifest.json" mit allen Einträgen
+    (Ziel relativ zu "+Collation", Quelle relativ zum Output-Folder, Größe, Verfahren).
+    """
+    manifest = {
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "output_folder": os.path.basename(out_folder),
+        "mode": mode,
+        "files": entries,
+    }
+    manifest_path = os.path.join(collation_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    log_message(f"Manifest geschrieben: {shorten_path(manifest_path)} ({len(entries)} Dateien)", level="info")
+    return manifest_path
+
+def collate_folder(out_folder, mode="copy", allow_hardlink=False, workers=None):
+    """
+    Füllt den "+Collation"-Ordner eines Output-Folders.
+
+    :param mode: "copy" (shutil.copy2), "link" (Reflink bzw. Kernel-Kopie, Hardlink nur mit
+                 allow_hardlink) oder "manifest" (nur manifest.json, Dateien bleiben an Ort und Stelle)
+    :param workers: Anzahl paralleler Threads für link/copy (None = automatisch)
+    :return: Anzahl bereitgestellter Dateien
+    """
+    collation_dir = os.path.join(out_folder, "+Collation")
+    os.makedirs(collation_dir, exist_ok=True)
+    log_message(f"Verwende +Collation-Ordner: {shorten_path(collation_dir)} (Verfahren: {mode})", level="info")
+
+    plan = plan_collation(out_folder)
+    # Zielordner einmalig anlegen
+    for subfolder in {os.path.dirname(target) for _, target in plan} - {""}:
+        if mode != "manifest":
+            os.makedirs(os.path.join(collation_dir, subfolder), exist_ok=True)
+
+    def place(item):
+        src, target = item
+        target_file = os.path.join(collation_dir, target)
+        try:
+            if mode == "link":
+                method = place_file(src, target_file, allow_hardlink=allow_hardlink)
+            else:
+                shutil.copy2(src, target_file)
+                method = "copy"
+            log_message(f"Kopiere {shorten_path(src)} in {shorten_path(os.path.dirname(target_file))} ({method})", level="info")
+            return method
+        except Exception as e:
+            log_message(f"Fehler beim Kopieren von {shorten_path(src)} nach {shorten_path(target_file)}: {str(e)}", level="error")
+            return None
+
+    if mode == "manifest":
+        methods = ["manifest"] * len(plan)
+    elif plan:
+        with ThreadPoolExecutor(max_workers=workers or min(16, (os.cpu_count() or 1) * 2)) as pool:
+            methods = list(pool.map(place, plan))
+    else:
+        methods = []
+
+    entries = []
+    for (src, target), method in zip(plan, methods):
+        if method is None:
+            continue
+        entries.append({
+            "path": target.replace(os.sep, "/"),
+            "source": os.path.relpath(src, out_folder).replace(os.sep, "/"),
+            "size": os.path.getsize(src),
+            "method": method,
+        })
+    if mode != "copy":
+        write_manifest(collation_dir, out_folder, entries, mode)
+    else:
+        # Ein Manifest aus einem früheren link-/manifest-Lauf würde Export auf
+        # veraltete Einträge statt auf die kopierten Dateien verweisen
+        stale_manifest = os.path.join(collation_dir, MANIFEST_NAME)
+        if os.path.exists(stale_manifest):
+            os.remove(stale_manifest)
+    return len(entries)
+
 def create_collation_folders():
     """
     Erstellt in allen definierten Output-Foldern (z. B. TransBack, Enhancement, Whitepaper, Enhancwhite, EierKucehn, ...)
@@ -17,6 +157,11 @@ def create_collation_folders():
         nach einem Muster wie "_x25", "_x50", etc. gesucht. Trifft dieses zu, wird die Datei in einen entsprechenden
         Unterordner innerhalb von "+Collation" kopiert.
       - Alle übrigen PNG-Dateien werden direkt in den "+Collation"-Ordner kopiert.
+      - Sprite-Atlanten ({name}.atlas.png/.json/.csv) werden vollständig kopiert; für das
+        Muster "_x25" usw. zählt der Name ohne Atlas-Endung.
+
+    Statt physischer Kopien kann der Abschnitt [Collation] der settings.ini Links bzw. nur ein
+    Manifest anfordern (mode = copy | link | manifest, siehe collate_folder).
 
     Wichtig: Es wird geprüft, ob mindestens ein Output-Folder (output_foldes_collationX) existiert. Falls nicht,
     wird ein Fehlerblock ausgegeben.
@@ -53,47 +198,18 @@ def create_collation_folders():
         # Hier kann alternativ auch eine Exception ausgelöst oder das Skript beendet werden:
         return
 
+    # Verfahren aus der settings.ini
+    mode = config.get("Collation", "mode", fallback="copy").strip().lower()
+    if mode not in COLLATION_MODES:
+        log_message(f"Ungültiges Collation-Verfahren '{mode}', verwende copy.", level="warning")
+        mode = "copy"
+    allow_hardlink = config.getboolean("Collation", "hardlink", fallback=False)
+    workers = config.getint("Collation", "workers", fallback=0) or None
+
     # Bearbeitung jedes gefundenen Output-Folders
     for out_folder in output_folders:
-        # Erstelle den +Collation-Ordner in diesem Output-Folder
-        collation_dir = os.path.join(out_folder, "+Collation")
-        os.makedirs(collation_dir, exist_ok=True)
-        log_message(f"Verwende +Collation-Ordner: {shorten_path(collation_dir)}", level="info")
-
-        # Rekursiver Durchlauf über out_folder (den +Collation-Ordner dabei überspringen)
-        for root, dirs, files in os.walk(out_folder):
-            if "+Collation" in dirs:
-                dirs.remove("+Collation")
-            for file in files:
-                if file.lower().endswith(".png"):
-                    file_path = os.path.join(root, file)
-                    # Bestimme den relativen Pfad zum Output-Folder
-                    rel_path = os.path.relpath(file_path, out_folder)
-                    path_components = rel_path.split(os.sep)
-
-                    target_subfolder = None
-                    # 1. Prüfe, ob die Datei in einem Unterordner liegt, dessen Name exakt "x" gefolgt von Ziffern ist.
-                    if len(path_components) > 1 and re.match(r'^x\d+$', path_components[0], re.IGNORECASE):
-                        target_subfolder = path_components[0]
-                    else:
-                        # 2. Falls nicht, prüfe, ob der Dateiname (ohne Extension) ein Muster wie _x25, _x50, etc. enthält.
-                        base_name = os.path.splitext(file)[0]
-                        m = re.search(r'_x(\d+)$', base_name, re.IGNORECASE)
-                        if m:
-                            target_subfolder = "x" + m.group(1)
-
-                    if target_subfolder:
-                        target_subdir = os.path.join(collation_dir, target_subfolder)
-                        os.makedirs(target_subdir, exist_ok=True)
-                        target_file = os.path.join(target_subdir, file)
-                        log_message(f"Kopiere {shorten_path(file_path)} in {shorten_path(target_subdir)}", level="info")
-                    else:
-                        target_file = os.path.join(collation_dir, file)
-                        log_message(f"Kopiere {shorten_path(file_path)} in {shorten_path(collation_dir)}", level="info")
-                    try:
-                        shutil.copy2(file_path, target_file)
-                    except Exception as e:
-                        log_message(f"Fehler beim Kopieren von {shorten_path(file_path)} nach {shorten_path(target_file)}: {str(e)}", level="error")
+        count = collate_folder(out_folder, mode=mode, allow_hardlink=allow_hardlink, workers=workers)
+        log_message(f"{count} Dateien in {shorten_path(out_folder)} zusammengestellt.", level="info")
 
 if __name__ == "__main__":
     create_collation_folders()
@@ -30,19 +30,40 @@
 #     Niedrigere Werte =   dunkleres Bild.
 # ----------------------------------------------------------
 import os
+import sys
 import configparser
 import numpy as np
 import cv2
-from PIL import Image, ImageEnhance
 from pathlib import Path
 from _logger import log_message, shorten_path  # Zentrale Logging-Funktion und Hilfsfunktion
 from _utils import load_settings_ini, get_output_format, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (punktweise Operationen)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init"))
+from pointops import apply_ops, build_stage_ops, fused_followers, fused_chain, mark_applied, ops_params
+from catalog import open_catalog
+from membudget import create_budget, load_budget_bytes, run_with_budget, budget_summary
+from safewrite import atomic_imwrite
+from watchdog import (load_watchdog_options, create_watchdog, guarded_workers, guard_image, retry_quarantined,
+                      watchdog_summary, exit_code)
+from report import stage_counter, count, write_stage_report
+from resultcache import open_result_cache, cached_call, close_result_cache
+from presets import apply_preset, kmeans_settings
+from threads import load_thread_options, plan_workers, apply_thread_budget
+
 # -------------------------------------------------------------------
 # Benutzerdefinierter Filter (ersetzt den alten dark_threshold-Ansatz)
 # -------------------------------------------------------------------
-def apply_custom_filter(image_path):
-    """Wendet den benutzerdefinierten Filter auf ein Bild an."""
+def apply_custom_filter(image_path, point_ops, settings=None):
+    """
+    Wendet den benutzerdefinierten Filter auf ein Bild an und liefert das Ergebnis als BGR-Array.
+
+    :param point_ops: Punktweise Abschluss-Operationen (Kontrast, Helligkeit und ggf.
+                      direkt folgende punktweise Stufen, siehe pointops).
+    :param settings: Filtereinstellungen (Standard: SETTINGS; CHEAP_SETTINGS für den
+                     Wiederholungsversuch nach einer Quarantäne).
+    """
+    settings = settings or SETTINGS
     # Bild mit OpenCV laden
     img = cv2.imread(image_path)
     if img is None:
@@ -52,21 +73,22 @@ def apply_custom_filter(image_path):
     # Farbquantisierung (Color Clustering) mittels K-Means
     Z = img.reshape((-1, 3))
     Z = np.float32(Z)
-    K = SETTINGS["color_levels"]
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-    attempts = 10
+    K = settings["color_levels"]
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, settings["kmeans_max_iter"],
+                settings["kmeans_epsilon"])
+    attempts = settings["kmeans_attempts"]
     _, labels, centers = cv2.kmeans(Z, K, None, criteria, attempts, cv2.KMEANS_RANDOM_CENTERS)
     centers = np.uint8(centers)
     quantized = centers[labels.flatten()]
     quantized = quantized.reshape(img.shape)
 
     # Erhöhe den Abstraktionsgrad durch mehrfache bilaterale Filterung
-    for _ in range(SETTINGS["abstraction_degree"]):
+    for _ in range(settings["abstraction_degree"]):
         quantized = cv2.bilateralFilter(quantized, d=9, sigmaColor=75, sigmaSpace=75)
 
     # Kanten erkennen; hier wird "accuracy" zur Anpassung der Schwellwerte genutzt
-    threshold1 = max(1, int(50 // SETTINGS["accuracy"]))
-    threshold2 = max(1, int(150 // SETTINGS["accuracy"]))
+    threshold1 = max(1, int(50 // settings["accuracy"]))
+    threshold2 = max(1, int(150 // settings["accuracy"]))
     edges = cv2.Canny(quantized, threshold1=threshold1, threshold2=threshold2)
     # Kanten invertieren und in den Farbraum konvertieren
     edges_colored = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
@@ -74,21 +96,17 @@ def apply_custom_filter(image_path):
 
     # Kombiniere das quantisierte Bild mit den invertierten Kanten,
     # wobei "edge_weight" das Mischungsverhältnis bestimmt
-    combined = cv2.addWeighted(quantized, 1 - SETTINGS["edge_weight"],
-                               edges_inverted, SETTINGS["edge_weight"], 0)
+    combined = cv2.addWeighted(quantized, 1 - settings["edge_weight"],
+                               edges_inverted, settings["edge_weight"], 0)
 
     # Subtiles Rauschen (Papierkorn) hinzufügen
-    noise = np.random.normal(0, SETTINGS["noise_intensity"], combined.shape).astype(np.uint8)
+    noise = np.random.normal(0, settings["noise_intensity"], combined.shape).astype(np.uint8)
     textured = cv2.addWeighted(combined, 0.95, noise, 0.05, 0)
 
-    # Konvertiere zurück zu PIL
-    final_image = Image.fromarray(textured)
-
-    # Helligkeit und Kontrast feinjustieren
-    enhancer = ImageEnhance.Contrast(final_image)
-    final_image = enhancer.enhance(SETTINGS["contrast"])
-    enhancer = ImageEnhance.Brightness(final_image)
-    final_image = enhancer.enhance(SETTINGS["brightness"])
+    # Helligkeit und Kontrast feinjustieren (wie ImageEnhance, aber als eine
+    # verknüpfte Punktoperation in place – inkl. zusammengefasster Folgestufen)
+    final_image = cv2.cvtColor(textured, cv2.COLOR_RGB2BGR)
+    apply_ops(final_image, point_ops)
 
     return final_image
 
@@ -121,6 +139,8 @@ latest_date_folder = find_latest_date_folder(base_dir)
 
 # 2. SETTINGS.INI laden (über _utils.py)
 config = load_settings_ini()
+# Voreinstellung aus start.json (draft, balanced, quality) übernehmen
+apply_preset(config)
 log_message("Lade settings.ini", level="info")
 
 # 3. Ausgabeformat ermitteln (über _utils.py)
@@ -161,8 +181,14 @@ SETTINGS = {
     "noise_intensity": noise_intensity,
     "edge_weight": edge_weight,
     "contrast": contrast,
-    "brightness": brightness
+    "brightness": brightness,
 }
+# k-Means: Durchläufe, Iterationen und Abbruchgenauigkeit (Voreinstellung bzw. INI)
+SETTINGS["kmeans_attempts"], SETTINGS["kmeans_max_iter"], SETTINGS["kmeans_epsilon"] = kmeans_settings(config)
+# Günstige Einstellung für Bilder, die eine Grenze des Watchdogs überschritten haben:
+# ein k-Means-Durchlauf mit wenigen Iterationen, nur eine bilaterale Filterung
+CHEAP_SETTINGS = dict(SETTINGS, kmeans_attempts=1, kmeans_max_iter=20, kmeans_epsilon=1.0,
+                      abstraction_degree=min(abstraction_degree, 1))
 
 # 5. Output-Folder Collation aus settings.ini lesen
 output_foldes_collation2 = config.get("Settings", "output_foldes_collation2", fallback="Enhancement")
@@ -186,6 +212,14 @@ collation_folder7 = find_collation_folder(latest_date_folder, target_collation_f
 # Nur existierende Ordner in die Liste aufnehmen
 collation_folder_list = [folder for folder in [collation_folder2, collation_folder4, collation_folder5, collation_folder7] if folder is not None]
 
+# Collation-Schlüssel je Ordner (für die Zusammenfassung punktweiser Folgestufen)
+collation_keys = {
+    collation_folder2: "output_foldes_collation2",
+    collation_folder4: "output_foldes_collation4",
+    collation_folder5: "output_foldes_collation5",
+    collation_folder7: "output_foldes_collation7",
+}
+
 if not collation_folder_list:
     log_message("Keine gültigen Collation-Ordner gefunden. Skript wird beendet.", level="info")
     exit(0)
@@ -210,21 +244,103 @@ log_message("==============================================================\n",
 # -------------------------------------------------------------------
 processed_files = 0
 
+# Speicherbudget und Anzahl gleichzeitig bearbeiteter Bilder (settings.ini)
+memory_budget = create_budget(load_budget_bytes(config), "Enhancement")
+thread_options = load_thread_options(config)
+# Die Bilder laufen in Threads dieses Prozesses: nur Aufteilungen im Modus "threads"
+enhancement_workers, _ = plan_workers("Enhancement", max(0, get_int("Settings", "enhancement_workers", 1)),
+                                      thread_options, modes=("threads",))
+# Zeit- und Speichergrenze je Bild; Ausreißer wandern in Quarantäne
+watchdog = create_watchdog("Enhancement", load_watchdog_options(config, "Enhancement"),
+                           latest_date_folder, memory_budget)
+# Der Watchdog forkt je Bild: dann kein paralleles Bearbeiten in Threads
+enhancement_workers = guarded_workers(watchdog, enhancement_workers)
+# k-Means und bilateralFilter laufen mehrfädig in OpenCV: Kerne auf die Worker aufteilen
+apply_thread_budget("threads" if enhancement_workers > 1 else "serial", enhancement_workers, thread_options)
+counter = stage_counter("Enhancement")
+cheap_ops = {}
+# Laufübergreifender Ergebnisspeicher ([ResultCache]): gleiche Eingabe + gleiche Einstellungen
+result_cache = open_result_cache(config)
+# Bei Änderungen am Filter erhöhen, damit alte Ergebnisse nicht mehr verwendet werden
+RESULT_VERSION = 1
+# Mit angewendete Folgestufen {Stufe: Operationen} je geschriebenem Bild (Vermerk im
+# Katalog am Ende, die Katalogverbindung bleibt im Hauptthread)
+fused_paths = {}
+
 # Es werden ausschließlich Bilder innerhalb der gefundenen Collation-Ordner verarbeitet.
 for current_folder in collation_folder_list:
-    for root, dirs, files in os.walk(current_folder):
-        for file in files:
-            if file.lower().endswith(output_format):
-                input_path = os.path.join(root, file)
-                # Da die Bilder ersetzt werden, wird der Output-Pfad exakt derselbe sein wie der Input-Pfad.
-                output_path = os.path.join(root, file)
-                log_message(f"Verarbeite Datei: {file}", level="info")
-                try:
-                    final_image = apply_custom_filter(input_path)
-                    final_image.save(output_path)
-                    log_message(f"Erfolgreich verarbeitet: {file}", level="info")
-                    processed_files += 1
-                except Exception as e:
-                    log_message(f"Fehler bei {file}: {str(e)}", level="error")
+    # Kontrast/Helligkeit plus direkt folgende punktweise Stufen für diesen Ordner
+    followers = {}
+    for follower in fused_followers("Enhancement", collation_keys[current_folder]):
+        log_message(f"Punktweise Stufe '{follower}' wird mit Enhancement zusammengefasst", level="info")
+        followers[follower] = build_stage_ops(follower, config)
+    point_ops = fused_chain(build_stage_ops("Enhancement", config), followers)
+
+    # Schlüssel im Ergebnisspeicher: Filtereinstellungen plus alle punktweisen Operationen
+    result_params = {"settings": SETTINGS, "ops": ops_params(point_ops)}
+
+    def enhance(path, point_ops=point_ops):
+        final_image = guard_image(watchdog, path, apply_custom_filter, point_ops)
+        if final_image is None:
+            # Quarantäne: kein Ergebnis, wird nicht gespeichert
+            return None
+        if not atomic_imwrite(path, final_image):
+            raise IOError("Bild konnte nicht gespeichert werden.")
+        return True
+
+    def process_file(input_path, point_ops=point_ops, followers=followers, result_params=result_params,
+                     enhance=enhance):
+        # Da die Bilder ersetzt werden, wird der Output-Pfad exakt derselbe sein wie der Input-Pfad.
+        file = os.path.basename(input_path)
+        log_message(f"Verarbeite Datei: {file}", level="info")
+        try:
+            result, hit = cached_call(result_cache, "Enhancement", RESULT_VERSION, result_params,
+                                      input_path, enhance)
+            if result is None:
+                count(counter, "skipped", "quarantined")
+                cheap_ops[input_path] = (point_ops, followers)
+                return False
+            if hit:
+                log_message(f"Ergebnis aus dem Ergebnisspeicher übernommen: {file}", level="info")
+            else:
+                log_message(f"Erfolgreich verarbeitet: {file}", level="info")
+            if followers:
+                fused_paths[input_path] = followers
+            count(counter, "written")
+            return True
+        except Exception as e:
+            log_message(f"Fehler bei {file}: {str(e)}", level="error")
+            count(counter, "failed")
+            return False
+
+    input_paths = [os.path.join(root, file)
+                   for root, dirs, files in os.walk(current_folder)
+                   for file in files if file.lower().endswith(output_format)]
+    # Parallel nur so viele Bilder, wie das Speicherbudget zulässt (k-Means braucht
+    # ein Vielfaches der Bildgröße)
+    results = run_with_budget(memory_budget, input_paths, process_file, max_workers=enhancement_workers)
+    processed_files += sum(1 for ok in results if ok)
+
+# Bilder aus der Quarantäne mit günstiger Einstellung erneut versuchen
+quarantined_paths = {entry["quarantine"]: entry["path"] for entry in watchdog["quarantined"]}
+recovered = retry_quarantined(
+    watchdog,
+    lambda path: apply_custom_filter(path, cheap_ops[quarantined_paths[path]][0], CHEAP_SETTINGS),
+    atomic_imwrite)
+processed_files += recovered
+for entry in watchdog["recovered"]:
+    if cheap_ops[entry["path"]][1]:
+        fused_paths[entry["path"]] = cheap_ops[entry["path"]][1]
+
+# Folgestufen (z. B. SwapColors) überspringen nur die hier vermerkten Bilder
+if fused_paths:
+    catalog = open_catalog(latest_date_folder)
+    for path, followers in fused_paths.items():
+        mark_applied(catalog, latest_date_folder, followers, path)
+    catalog.close()
 
+log_message(budget_summary(memory_budget), level="info")
+write_stage_report(latest_date_folder, counter, {"watchdog": watchdog_summary(watchdog),
+                                                 "result_cache": close_result_cache(result_cache)})
 log_message(f"Verarbeitung abgeschlossen! {processed_files} Bilder verarbeitet.", level="info")
+sys.exit(exit_code(watchdog))
@@ -0,0 +1,132 @@
+"""
+Export.py – packt die Ergebnisse eines Laufs in Archive für die Weitergabe.
+
+Je Sammlung (ein 03-[Collation]-Ordner bzw. dessen +Collation) entsteht im Ordner
+04-Export ein Archivsatz aus wenigen großen Dateien statt zehntausender kleiner PNGs:
+  {Datumsordner}_{Sammlung}_001.zip (bzw. .tar), ggf. weitere Teile
+  {Datumsordner}_{Sammlung}.manifest.json und .sha256 (Prüfsummen)
+
+Einstellungen stehen in settings.ini unter [Export].
+Abhängigkeiten: archive.py (Archive schreiben), utils.py (INI lesen), logger.py (Logging).
+"""
+import os
+import sys
+import json
+from pathlib import Path
+from _logger import log_message, shorten_path
+from _utils import load_settings_ini, find_latest_date_folder
+
+# Pfad zum init-Verzeichnis hinzufügen (Archive)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from archive import ARCHIVE_FORMATS, open_archive_set, add_file, close_archive_set
+
+EXPORT_SOURCES = ("collation", "folders")
+
+def collect_files(folder, source):
+    """
+    Liefert (Pfad, Archivname) aller zu exportierenden Dateien einer Sammlung,
+    sortiert nach Änderungszeit (zuerst fertiggestellte Bilder zuerst).
+
+      - "collation": Inhalt von +Collation; liegt dort ein manifest.json (Collation im
+                     Modus link/manifest), werden die Einträge daraus übernommen
+      - "folders":   der gesamte 03-Ordner ohne +Collation
+    """
+    files = []
+    if source == "collation":
+        collation_dir = os.path.join(folder, "+Collation")
+        manifest_path = os.path.join(collation_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            for entry in manifest.get("files", []):
+                files.append((os.path.join(folder, entry["source"]), entry["path"]))
+        elif os.path.isdir(collation_dir):
+            for root, _, names in os.walk(collation_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, collation_dir)))
+    else:
+        for root, dirs, names in os.walk(folder):
+            if "+Collation" in dirs:
+                dirs.remove("+Collation")
+            for name in names:
+                path = os.path.join(root, name)
+                files.append((path, os.path.relpath(path, folder)))
+    files = [(path, arcname) for path, arcname in files if os.path.isfile(path)]
+    files.sort(key=lambda item: (os.path.getmtime(item[0]), item[1]))
+    return files
+
+def export_folder(folder, output_dir, name, source="collation", fmt="zip", split_bytes=0):
+    """
+    Schreibt eine Sammlung als Archivsatz nach output_dir.
+
+    :return: Anzahl exportierter Dateien
+    """
+    files = collect_files(folder, source)
+    if not files:
+        log_message(f"Keine Dateien zum Exportieren in {shorten_path(folder)} ({source}).", level="info")
+        return 0
+
+    log_message(f"Exportiere {len(files)} Dateien aus {shorten_path(folder)}", level="info")
+    state = open_archive_set(output_dir, name, fmt=fmt, split_bytes=split_bytes)
+    exported = 0
+    for path, arcname in files:
+        try:
+            add_file(state, path, arcname)
+            exported += 1
+        except Exception as e:
+            log_message(f"Fehler beim Archivieren von {shorten_path(path)}: {str(e)}", level="error")
+    close_archive_set(state, extra={"source_folder": os.path.basename(folder), "source": source})
+    return exported
+
+def main():
+    # Datumsordner: als Argument übergeben oder der neueste im Arbeitsverzeichnis
+    if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]):
+        date_folder = sys.argv[1]
+    else:
+        date_folder = find_latest_date_folder(os.getcwd())
+    if not date_folder:
+        log_message("Kein Datumsordner gefunden. Export wird beendet.", level="error")
+        return
+
+    config = load_settings_ini()
+    fmt = config.get("Export", "format", fallback="zip").strip().lower()
+    if fmt not in ARCHIVE_FORMATS:
+        log_message(f"Ungültiges Archivformat '{fmt}', verwende zip.", level="warning")
+        fmt = "zip"
+    source = config.get("Export", "source", fallback="collation").strip().lower()
+    if source not in EXPORT_SOURCES:
+        log_message(f"Ungültige Exportquelle '{source}', verwende collation.", level="warning")
+        source = "collation"
+    split_bytes = config.getint("Export", "split_size_mb", fallback=0) * 1024 * 1024
+    output_dir = os.path.join(date_folder, config.get("Export", "output_folder", fallback="04-Export"))
+
+    # Sammlungen: alle output_foldes_collationX oder nur die unter [Export] folders genannten
+    selected = [f.strip() for f in config.get("Export", "folders", fallback="").split(",") if f.strip()]
+    collections = []
+    for key in config.options("Settings"):
+        if key.startswith("output_foldes_collation"):
+            folder_name = config.get("Settings", key)
+            if selected and folder_name not in selected:
+                continue
+            folder = os.path.join(date_folder, f"03-{folder_name}")
+            if os.path.isdir(folder):
+                collections.append((folder_name, folder))
+            else:
+                log_message(f"Collation-Ordner '03-{folder_name}' nicht gefunden in {shorten_path(date_folder)}.", level="info")
+
+    if not collections:
+        log_message("Keine Ordner zum Exportieren gefunden. Export wird beendet.", level="warning")
+        return
+
+    log_message(f"Export: {fmt}, Quelle {source}, Teilung {split_bytes // (1024 * 1024) or 'aus'} MB, "
+                f"Ziel {shorten_path(output_dir)}", level="info")
+    date_name = os.path.basename(os.path.normpath(date_folder))
+    total = 0
+    for folder_name, folder in collections:
+        total += export_folder(folder, output_dir, f"{date_name}_{folder_name}", source=source,
+                               fmt=fmt, split_bytes=split_bytes)
+    log_message(f"Export abgeschlossen! {total} Dateien archiviert.", level="info")
+
+if __name__ == "__main__":
+    main()
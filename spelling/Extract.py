@@ -1,12 +1,21 @@
 import os
+import sys
 import configparser
 import numpy as np
-import cv2
 from PIL import Image, ImageEnhance
 from pathlib import Path
 from _logger import log_message, shorten_path  # Zentrale Logging-Funktion und Hilfsfunktion
 from _utils import load_settings_ini, get_output_format, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (gemeinsame Objektextraktion)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+import objextract
+from atlas import load_atlas_options
+from catalog import open_catalog
+from derived import load_derived_cache
+from report import stage_counter, write_stage_report
+from presets import apply_preset
+
 # -------------------------------------------------------------------
 # Hilfsfunktion: Collation-Ordner suchen (keine Error-Ausgabe, nur Info)
 # -------------------------------------------------------------------
@@ -36,6 +45,8 @@ latest_date_folder = find_latest_date_folder(base_dir)
 
 # 2. SETTINGS.INI laden (über _utils.py)
 config = load_settings_ini()
+# Voreinstellung aus start.json (PNG-Kompression) übernehmen
+apply_preset(config)
 log_message("Lade settings.ini", level="info")
 
 # 3. Ausgabeformat ermitteln (über _utils.py)
@@ -61,6 +72,14 @@ def get_float(section, key, default):
 
 # Aus der INI: Mindestgröße der zu extrahierenden Objekte in Pixeln (extractsize)
 extract_size = get_int("Settings", "extractsize", 10)
+# Anzahl Threads zum Schreiben der Ausschnitte (0 = automatisch)
+extract_workers = get_int("Settings", "extract_workers", 0) or None
+# Atlasmodus: Objekte je Bild als Sprite-Atlas statt als Einzeldateien speichern
+atlas_options = load_atlas_options(config)
+# Bildkatalog des Laufs: Bilder ohne Alphakanal werden ohne Dekodieren übersprungen
+catalog = open_catalog(latest_date_folder)
+# Alphamaske aus dem Ableitungsspeicher (auch von anderen Stufen abgelegt)
+derived_cache = load_derived_cache(config, latest_date_folder)
 
 # 5. Output-Folder für die Verarbeitung aus settings.ini einlesen
 #    Ordner 1: TransBack (für die Objektextraktion)
@@ -111,63 +130,16 @@ def extract_objects_from_image(file_path, extract_size=10, base_folder=None):
     """
     Extrahiert einzelne Objekte aus einem Bild und speichert sie als separate PNG-Dateien.
     Nach erfolgreicher Extraktion wird die Originaldatei gelöscht.
+    Die Verarbeitung übernimmt die gemeinsame Engine objextract (Farbmodus).
 
     :param file_path: Pfad zum Originalbild.
     :param extract_size: Mindestgröße der Objekte in Pixeln.
-    :param base_folder: Basisordner (z. B. TransBack oder Enhancement) – wird hier nicht mehr genutzt.
+    :param base_folder: Basisordner (z. B. TransBack oder Enhancement) – wird hier nicht mehr genutzt.
     """
-    log_message(f"Starte Verarbeitung von {file_path} mit extract_size={extract_size}", level="info")
-
-    # Datei einlesen (mit Alphakanal)
-    img = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        err_msg = f"Fehler: Datei {file_path} konnte nicht geladen werden."
-        log_message(err_msg, level="error")
-        return
-
-    log_message("Datei erfolgreich geladen. Starte Verarbeitung...", level="info")
-
-    # Überprüfen, ob ein Alphakanal vorhanden ist
-    if img.shape[2] == 4:
-        alpha_channel = img[:, :, 3]
-    else:
-        err_msg = f"Das Bild {file_path} hat keinen Alphakanal."
-        log_message(err_msg, level="warning")
-        return
-
-    # Alphakanal binarisieren und Konturen finden
-    _, binary = cv2.threshold(alpha_channel, 1, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
-    extracted_count = 0
-
-    for i, contour in enumerate(contours):
-        x, y, w, h = cv2.boundingRect(contour)
-        if w < extract_size or h < extract_size:
-            continue
-        cropped_img = img[y:y+h, x:x+w]
-        alpha_cropped = alpha_channel[y:y+h, x:x+w]
-        mask = cv2.threshold(alpha_cropped, 1, 255, cv2.THRESH_BINARY)[1]
-        pil_img = Image.fromarray(cv2.cvtColor(cropped_img, cv2.COLOR_BGRA2RGBA))
-        pil_img.putalpha(Image.fromarray(mask))
-
-        output_path = os.path.join(os.path.dirname(file_path), f"{i+1:02}_{base_name}.png")
-        pil_img.save(output_path)
-        extracted_count += 1
-
-        log_message(f"Objekt {i+1} gespeichert: {output_path}", level="info")
-
-    if extracted_count > 0:
-        try:
-            os.remove(file_path)
-            msg = f"{extracted_count} Objekte aus {file_path} wurden verarbeitet. Originaldatei wurde gelöscht."
-            log_message(msg, level="info")
-        except Exception as e:
-            log_message(f"Fehler beim Löschen der Originaldatei {file_path}: {str(e)}", level="error")
-    else:
-        msg = f"Keine Objekte aus {file_path} extrahiert. Originaldatei bleibt erhalten."
-        log_message(msg, level="info")
+    return objextract.extract_objects_from_image(file_path, extract_size=extract_size,
+                                                 mode="color", max_workers=extract_workers,
+                                                 atlas_options=atlas_options, derived_cache=derived_cache,
+                                                 catalog=catalog, date_folder=latest_date_folder)
 
 # -------------------------------------------------------------------
 # Funktion für einen benutzerdefinierten Filter
@@ -198,16 +170,25 @@ if __name__ == "__main__":
     # ---------------------------
     # 1. Objektextraktion in beiden Collation-Ordnern
     # ---------------------------
-    for current_folder in collation_folder_list:
-        image_files = find_all_images_in_directory(current_folder)
-        if not image_files:
-            log_message(f"Keine Bilddateien in {current_folder} gefunden.", level="warning")
-        else:
-            for file_path in image_files:
-                log_message(f"Verarbeite Datei: {file_path}", level="info")
-                # Übergabe des aktuellen Basisordners an die Funktion
-                extract_objects_from_image(file_path, extract_size=extract_size, base_folder=current_folder)
-            log_message(f"Extraktion abgeschlossen in {current_folder}.", level="info")
+    try:
+        counter = stage_counter("Extract")
+        for current_folder in collation_folder_list:
+            image_files = find_all_images_in_directory(current_folder)
+            if not image_files:
+                log_message(f"Keine Bilddateien in {current_folder} gefunden.", level="warning")
+            else:
+                for file_path in image_files:
+                    log_message(f"Verarbeite Datei: {file_path}", level="info")
+                    if not objextract.needs_extraction(catalog, latest_date_folder, file_path, counter):
+                        continue
+                    # Übergabe des aktuellen Basisordners an die Funktion
+                    result = extract_objects_from_image(file_path, extract_size=extract_size, base_folder=current_folder)
+                    objextract.count_extraction(counter, result)
+                log_message(f"Extraktion abgeschlossen in {current_folder}.", level="info")
+    finally:
+        catalog.close()
+
+    write_stage_report(latest_date_folder, counter)
 
     # ---------------------------
     # 2. Anwendung des Custom-Filters
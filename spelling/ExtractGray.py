@@ -1,10 +1,19 @@
 import os
-import cv2
-from PIL import Image
+import sys
 import shutil
+from pathlib import Path
 from _logger import log_message, shorten_path
 from _utils import load_settings_ini, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (gemeinsame Objektextraktion)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+import objextract
+from atlas import load_atlas_options
+from catalog import open_catalog
+from derived import load_derived_cache
+from report import stage_counter, write_stage_report
+from presets import apply_preset
+
 # -------------------------------------------------------------------
 # Hilfsfunktion: Sucht einen Collation-Ordner (z. B. "03-Whitepaper")
 # -------------------------------------------------------------------
@@ -23,72 +32,25 @@ def find_collation_folder(date_folder, collation_name):
 # -------------------------------------------------------------------
 # Objektextraktion aus einem Bild – Graustufen-Version
 # -------------------------------------------------------------------
-def extract_objects_from_image(file_path, extract_size=10, base_collation=None):
+def extract_objects_from_image(file_path, extract_size=10, base_collation=None, max_workers=None,
+                               atlas_options=None, derived_cache=None, catalog=None, date_folder=None):
     """
-    Liest ein Bild (inklusive Alphakanal) ein, wandelt es zuerst in ein Graustufenbild um
-    und extrahiert dann Objekte (basierend auf dem Alphakanal). Erfolgreich extrahierte
-    Objekte werden als separate PNG-Dateien gespeichert. Nach erfolgreicher Extraktion
-    wird die Originaldatei gelöscht.
+    Extrahiert Objekte (basierend auf dem Alphakanal) als Graustufenbilder mit Alpha
+    und speichert sie als separate PNG-Dateien. Nach erfolgreicher Extraktion wird die
+    Originaldatei gelöscht. In Graustufen umgerechnet werden nur die Ausschnitte
+    (gemeinsame Engine objextract, Graumodus).
 
     :param file_path: Pfad zum Originalbild.
     :param extract_size: Mindestgröße (in Pixeln) eines Objekts (aus der INI, Standard: 10).
     :param base_collation: Basisordner, in den normalerweise das Original verschoben würde.
+    :param max_workers: Anzahl Threads zum Schreiben der Ausschnitte (None = automatisch).
+    :param atlas_options: Atlasmodus (siehe atlas.load_atlas_options), None = Einzeldateien.
+    :param derived_cache: Ableitungsspeicher für Alphamaske und Graustufe (Schlüssel aus catalog).
     """
-    log_message(f"Starte Verarbeitung von {file_path} mit extract_size={extract_size}", level="info")
-
-    # Bild inklusive Alphakanal einlesen
-    img = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        log_message(f"Fehler: Datei {file_path} konnte nicht geladen werden.", level="error")
-        return
-
-    # Umwandlung in Graustufen (für die spätere Extraktion)
-    try:
-        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    except Exception as e:
-        log_message(f"Fehler bei der Umwandlung in Graustufen für {file_path}: {str(e)}", level="error")
-        return
-
-    # Überprüfen, ob ein Alphakanal vorhanden ist
-    if img.shape[2] == 4:
-        alpha_channel = img[:, :, 3]
-    else:
-        log_message(f"Das Bild {file_path} hat keinen Alphakanal.", level="warning")
-        return
-
-    # Binärisierung des Alphakanals und Suche der Konturen
-    _, binary = cv2.threshold(alpha_channel, 1, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
-    output_dir = os.path.dirname(file_path)
-    extracted_count = 0
-
-    for i, contour in enumerate(contours):
-        x, y, w, h = cv2.boundingRect(contour)
-        if w < extract_size or h < extract_size:
-            continue
-        # Auf Basis des Graustufenbildes den Bereich ausschneiden
-        cropped_img = gray_img[y:y+h, x:x+w]
-        # Ebenso den entsprechenden Bereich des Alphakanals
-        alpha_cropped = alpha_channel[y:y+h, x:x+w]
-        mask = cv2.threshold(alpha_cropped, 1, 255, cv2.THRESH_BINARY)[1]
-        pil_img = Image.fromarray(cropped_img).convert("L")
-        pil_img.putalpha(Image.fromarray(mask))
-
-        output_path = os.path.join(output_dir, f"{i+1:02}_{base_name}.png")
-        pil_img.save(output_path)
-        extracted_count += 1
-        log_message(f"Objekt {i+1} gespeichert: {output_path}", level="info")
-
-    if extracted_count > 0:
-        try:
-            os.remove(file_path)
-            log_message(f"{extracted_count} Objekte aus {file_path} wurden verarbeitet. Originaldatei wurde gelöscht.", level="info")
-        except Exception as e:
-            log_message(f"Fehler beim Löschen der Originaldatei {file_path}: {str(e)}", level="error")
-    else:
-        log_message(f"Keine Objekte aus {file_path} extrahiert. Originaldatei bleibt erhalten.", level="info")
+    return objextract.extract_objects_from_image(file_path, extract_size=extract_size,
+                                                 mode="gray", max_workers=max_workers,
+                                                 atlas_options=atlas_options, derived_cache=derived_cache,
+                                                 catalog=catalog, date_folder=date_folder)
 
 # -------------------------------------------------------------------
 # Hilfsfunktion: Sucht alle Bilddateien in einem Verzeichnis (inkl. Unterordner)
@@ -112,6 +74,8 @@ if __name__ == "__main__":
 
     # Konfiguration laden (settings.ini)
     config = load_settings_ini()
+    # Voreinstellung aus start.json (PNG-Kompression) übernehmen
+    apply_preset(config)
 
     # Aus der INI: Mindestgröße für zu extrahierende Objekte
     try:
@@ -120,6 +84,14 @@ if __name__ == "__main__":
         extract_size = 10
         log_message("Ungültiger Wert für Settings.extractsize, Standardwert 10 wird verwendet.", level="warning")
 
+    # Aus der INI: Anzahl Threads zum Schreiben der Ausschnitte (0 = automatisch)
+    extract_workers = config.getint("Settings", "extract_workers", fallback=0) or None
+    # Atlasmodus: Objekte je Bild als Sprite-Atlas statt als Einzeldateien speichern
+    atlas_options = load_atlas_options(config)
+    # Alphamaske und Graustufe aus dem Ableitungsspeicher (auch von anderen Stufen abgelegt)
+    derived_cache = load_derived_cache(config, latest_date_folder)
+    counter = stage_counter("ExtractGray")
+
     # Aus der INI: Namen der Collation-Bereiche (Ordner)
     output_foldes_collation3 = config.get("Settings", "output_foldes_collation3", fallback="Whitepaper")
     target_collation_folder_name3 = f"03-{output_foldes_collation3}"
@@ -133,16 +105,28 @@ if __name__ == "__main__":
     target_collation_folder_name7 = f"03-{output_foldes_collation7}"
     collation_folder7 = find_collation_folder(latest_date_folder, target_collation_folder_name7)
 
-    # Für beide Collation-Bereiche (Whitepaper und Enhancwhite) werden die Bilder verarbeitet:
-    for collation_folder in [collation_folder3, collation_folder4, collation_folder7]:
-        if collation_folder:
-            log_message(f"Starte Verarbeitung in Ordner: {shorten_path(collation_folder)}", level="info")
-            image_files = find_all_images_in_directory(collation_folder)
-            if not image_files:
-                log_message(f"Keine Bilddateien in {shorten_path(collation_folder)} gefunden.", level="warning")
-            else:
-                for file_path in image_files:
-                    log_message(f"Verarbeite Datei: {file_path}", level="info")
-                    extract_objects_from_image(file_path, extract_size=extract_size, base_collation=collation_folder)
-
+    # Bildkatalog des Laufs: Bilder ohne Alphakanal werden ohne Dekodieren übersprungen
+    catalog = open_catalog(latest_date_folder)
+    try:
+        # Für beide Collation-Bereiche (Whitepaper und Enhancwhite) werden die Bilder verarbeitet:
+        for collation_folder in [collation_folder3, collation_folder4, collation_folder7]:
+            if collation_folder:
+                log_message(f"Starte Verarbeitung in Ordner: {shorten_path(collation_folder)}", level="info")
+                image_files = find_all_images_in_directory(collation_folder)
+                if not image_files:
+                    log_message(f"Keine Bilddateien in {shorten_path(collation_folder)} gefunden.", level="warning")
+                else:
+                    for file_path in image_files:
+                        log_message(f"Verarbeite Datei: {file_path}", level="info")
+                        if not objextract.needs_extraction(catalog, latest_date_folder, file_path, counter):
+                            continue
+                        result = extract_objects_from_image(file_path, extract_size=extract_size, base_collation=collation_folder,
+                                                            max_workers=extract_workers, atlas_options=atlas_options,
+                                                            derived_cache=derived_cache, catalog=catalog,
+                                                            date_folder=latest_date_folder)
+                        objextract.count_extraction(counter, result)
+    finally:
+        catalog.close()
+
+    write_stage_report(latest_date_folder, counter)
     log_message("Extraktion abgeschlossen.", level="info")
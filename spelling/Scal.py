@@ -1,11 +1,26 @@
 import os
+import sys
+from pathlib import Path
 from PIL import Image
 import shutil
 
 from _logger import log_message, shorten_path
 from _utils import load_settings_ini, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (Sprite-Atlanten)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from atlas import is_atlas_file, is_atlas_index, atlas_stem, load_atlas, iter_atlas_objects, write_atlas
+from presets import apply_preset, interpolation, interpolation_name
+from backends import load_backend_options, choose_backend
+from imgio import to_pil, from_pil
+
 # Default-Skalierungsoptionen, falls in der INI nichts definiert ist
+# Interpolationsverfahren (Standard LANCZOS; siehe presets, [Scaling] interpolation)
+resample = Image.LANCZOS
+resample_name = "lanczos"
+# Bild-Engine je Bild (siehe backends, [Backend]); bisher immer PIL
+backend_options = load_backend_options(None)
+
 default_scale_options = {
     25: (25, 25),
     50: (50, 50),
@@ -25,16 +40,18 @@ def scale_image(file_path, scale, scale_factors, output_dir):
     """
     log_message(f"Starte Skalierung von {shorten_path(file_path)} mit scale={scale}", level="info")
     
+    backend = choose_backend(backend_options, file_path, default="pil")
     try:
-        img = Image.open(file_path)
+        img = backend["open"](file_path)
     except Exception as e:
         log_message(f"Fehler: Datei {shorten_path(file_path)} konnte nicht geladen werden: {str(e)}", level="error")
         return
 
-    new_width = int(img.width * (scale_factors[0] / 100))
-    new_height = int(img.height * (scale_factors[1] / 100))
+    width, height = backend["size"](img)
+    new_width = int(width * (scale_factors[0] / 100))
+    new_height = int(height * (scale_factors[1] / 100))
     try:
-        scaled_img = img.resize((new_width, new_height), Image.LANCZOS)
+        scaled_img = backend["resize"](img, (new_width, new_height), resample_name)
     except Exception as e:
         log_message(f"Fehler beim Skalieren von {shorten_path(file_path)}: {str(e)}", level="error")
         return
@@ -45,14 +62,62 @@ def scale_image(file_path, scale, scale_factors, output_dir):
     output_path = os.path.join(output_dir, new_file_name)
     
     try:
-        scaled_img.save(output_path)
+        backend["write"](scaled_img, output_path)
         log_message(f"Skaliertes Bild gespeichert: {shorten_path(output_path)}", level="info")
     except Exception as e:
         log_message(f"Fehler beim Speichern des Bildes {shorten_path(output_path)}: {str(e)}", level="error")
 
+def scale_atlas(index_path, scale, scale_factors, output_dir):
+    """
+    Skaliert alle Objekte eines Sprite-Atlas einzeln (wie scale_image) und speichert sie
+    als neuen Atlas "{name}_x{scale}.atlas.*" im Zielordner. Die Objektnamen erhalten
+    ebenfalls das Suffix "_x{scale}", entpackt entstehen also dieselben Dateien wie bei
+    einzeln skalierten Bildern.
+
+    :param index_path: Pfad zum Atlas-Index (.atlas.json).
+    :param scale: Skalierungswert (z.B. 75).
+    :param scale_factors: Tuple mit (x_scale, y_scale).
+    :param output_dir: Zielordner, in dem der skalierte Atlas abgelegt wird.
+    """
+    log_message(f"Starte Skalierung von Atlas {shorten_path(index_path)} mit scale={scale}", level="info")
+    try:
+        index = load_atlas(index_path)
+        gray = index["mode"] == "gray"
+        objects = []
+        for entry, arr in iter_atlas_objects(index_path, index):
+            # Gleiche Pixeldaten wie beim Öffnen der Einzeldatei (RGBA bzw. LA)
+            img = to_pil(arr)
+            new_width = int(img.width * (scale_factors[0] / 100))
+            new_height = int(img.height * (scale_factors[1] / 100))
+            try:
+                scaled = from_pil(img.resize((new_width, new_height), resample), "gray_alpha" if gray else "bgra")
+            except Exception as e:
+                log_message(f"Fehler beim Skalieren von {entry['name']}: {str(e)}", level="error")
+                continue
+            name = f"{os.path.splitext(entry['name'])[0]}_x{scale}.png"
+            objects.append((name, scaled, (entry["src_x"], entry["src_y"])))
+    except Exception as e:
+        log_message(f"Fehler: Atlas {shorten_path(index_path)} konnte nicht geladen werden: {str(e)}", level="error")
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        write_atlas(output_dir, f"{atlas_stem(index_path)}_x{scale}", objects, mode=index["mode"],
+                    padding=index.get("padding", 1),
+                    write_csv=os.path.exists(index_path[:-len(".json")] + ".csv"),
+                    extra={"source": index.get("source"), "scale": scale})
+    except Exception as e:
+        log_message(f"Fehler beim Speichern des Atlas {shorten_path(index_path)}: {str(e)}", level="error")
+
 def main():
     # INI laden und Basisordner ermitteln
+    global resample, resample_name, backend_options
     config = load_settings_ini()
+    # Voreinstellung aus start.json (u. a. Interpolationsverfahren) übernehmen
+    apply_preset(config)
+    resample = interpolation(config)
+    resample_name = interpolation_name(config)
+    backend_options = load_backend_options(config)
     base_dir = os.getcwd()
     latest_date_folder = find_latest_date_folder(base_dir)
     
@@ -132,6 +197,13 @@ def main():
             dirs[:] = [d for d in dirs if d not in [f"x{scale}" for scale in active_scales]]
             
             for file in files:
+                # Sprite-Atlanten: Objekte einzeln skalieren, Atlasseiten selbst nicht
+                if is_atlas_index(file):
+                    for scale in active_scales:
+                        scale_atlas(os.path.join(root, file), scale, scale_options[scale], os.path.join(root, f"x{scale}"))
+                    continue
+                if is_atlas_file(file):
+                    continue
                 if any(file.lower().endswith(ext) for ext in supported_extensions):
                     file_path = os.path.join(root, file)
                     # Für jeden Skalierungswert: Ausgabeordner im selben Verzeichnis (relativ zum Bild) anlegen
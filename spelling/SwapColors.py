@@ -5,72 +5,39 @@ Das Modul bearbeitet ausschließlich den Ordner 03-swapcolors.
 Abhängigkeiten: utils.py (INI lesen) und logger.py (Logging).
 """
 from pathlib import Path
-import cv2
-import numpy as np
+import sys
 from _utils import load_settings_ini
 from _logger import log_message, shorten_path
-# ----------------------------------------------------------
-# Hilfsfunktionen
-# ----------------------------------------------------------
-def hex_to_lab(hex_color: str) -> np.ndarray:
-    bgr = hex_to_bgr(hex_color).reshape(1, 1, 3)
-    lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)[0, 0]
-    return lab.astype(np.float32)
-
-def hex_to_bgr(hex_color: str) -> np.ndarray:
-    """Konvertiert Hex-Farbcode (#RRGGBB) in BGR-Array."""
-    hex_color = hex_color.lstrip("#")
-    r, g, b = [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
-    return np.array([b, g, r], dtype=np.uint8)
-
-def deltaE_ciede2000(lab_img: np.ndarray, lab_color: np.ndarray) -> np.ndarray:
-    """Berechnet CIEDE2000 Delta E zwischen Lab-Bild und Lab-Farbe."""
-    # Lab-Werte extrahieren
-    L1, a1, b1 = cv2.split(lab_img)
-    L2, a2, b2 = lab_color
 
-    # Vereinfachte Delta E Berechnung (hier könnte ein vollständiger CIEDE2000 Algorithmus implementiert werden)
-    # Für eine einfache Implementierung nutzen wir die euklidische Distanz
-    dL = L1 - L2
-    da = a1 - a2
-    db = b1 - b2
+# Pfad zum init-Verzeichnis hinzufügen (Farb-LUT-Engine)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from colorlut import load_swap_setup
+from pointops import swap_op, build_stage_ops, fused_followers, process_stage_files
+from iopipeline import load_io_options
+from presets import apply_preset
+from catalog import open_catalog
+from resultcache import open_result_cache, close_result_cache
+from report import stage_counter, write_stage_report
 
-    return np.sqrt(dL**2 + da**2 + db**2)
 # ----------------------------------------------------------
 # Kernfunktion: ein Bild bearbeiten
 # ----------------------------------------------------------
-def fill_colors_in_image(img_path: Path,
-                         pairs_hex: list[tuple[str, str]],
-                         delta_e_max: float) -> None:
-    img_bgr = cv2.imread(str(img_path), cv2.IMREAD_UNCHANGED)
-    if img_bgr is None:
-        log_message(f"Bild nicht lesbar: {shorten_path(str(img_path))}", level="error")
-        return
-    alpha = None
-    if img_bgr.shape[2] == 4:
-        alpha = img_bgr[:, :, 3:].copy()
-        img_bgr = img_bgr[:, :, :3]
-    img_lab = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-    # Referenzfarben vorbereiten
-    pairs_lab_bgr = [
-        (hex_to_lab(src_hex), hex_to_bgr(dst_hex))
-        for src_hex, dst_hex in pairs_hex
-    ]
-    for src_lab, dst_bgr in pairs_lab_bgr:
-        # ΔE*2000 pro Pixel
-        dE = deltaE_ciede2000(img_lab, src_lab)
-        mask = dE <= delta_e_max
-        img_bgr[mask] = dst_bgr
-    if alpha is not None:
-        img_out = cv2.merge([img_bgr, alpha])
-    else:
-        img_out = img_bgr
-    # Immer überschreiben
-    out_path = str(img_path)
-    if not cv2.imwrite(out_path, img_out):
-        log_message(f"Fehler beim Schreiben: {shorten_path(out_path)}", level="error")
+def log_fill_result(img_path: str, result) -> None:
+    """
+    Protokolliert das Ergebnis eines Bildes (siehe pointops.process_stage_files).
+    Die Farben werden gemäß der Swap-Konfiguration (siehe colorlut) ersetzt, ggf.
+    zusammen mit direkt folgenden punktweisen Stufen (siehe pointops). Trifft keine
+    Farbe ein Farbpaar, wird die Datei nicht neu geschrieben; wurde sie in einem
+    früheren Lauf bereits bearbeitet, wird sie übersprungen.
+    """
+    if result is None:
+        log_message(f"Bild nicht lesbar oder nicht schreibbar: {shorten_path(img_path)}", level="error")
+    elif result == "skipped":
+        log_message(f"Bereits bearbeitet, übersprungen: {shorten_path(img_path)}", level="info")
+    elif not result:
+        log_message(f"Keine passenden Farben, unverändert: {shorten_path(img_path)}", level="info")
     else:
-        log_message(f"Farben ersetzt: {shorten_path(out_path)}", level="info")
+        log_message(f"Farben ersetzt: {shorten_path(img_path)}", level="info")
 # ----------------------------------------------------------
 # Hilfsfunktion zum Finden des Collation-Ordners
 # ----------------------------------------------------------
@@ -92,6 +59,8 @@ def run(root: Path) -> None:
     """
     # Einstellungen aus INI laden
     cfg = load_settings_ini()
+    # Voreinstellung aus start.json (PNG-Kompression) übernehmen
+    apply_preset(cfg)
 
     # Debug-Informationen
     log_message(f"Startordner: {root}", level="info")
@@ -118,37 +87,32 @@ def run(root: Path) -> None:
             return
         log_message(f"Zielordner gefunden: {swap_dir}", level="info")
 
-    # Swap-Konfiguration laden
-    swap_cfg = cfg["swap"] if "swap" in cfg else {}
+    # Swap-Konfiguration laden (Farbpaare, Toleranz, Abstandsmaß, Verfahren)
+    swap_setup = load_swap_setup(cfg)
 
-    # Farbpaar-Liste aus INI
-    pairs_hex = []
-    idx = 1
-    while f"src_color_{idx}" in swap_cfg:
-        src_hex = swap_cfg[f"src_color_{idx}"]
-        dst_hex = swap_cfg[f"dst_color_{idx}"]
-        pairs_hex.append((src_hex, dst_hex))
-        idx += 1
-    cfg = load_settings_ini()
-    swap_cfg = cfg["swap"]
-    # Farbpaar-Liste aus INI
-    pairs_hex = []
-    idx = 1
-    while f"src_color_{idx}" in swap_cfg:
-        src_hex = swap_cfg[f"src_color_{idx}"]
-        dst_hex = swap_cfg[f"dst_color_{idx}"]
-        pairs_hex.append((src_hex, dst_hex))
-        idx += 1
-    tol = 5.0  # Standardwert
-    if "tolerance" in swap_cfg:
-        try:
-            tol = float(swap_cfg["tolerance"])
-        except (ValueError, TypeError):
-            log_message("Ungültiger Wert für 'tolerance' in settings.ini - verwende Standard (5.0)", level="warning")
+    # Direkt folgende punktweise Stufen (z. B. invert) im selben Durchlauf anwenden
+    ops = [swap_op(swap_setup)]
+    followers = {}
+    for follower in fused_followers("SwapColors", "output_foldes_collation8"):
+        log_message(f"Punktweise Stufe '{follower}' wird mit SwapColors zusammengefasst", level="info")
+        followers[follower] = build_stage_ops(follower, cfg)
 
-    for img_path in swap_dir.rglob("*"):
-        if img_path.suffix.lower() in {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}:
-            fill_colors_in_image(img_path, pairs_hex, tol)
+    date_folder = swap_dir.parent
+    catalog = open_catalog(date_folder)
+    counter = stage_counter("SwapColors")
+    paths = [str(p) for p in swap_dir.rglob("*") if p.suffix.lower() in {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}]
+    # Lesen und Schreiben laufen über die E/A-Pipeline parallel zur Farbersetzung; Bilder,
+    # die Enhancement bereits mit umgefärbt hat, überspringt process_stage_files
+    # Laufübergreifender Ergebnisspeicher ([ResultCache]): gleiche Eingabe + gleiche Operationen
+    result_cache = open_result_cache(cfg)
+    try:
+        io_metrics = process_stage_files(catalog, date_folder, "SwapColors", paths, ops, counter,
+                                         load_io_options(cfg), log_fill_result, fused=followers,
+                                         result_cache=result_cache)
+    finally:
+        catalog.close()
+        result_cache_stats = close_result_cache(result_cache)
+    write_stage_report(date_folder, counter, {"io": io_metrics, "result_cache": result_cache_stats})
 # ----------------------------------------------------------
 # Stand-alone-Aufruf
 # ----------------------------------------------------------
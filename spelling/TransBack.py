@@ -49,25 +49,33 @@
 #!/usr/bin/env python3
 import os
 import re
+import sys
 import configparser
-import numpy as np
-import cv2
-from PIL import Image
+from pathlib import Path
 from _logger import log_message, shorten_path  # Zentrale Logging-Funktion und Hilfsfunktion
 from _utils import load_settings_ini, get_output_format, find_latest_date_folder
 
+# Pfad zum init-Verzeichnis hinzufügen (Objektmaske, Grob-zu-fein-Masken)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from transmask import calculate_dark_threshold, compute_filtered_mask_multires, apply_mask
+from catalog import open_catalog
+from derived import load_derived_cache, content_key, derive, get_gray, get_edges, cache_stats
+from resultcache import open_result_cache, cached_call, cache_summary, close_result_cache
+from presets import apply_preset
+from safewrite import atomic_imwrite
+from imgio import read
+
 # -------------------------------------------------------------------
 # Bildverarbeitungsfunktionen (Transparenter Hintergrund)
 # -------------------------------------------------------------------
-def calculate_dark_threshold(gray_image):
+def load_bgra(img_path):
     """
-    Berechnet den dynamischen Schwellenwert für dunkle Bereiche basierend auf
-    weight_factor und dark_threshold_offset aus der INI.
+    Liest ein Bild einmalig (imgio) und liefert es als zusammenhängendes BGRA-Array (uint8).
     """
-    min_b = np.min(gray_image)
-    max_b = np.max(gray_image)
-    calculated = min_b + weight_factor * (max_b - min_b)
-    return int(calculated + dark_threshold_offset)
+    img = read(img_path, "bgra")
+    if img is None:
+        raise ValueError("Bild konnte nicht geladen werden.")
+    return img
 
 def process_image(img_path, output_path):
     """
@@ -75,39 +83,34 @@ def process_image(img_path, output_path):
       - Berechnet eine dunkle Bereichsmaske und ermittelt Kanten
       - Filtert Konturen, die kleiner als min_icon_size sind
       - Wendet die resultierende Maske an, sodass nicht erkannte Bereiche transparent werden
-      - Speichert das Ergebnis als RGBA-Bild (überschreibt das Original im Zielordner)
+      - Speichert das Ergebnis als BGRA-Bild (überschreibt das Original im Zielordner)
+
+    Das Bild wird nur einmal dekodiert, Graustufen werden direkt aus dem BGRA-Puffer
+    berechnet und die Maske wird in place angewendet (Maske: siehe transmask).
+    Graustufe, Kanten und Maske liegen im Ableitungsspeicher (derived) und werden für
+    identische Kopien wiederverwendet. Mit mask_pyramid_level > 0 wird die Maske
+    grob-zu-fein berechnet.
     """
     try:
-        with Image.open(img_path).convert("RGBA") as img:
-            np_img = np.array(img)
-            # Erzeuge ein Graustufenbild (RGB-Konvertierung notwendig für cv2)
-            gray = cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2GRAY)
-
-            # Dunkelbereichsmaskierung
-            dark_threshold = calculate_dark_threshold(gray)
-            _, dark_mask = cv2.threshold(gray, dark_threshold, 255, cv2.THRESH_BINARY_INV)
-
-            # Kantenerkennung
-            edges = cv2.Canny(gray, canny_threshold1, canny_threshold2)
-
-            # Maskenoptimierung: Dilatation
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-            edges_dilated = cv2.dilate(edges, kernel, iterations=iterations)
-
-            # Kombinierte Maske aus dunkler Maske und Kanten
-            combined_mask = cv2.bitwise_and(dark_mask, edges_dilated)
-            contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            filtered_mask = np.zeros_like(combined_mask)
-            for cnt in contours:
-                if cv2.contourArea(cnt) > min_icon_size:
-                    cv2.drawContours(filtered_mask, [cnt], -1, 255, thickness=cv2.FILLED)
-
-            # Transparenz anwenden: Pixel außerhalb der Maske werden transparent
-            np_img[filtered_mask == 0] = (0, 0, 0, 0)
-            Image.fromarray(np_img, "RGBA").save(output_path)
-
-            log_message(f"Erfolgreich verarbeitet: {os.path.basename(img_path)}", level="info")
-            return True
+        # Kopien desselben Bildes in mehreren Collation-Ordnern teilen sich Graustufe
+        # und Maske (Schlüssel: Prüfsumme aus dem Bildkatalog)
+        key = content_key(img_path, catalog, latest_date_folder)
+        img = load_bgra(img_path)
+        gray = get_gray(derived_cache, key, img)
+
+        dark_threshold = calculate_dark_threshold(gray, mask_params)
+        filtered_mask = derive(derived_cache, key, "transback_mask", (dark_threshold, *mask_params.values()),
+                               lambda: compute_filtered_mask_multires(
+                                   gray, dark_threshold, mask_params,
+                                   lambda: get_edges(derived_cache, key, gray, canny_threshold1, canny_threshold2)))
+
+        # Transparenz anwenden: Pixel außerhalb der Maske werden transparent
+        apply_mask(img, filtered_mask)
+        if not atomic_imwrite(output_path, img):
+            raise IOError("Bild konnte nicht gespeichert werden.")
+
+        log_message(f"Erfolgreich verarbeitet: {os.path.basename(img_path)}", level="info")
+        return True
     except Exception as e:
         log_message(f"Fehler bei {os.path.basename(img_path)}: {str(e)}", level="error")
         return False
@@ -141,6 +144,8 @@ latest_date_folder = find_latest_date_folder(base_dir)
 
 # 2. SETTINGS.INI laden (über _utils.py)
 config = load_settings_ini()
+# Voreinstellung aus start.json (draft, balanced, quality) übernehmen
+apply_preset(config)
 log_message("Lade settings.ini", level="info")
 
 # 3. Ausgabeformat ermitteln (über _utils.py)
@@ -172,6 +177,23 @@ weight_factor         = get_float("Settings", "weight_factor", 0.45)
 dark_threshold_offset = get_int("Settings", "dark_threshold_offset", 45)
 canny_threshold1      = get_int("Settings", "canny_threshold1", 32)
 canny_threshold2      = get_int("Settings", "canny_threshold2", 155)
+# Grob-zu-fein-Maske: 0 = volle Auflösung, 2 = Objektsuche auf 1/4 der Auflösung
+mask_pyramid_level    = get_int("Settings", "mask_pyramid_level", 0)
+mask_boundary_px      = get_int("Settings", "mask_boundary_px", 8)
+mask_params           = {"weight_factor": weight_factor, "dark_threshold_offset": dark_threshold_offset,
+                         "canny_threshold1": canny_threshold1, "canny_threshold2": canny_threshold2,
+                         "kernel_size": kernel_size, "iterations": iterations, "min_icon_size": min_icon_size,
+                         "mask_pyramid_level": mask_pyramid_level, "mask_boundary_px": mask_boundary_px}
+# Speicher für Graustufen, Kanten und Masken (identische Kopien, auch stufenübergreifend)
+derived_cache         = load_derived_cache(config, latest_date_folder)
+# Laufübergreifender Ergebnisspeicher ([ResultCache]): gleiche Eingabe + gleiche Parameter
+result_cache          = open_result_cache(config)
+result_params         = {"min_icon_size": min_icon_size, "kernel_size": kernel_size,
+                         "iterations": iterations, "weight_factor": weight_factor,
+                         "dark_threshold_offset": dark_threshold_offset, "canny": [canny_threshold1, canny_threshold2],
+                         "mask_pyramid_level": mask_pyramid_level, "mask_boundary_px": mask_boundary_px}
+# Bei Änderungen am Verfahren erhöhen, damit alte Ergebnisse nicht mehr verwendet werden
+RESULT_VERSION        = 1
 
 # 5. Alle Output-Folder Collation-Einträge aus settings.ini sammeln
 collation_folder_list = []
@@ -196,6 +218,7 @@ log_message(f"Dilatations-Iterationen: {iterations}", level="info")
 log_message(f"Gewichtungsfaktor: {weight_factor}", level="info")
 log_message(f"Schwellenoffset: {dark_threshold_offset}", level="info")
 log_message(f"Canny-Schwellenwerte: {canny_threshold1} - {canny_threshold2}", level="info")
+log_message(f"Maskenpyramide: Stufe {mask_pyramid_level}, Randzugabe {mask_boundary_px}px", level="info")
 log_message("Gefundene Collation-Ordner:", level="info")
 for folder in collation_folder_list:
     log_message(f"   {shorten_path(folder)}", level="info")
@@ -205,16 +228,32 @@ log_message("==============================================================\n",
 # VERARBEITUNG DER BILDER in allen Collation-Ordnern
 # -------------------------------------------------------------------
 total_processed = 0
-for collation_folder in collation_folder_list:
-    log_message(f"Verarbeite Bilder in Collation-Ordner: {shorten_path(collation_folder)}", level="info")
-    for root, dirs, files in os.walk(collation_folder):
-        for file in files:
-            if file.lower().endswith(output_format):
-                input_path = os.path.join(root, file)
-                # Da wir die Bilder in den Collation-Ordnern bearbeiten wollen, wird das Bild an derselben Stelle überschrieben.
-                output_path = os.path.join(root, file)
-                log_message(f"Verarbeite Datei: {file}", level="info")
-                if process_image(input_path, output_path):
-                    total_processed += 1
+catalog = open_catalog(latest_date_folder)
+try:
+    for collation_folder in collation_folder_list:
+        log_message(f"Verarbeite Bilder in Collation-Ordner: {shorten_path(collation_folder)}", level="info")
+        for root, dirs, files in os.walk(collation_folder):
+            for file in files:
+                if file.lower().endswith(output_format):
+                    input_path = os.path.join(root, file)
+                    # Da wir die Bilder in den Collation-Ordnern bearbeiten wollen, wird das Bild an derselben Stelle überschrieben.
+                    output_path = os.path.join(root, file)
+                    log_message(f"Verarbeite Datei: {file}", level="info")
+                    ok, hit = cached_call(result_cache, "TransBack", RESULT_VERSION, result_params, input_path,
+                                          lambda path: process_image(path, path), catalog, latest_date_folder)
+                    if hit:
+                        log_message(f"Ergebnis aus dem Ergebnisspeicher übernommen: {file}", level="info")
+                    if ok:
+                        total_processed += 1
+finally:
+    catalog.close()
 
+stats = cache_stats(derived_cache)
+log_message(f"Ableitungsspeicher: {stats['hits']} Treffer, {stats['misses']} berechnet, "
+            f"{stats['shared_hits']} von anderen Stufen übernommen", level="info")
+if result_cache:
+    rc_stats = cache_summary(result_cache)
+    log_message(f"Ergebnisspeicher: {rc_stats['hits']} Treffer, {rc_stats['misses']} Fehlzugriffe, "
+                f"{rc_stats['evictions']} verdrängt ({rc_stats['entries']} Einträge, {rc_stats['size_mb']} MB)", level="info")
+    close_result_cache(result_cache)
 log_message(f"Verarbeitung abgeschlossen! {total_processed} Bilder verarbeitet.", level="info")
@@ -0,0 +1,267 @@
+"""
+Worker.py – verteilt die Bildstufen eines Datumsordners über eine Warteschlange.
+
+Ein steuernder Prozess trägt die Bilder eines Collation-Ordners mit ihrer
+Stufenfolge ein und wartet; Worker (auf diesem oder anderen Rechnern mit demselben
+eingebundenen Laufwerk) holen sich die Aufgaben per Lease. Siehe init/workqueue.py.
+
+Aufruf:
+  python Worker.py enqueue <Datumsordner> <Ordner> <Stufe[,Stufe...]>
+  python Worker.py worker  <Datumsordner> [--id NAME]
+  python Worker.py status  <Datumsordner>
+  python Worker.py run     <Datumsordner> <Ordner> <Stufe[,Stufe...]> [--workers N]
+  python Worker.py stage   <Datumsordner> <Stufe> [--workers N]
+
+"run" trägt ein, startet N lokale Worker und wartet (Einrechnerbetrieb).
+"stage" macht dasselbe für alle Ordner, die spelling.json der Stufe zuordnet –
+so ruft startskript.py die Stufe auf, wenn in start.json "work_queue" gesetzt ist.
+Verteilbar sind die bildweisen Stufen invert, SwapColors, Extract und ExtractGray.
+"""
+import os
+import sys
+import json
+from pathlib import Path
+from _utils import load_settings_ini
+from _logger import log_message, shorten_path
+
+# Pfad zum init-Verzeichnis hinzufügen (Warteschlange und Bildstufen)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+import objextract
+import workqueue
+from pointops import build_stage_ops, process_stage_file
+from utils import load_json_config
+from atlas import load_atlas_options
+from catalog import open_catalog
+from derived import load_derived_cache
+from resultcache import open_result_cache, close_result_cache
+from report import stage_counter, write_stage_report
+from presets import apply_preset
+from threads import load_thread_options, plan_workers, total_threads, worker_env, apply_env_budget
+
+SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}
+# Über die Warteschlange verteilbare Stufen (Namen wie in spelling.json)
+QUEUE_STAGES = ("invert", "SwapColors", "Extract", "ExtractGray")
+# Ordnernamen der Collation-Schlüssel, wenn die settings.ini keinen setzt (wie in den Stufen)
+_COLLATION_DEFAULTS = {
+    "output_foldes_collation1": "TransBack",
+    "output_foldes_collation2": "Enhancement",
+    "output_foldes_collation3": "Whitepaper",
+    "output_foldes_collation4": "Enhancwhite",
+    "output_foldes_collation5": "Enhanclean",
+    "output_foldes_collation6": "Transclean",
+    "output_foldes_collation7": "Enhwhitclean",
+    "output_foldes_collation8": "Swapcolors",
+    "output_foldes_collation9": "Invert",
+}
+
+# ----------------------------------------------------------
+# Einstellungen
+# ----------------------------------------------------------
+def load_queue_options(cfg):
+    """Liest [WorkQueue] aus der settings.ini."""
+    return {
+        "lease_seconds": cfg.getint("WorkQueue", "lease_seconds", fallback=workqueue.DEFAULT_LEASE_SECONDS),
+        "max_attempts": cfg.getint("WorkQueue", "max_attempts", fallback=workqueue.DEFAULT_MAX_ATTEMPTS),
+        # 0 = Kalibrierung der Stufe (Modus "processes"), sonst alle Kerne
+        "workers": cfg.getint("WorkQueue", "workers", fallback=0),
+    }
+
+# ----------------------------------------------------------
+# Stufen: eine Funktion je Stufe, aufgerufen mit (Bildpfad, Datumsordner)
+# ----------------------------------------------------------
+def build_handlers(cfg, catalog, date_folder, counters, result_cache=None):
+    """
+    Verarbeitungsfunktionen der verteilbaren Stufen. Jede liefert bei Erfolg einen
+    Wert ungleich None; die Zahlen landen je Stufe in counters. Punktweise Stufen
+    nutzen den Ergebnisspeicher result_cache (falls aktiviert).
+    """
+    def counter_for(stage):
+        if stage not in counters:
+            counters[stage] = stage_counter(stage)
+        return counters[stage]
+
+    def point_stage(stage):
+        ops = build_stage_ops(stage, cfg)
+        def handler(path, _date_folder):
+            return process_stage_file(catalog, date_folder, stage, path, ops, counter_for(stage),
+                                      result_cache=result_cache)
+        return handler
+
+    extract_size = cfg.getint("Settings", "extractsize", fallback=10)
+    extract_workers = cfg.getint("Settings", "extract_workers", fallback=0) or None
+    atlas_options = load_atlas_options(cfg)
+    derived_cache = load_derived_cache(cfg, date_folder)
+
+    def extract_stage(stage, mode):
+        def handler(path, _date_folder):
+            counter = counter_for(stage)
+            if not os.path.exists(path):
+                # Bereits von einem abgebrochenen Versuch extrahiert (Original gelöscht)
+                return 0
+            if not objextract.needs_extraction(catalog, date_folder, path, counter):
+                return 0
+            result = objextract.extract_objects_from_image(path, extract_size=extract_size, mode=mode,
+                                                           max_workers=extract_workers,
+                                                           atlas_options=atlas_options,
+                                                           derived_cache=derived_cache, catalog=catalog,
+                                                           date_folder=date_folder)
+            objextract.count_extraction(counter, result)
+            return result
+        return handler
+
+    return {
+        "invert": point_stage("invert"),
+        "SwapColors": point_stage("SwapColors"),
+        "Extract": extract_stage("Extract", "color"),
+        "ExtractGray": extract_stage("ExtractGray", "gray"),
+    }
+
+# ----------------------------------------------------------
+# Befehle
+# ----------------------------------------------------------
+def enqueue_folder(date_folder, folder, stages, cfg):
+    """Trägt alle Bilder eines Ordners (relativ zum Datumsordner) mit der Stufenfolge ein."""
+    root = Path(date_folder) / folder
+    if not root.is_dir():
+        log_message(f"Ordner '{folder}' nicht gefunden in {shorten_path(str(date_folder))}.", level="warning")
+        return 0
+    paths = sorted(str(p) for p in root.rglob("*") if p.suffix.lower() in SUPPORTED_EXTENSIONS)
+    conn = workqueue.open_queue(date_folder)
+    try:
+        added = workqueue.enqueue(conn, date_folder, paths, stages, load_queue_options(cfg)["max_attempts"])
+    finally:
+        conn.close()
+    log_message(f"{added} Aufgaben ({' → '.join(stages)}) aus {folder} eingetragen.", level="info")
+    return added
+
+def worker(date_folder, cfg, worker_id=None):
+    """Startet einen Worker, der bis zum Leerlaufen der Warteschlange arbeitet."""
+    # Von run_local gestartet: OpenCV-Threads je Prozess aus der Umgebung
+    apply_env_budget()
+    catalog = open_catalog(date_folder)
+    counters = {}
+    result_cache = open_result_cache(cfg)
+    try:
+        handlers = build_handlers(cfg, catalog, date_folder, counters, result_cache)
+        counts = workqueue.run_worker(date_folder, handlers, worker_id=worker_id,
+                                      lease_seconds=load_queue_options(cfg)["lease_seconds"])
+    finally:
+        close_result_cache(result_cache)
+        catalog.close()
+    # Jeder Worker trägt seine Zahlen unter eigenem Namen in den Laufbericht ein
+    # (unter der Schreibsperre der Warteschlange, damit sich Worker nicht überschreiben)
+    suffix = worker_id or workqueue.default_worker_id()
+    conn = workqueue.open_queue(date_folder)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for stage, counter in counters.items():
+            counter["stage"] = f"{stage}@{suffix}"
+            write_stage_report(date_folder, counter)
+    finally:
+        conn.execute("COMMIT")
+        conn.close()
+    return counts
+
+def status(date_folder):
+    conn = workqueue.open_queue(date_folder)
+    try:
+        result = workqueue.queue_status(conn)
+        result["failed_tasks"] = workqueue.failed_tasks(conn)
+    finally:
+        conn.close()
+    return result
+
+def stage_folders(stage, cfg, spelling=None):
+    """Ordner (relativ zum Datumsordner), die spelling.json der Stufe zuordnet."""
+    spelling = load_json_config("spelling.json") if spelling is None else spelling
+    folders = []
+    for entry in spelling.get("spelling", []):
+        if entry.get("name") != stage:
+            continue
+        for folder_key in entry.get("folders", []):
+            name = cfg.get("Settings", folder_key, fallback=_COLLATION_DEFAULTS.get(folder_key))
+            if name and f"03-{name}" not in folders:
+                folders.append(f"03-{name}")
+    return folders
+
+def run_local(date_folder, folder, stages, cfg, workers=None):
+    """Trägt ein, startet lokale Worker-Prozesse und wartet auf das Ende."""
+    enqueue_folder(date_folder, folder, stages, cfg)
+    return run_workers(date_folder, cfg, workers, stages[0] if len(stages) == 1 else None)
+
+def run_stage(date_folder, stage, cfg, workers=None):
+    """
+    Führt eine Stufe über die Warteschlange aus: trägt alle ihr zugeordneten Ordner
+    ein, startet lokale Worker und wartet – Ersatz für den direkten Aufruf der Stufe.
+    """
+    added = sum(enqueue_folder(date_folder, folder, [stage], cfg) for folder in stage_folders(stage, cfg))
+    if not added:
+        log_message(f"Keine Aufgaben für {stage} – nichts zu tun.", level="info")
+    return run_workers(date_folder, cfg, workers, stage)
+
+def run_workers(date_folder, cfg, workers=None, stage=None):
+    """
+    Startet lokale Worker-Prozesse und wartet, bis die Warteschlange leer ist
+    (workqueue.run_local; Aufgaben ausgefallener Worker gelten als fehlgeschlagen).
+
+    :param workers: Anzahl Worker; sonst [WorkQueue] workers, sonst die Kalibrierung
+                    der Stufe im Modus "processes" (threads.py), sonst alle Kerne
+    """
+    thread_options = load_thread_options(cfg)
+    workers = workers or load_queue_options(cfg)["workers"]
+    if not workers:
+        workers, mode = plan_workers(stage, None, thread_options, modes=("processes",)) if stage else (1, None)
+        if mode is None:
+            workers = total_threads(thread_options)
+    log_message(f"Starte {workers} Worker für {shorten_path(str(date_folder))}", level="info")
+    # Jeder Prozess erhält seinen Anteil der Kerne für OpenCV und BLAS/OpenMP
+    env = worker_env(workers, thread_options)
+    return workqueue.run_local(date_folder, [sys.executable, os.path.abspath(__file__), "worker", str(date_folder)],
+                               workers, env)
+
+def exit_status(final):
+    """Exit-Code für run/stage: 1, wenn Aufgaben fehlgeschlagen sind oder ein Worker nicht sauber endete."""
+    return 1 if final["failed"] or any(final.get("exit_codes", [])) else 0
+
+# ----------------------------------------------------------
+# Stand-alone-Aufruf
+# ----------------------------------------------------------
+def _option(args, name, default=None):
+    if name in args:
+        index = args.index(name)
+        value = args[index + 1]
+        del args[index:index + 2]
+        return value
+    return default
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    worker_id = _option(args, "--id")
+    workers = _option(args, "--workers")
+    if len(args) < 2 or args[0] not in ("enqueue", "worker", "status", "run", "stage"):
+        print(__doc__)
+        sys.exit(1)
+    command, date_folder = args[0], Path(args[1])
+    cfg = load_settings_ini()
+    apply_preset(cfg)
+
+    if command == "status":
+        print(json.dumps(status(date_folder), indent=2, ensure_ascii=False))
+        sys.exit(0)
+    if command == "worker":
+        # Fehlgeschlagene Schritte stehen in der Warteschlange (und werden ggf. wiederholt);
+        # ein Exit-Code ungleich 0 bedeutet, dass der Worker selbst nicht sauber endete
+        worker(date_folder, cfg, worker_id)
+        sys.exit(0)
+    if command == "stage" and len(args) == 3 and args[2] in QUEUE_STAGES:
+        final = run_stage(date_folder, args[2], cfg, int(workers) if workers else None)
+        sys.exit(exit_status(final))
+    if command == "stage" or len(args) < 4:
+        print(__doc__)
+        sys.exit(1)
+    stages = [s.strip() for s in args[3].split(",") if s.strip()]
+    if command == "enqueue":
+        enqueue_folder(date_folder, args[2], stages, cfg)
+        sys.exit(0)
+    final = run_local(date_folder, args[2], stages, cfg, int(workers) if workers else None)
+    sys.exit(exit_status(final))
@@ -4,42 +4,35 @@ Das Modul bearbeitet ausschließlich den Ordner 'invert'.
 Abhängigkeiten: utils.py (INI lesen) und logger.py (Logging).
 """
 from pathlib import Path
-import cv2
-import numpy as np
+import sys
 from _utils import load_settings_ini
 from _logger import log_message, shorten_path
 
+# Pfad zum init-Verzeichnis hinzufügen (punktweise Operationen)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "init"))
+from pointops import invert_op, process_stage_files
+from iopipeline import load_io_options
+from presets import apply_preset
+from catalog import open_catalog
+from resultcache import open_result_cache, close_result_cache
+from report import stage_counter, write_stage_report
+
 # ----------------------------------------------------------
 # Kernfunktion: ein Bild bearbeiten
 # ----------------------------------------------------------
-def invert_colors_in_image(img_path: Path) -> None:
-    img = cv2.imread(str(img_path), cv2.IMREAD_UNCHANGED)
-    if img is None:
-        log_message(f"Bild nicht lesbar: {shorten_path(str(img_path))}", level="error")
-        return
-
-    alpha = None
-    if img.shape[2] == 4:  # Bild hat einen Alpha-Kanal
-        alpha = img[:, :, 3:].copy()
-        img_color = img[:, :, :3]
-    else:
-        img_color = img
-
-    # Farben invertieren
-    inverted = 255 - img_color
-
-    # Alpha-Kanal wieder hinzufügen, falls vorhanden
-    if alpha is not None:
-        img_out = cv2.merge([inverted, alpha])
-    else:
-        img_out = inverted
-
-    # In Originaldatei speichern
-    out_path = str(img_path)
-    if not cv2.imwrite(out_path, img_out):
-        log_message(f"Fehler beim Schreiben: {shorten_path(out_path)}", level="error")
+def log_invert_result(img_path: str, result) -> None:
+    """
+    Protokolliert das Ergebnis eines Bildes (siehe pointops.process_stage_files).
+    Invertiert werden die Farbkanäle über eine LUT (255 - x), der Alpha-Kanal bleibt
+    unverändert. Wurde das Bild in einem früheren Lauf bereits invertiert, bleibt es
+    unverändert.
+    """
+    if result is None:
+        log_message(f"Bild nicht lesbar oder nicht schreibbar: {shorten_path(img_path)}", level="error")
+    elif result == "skipped":
+        log_message(f"Bereits invertiert, übersprungen: {shorten_path(img_path)}", level="info")
     else:
-        log_message(f"Farben invertiert: {shorten_path(out_path)}", level="info")
+        log_message(f"Farben invertiert: {shorten_path(img_path)}", level="info")
 
 # ----------------------------------------------------------
 # Hilfsfunktion zum Finden des Collation-Ordners
@@ -62,6 +55,8 @@ def run(root: Path) -> None:
     """
     # Einstellungen aus INI laden
     cfg = load_settings_ini()
+    # Voreinstellung aus start.json (PNG-Kompression) übernehmen
+    apply_preset(cfg)
 
     # Debug-Informationen
     log_message(f"Startordner: {root}", level="info")
@@ -92,11 +87,23 @@ def run(root: Path) -> None:
     invert_cfg = cfg["invert"] if "invert" in cfg else {}
 
     # Alle Bilder im Ordner und Unterordnern verarbeiten
-    processed_count = 0
-    for img_path in invert_dir.rglob("*"):
-        if img_path.suffix.lower() in {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}:
-            invert_colors_in_image(img_path)
-            processed_count += 1
+    date_folder = invert_dir.parent
+    catalog = open_catalog(date_folder)
+    counter = stage_counter("invert")
+    paths = [str(p) for p in invert_dir.rglob("*") if p.suffix.lower() in {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}]
+    # Lesen und Schreiben laufen über die E/A-Pipeline parallel zum Invertieren; Bilder,
+    # die eine vorherige Stufe bereits mit invertiert hat, überspringt process_stage_files
+    # Laufübergreifender Ergebnisspeicher ([ResultCache]): gleiche Eingabe + gleiche Operationen
+    result_cache = open_result_cache(cfg)
+    try:
+        io_metrics = process_stage_files(catalog, date_folder, "invert", paths, [invert_op()], counter,
+                                         load_io_options(cfg), log_invert_result,
+                                         result_cache=result_cache)
+        processed_count = len(paths)
+    finally:
+        catalog.close()
+        result_cache_stats = close_result_cache(result_cache)
+    write_stage_report(date_folder, counter, {"io": io_metrics, "result_cache": result_cache_stats})
 
     log_message(f"Invert abgeschlossen: {processed_count} Bilder verarbeitet", level="info")
     log_separator()
@@ -29,6 +29,10 @@ except ImportError:
     print("Fehler: logger.py konnte nicht importiert werden.")
     sys.exit(1)
 
+# Exit-Code eines Moduls, das fertig ist, aber Bilder in Quarantäne lassen musste
+# (siehe init/watchdog.py)
+from report import EXIT_PARTIAL
+
 # Initialisiere den Logger
 init_logger(str(base_directory))
 
@@ -194,21 +198,53 @@ for module in start_config.get("modules", []):
         log_message(f"Modul {module_name} nicht gefunden. Gesucht in: {search_locations}", level="warning")
         log_message(f"Suchpfade geprüft: {[str(p) for p in search_paths]}", level="info")
 
-# Skripte ausführen
+# Bildweise Stufen, die bei "work_queue" über die Warteschlange laufen (Modulname →
+# Stufenname in spelling.json, siehe spelling/Worker.py)
+QUEUE_MODULES = {"invert": "invert", "swapcolors": "SwapColors", "extract": "Extract", "extractgray": "ExtractGray"}
+work_queue = start_config.get("settings", {}).get("work_queue", False)
+
+# Skripte ausführen – ein fehlgeschlagenes Modul bricht den Lauf nicht ab, damit die
+# bereits erledigte Arbeit und die übrigen Module nicht verloren gehen
+failed_modules = []
+partial_modules = []
 for script_name, script_path in scripts_to_run:
     log_message(f"Starte Modul: {script_name}", level="info")
 
+    # Starte das Skript mit dem aktuellen Verzeichnis als Argument
+    command = ["python", script_path, str(date_folder_path)]
+    if work_queue and script_name.lower() in QUEUE_MODULES:
+        # Eintragen, lokale Worker starten und warten, bis die Warteschlange leer ist
+        command = ["python", str(spelling_directory / "Worker.py"), "stage", str(date_folder_path),
+                   QUEUE_MODULES[script_name.lower()]]
+        log_message(f"Modul {script_name} läuft über die Warteschlange", level="info")
     try:
-        # Starte das Skript mit dem aktuellen Verzeichnis als Argument
-        subprocess.run(["python", script_path, str(date_folder_path)], check=True)
+        subprocess.run(command, check=True)
         log_message(f"Modul {script_name} erfolgreich beendet", level="info")
     except subprocess.CalledProcessError as e:
-        log_message(f"Fehler bei der Ausführung von {script_name}: {e}", level="error")
-        sys.exit(1)
+        if e.returncode == EXIT_PARTIAL:
+            log_message(f"Modul {script_name} beendet, einzelne Bilder in Quarantäne "
+                        f"(siehe {date_folder_path / '_quarantine'})", level="warning")
+            partial_modules.append(script_name)
+        else:
+            log_message(f"Fehler bei der Ausführung von {script_name}: {e} – fahre mit den übrigen Modulen fort",
+                        level="error")
+            failed_modules.append(script_name)
+
+if failed_modules:
+    log_message(f"Fehlgeschlagene Module: {', '.join(failed_modules)}", level="error")
+if partial_modules:
+    log_message(f"Module mit Bildern in Quarantäne: {', '.join(partial_modules)}", level="warning")
 
 log_separator()
 
 # Prüfen, ob Bestätigung per Enter-Taste erforderlich ist
 enter_confirmation = start_config.get("settings", {}).get("enter_confirmation", False)
 if enter_confirmation:
-    input("Drücken Sie die Enter-Taste, um das Programm zu beenden...")
\ No newline at end of file
+    input("Drücken Sie die Enter-Taste, um das Programm zu beenden...")
+
+# Exit-Code: 0 = alles erledigt, 1 = mindestens ein Modul fehlgeschlagen,
+# 3 = alle Module beendet, aber Bilder in Quarantäne
+if failed_modules:
+    sys.exit(1)
+if partial_modules:
+    sys.exit(EXIT_PARTIAL)
\ No newline at end of file
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Parität der vektorisierten TransBack-Maske mit der früheren Verarbeitung.
+
+Referenz ist die ursprüngliche Schleife aus TransBack (PIL-Dekodierung,
+findContours → contourArea → drawContours je Kontur). Geprüft werden direkt die
+Funktionen, die TransBack.process_image aufruft:
+  - filter_mask_by_contour_area auf synthetischen Sprenkelmasken (inkl. sich
+    berührender Objekte, Objekte mit Löchern und Objekte am Bildrand)
+  - compute_filtered_mask_multires mit mask_pyramid_level 0 (exakt) und 1–3
+    (höchstens MULTIRES_TOLERANCE abweichende Pixel, siehe transmask)
+  - Dekodierung (imgio), Graustufe (derived) und apply_mask gegenüber PIL
+
+Aufruf: python -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import cv2
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init"))
+from transmask import calculate_dark_threshold, filter_mask_by_contour_area, compute_filtered_mask_multires, apply_mask
+from multires import effective_level, candidate_rects
+from derived import get_gray
+from imgio import read
+
+PARAMS = {"weight_factor": 0.45, "dark_threshold_offset": 45, "canny_threshold1": 32, "canny_threshold2": 155,
+          "kernel_size": 12, "iterations": 1, "min_icon_size": 100, "mask_pyramid_level": 0, "mask_boundary_px": 8}
+# Zulässiger Anteil abweichender Maskenpixel mit mask_pyramid_level > 0 (Canny-Hysterese am Rahmenrand)
+MULTIRES_TOLERANCE = 0.001
+
+# ----------------------------------------------------------
+# Referenz (bisherige Verarbeitung)
+# ----------------------------------------------------------
+def legacy_filter(mask, min_area):
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filtered_mask = np.zeros_like(mask)
+    for cnt in contours:
+        if cv2.contourArea(cnt) > min_area:
+            cv2.drawContours(filtered_mask, [cnt], -1, 255, thickness=cv2.FILLED)
+    return filtered_mask
+
+def legacy_mask(gray, params):
+    """Bisherige Maskenberechnung in voller Auflösung."""
+    min_b, max_b = np.min(gray), np.max(gray)
+    dark_threshold = int(min_b + params["weight_factor"] * (max_b - min_b) + params["dark_threshold_offset"])
+    _, dark_mask = cv2.threshold(gray, dark_threshold, 255, cv2.THRESH_BINARY_INV)
+    edges = cv2.Canny(gray, params["canny_threshold1"], params["canny_threshold2"])
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (params["kernel_size"], params["kernel_size"]))
+    edges_dilated = cv2.dilate(edges, kernel, iterations=params["iterations"])
+    combined_mask = cv2.bitwise_and(dark_mask, edges_dilated)
+    return legacy_filter(combined_mask, params["min_icon_size"])
+
+def legacy_decode(path):
+    """Bisherige Dekodierung: RGBA-Array und Graustufe über PIL."""
+    with Image.open(path).convert("RGBA") as img:
+        return np.array(img), cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2GRAY)
+
+# ----------------------------------------------------------
+# Synthetische Eingaben
+# ----------------------------------------------------------
+def speckle_mask(seed, size=256):
+    """Sprenkel aller Größen plus berührende, gelochte und angeschnittene Objekte."""
+    rng = np.random.default_rng(seed)
+    mask = np.where(rng.random((size, size)) < 0.08, 255, 0).astype(np.uint8)
+    for _ in range(12):
+        x, y = rng.integers(0, size - 40, 2)
+        w, h = rng.integers(2, 40, 2)
+        cv2.rectangle(mask, (int(x), int(y)), (int(x + w), int(y + h)), 255, -1)
+    # Zwei Rechtecke mit gemeinsamer Kante und zwei, die sich nur diagonal berühren
+    cv2.rectangle(mask, (20, 20), (39, 35), 255, -1)
+    cv2.rectangle(mask, (40, 20), (60, 35), 255, -1)
+    cv2.rectangle(mask, (80, 20), (89, 29), 255, -1)
+    cv2.rectangle(mask, (90, 30), (99, 39), 255, -1)
+    # Ring mit Loch, im Loch ein eigenes Objekt; Ring mit Loch knapp an der Mindestfläche
+    cv2.circle(mask, (150, 150), 40, 255, -1)
+    cv2.circle(mask, (150, 150), 25, 0, -1)
+    cv2.rectangle(mask, (145, 145), (155, 155), 255, -1)
+    cv2.rectangle(mask, (200, 60), (211, 71), 255, -1)
+    cv2.rectangle(mask, (203, 63), (208, 68), 0, -1)
+    # Objekte am Bildrand
+    cv2.rectangle(mask, (0, size - 30), (25, size - 1), 255, -1)
+    cv2.circle(mask, (size - 1, 100), 20, 255, -1)
+    return mask
+
+def synthetic_image(seed, size=192, alpha=False):
+    """Papiergrund mit Rauschen, dunkle Formen (teils mit Löchern) und feine Sprenkel."""
+    rng = np.random.default_rng(seed)
+    img = np.clip(rng.normal(225, 12, (size, size, 3)), 0, 255).astype(np.uint8)
+    for _ in range(6):
+        center = tuple(int(v) for v in rng.integers(20, size - 20, 2))
+        radius = int(rng.integers(6, 30))
+        color = tuple(int(v) for v in rng.integers(0, 80, 3))
+        cv2.circle(img, center, radius, color, -1)
+        if radius > 15:
+            cv2.circle(img, center, radius // 2, (230, 230, 230), -1)
+    cv2.rectangle(img, (10, 10), (40, 30), (30, 30, 30), -1)
+    cv2.rectangle(img, (41, 10), (70, 30), (40, 20, 20), -1)
+    speckles = rng.random((size, size)) < 0.01
+    img[speckles] = 20
+    if alpha:
+        a = np.full((size, size, 1), 255, np.uint8)
+        a[:20, :20] = 0
+        img = np.concatenate([img, a], axis=2)
+    return img
+
+def sparse_image(seed, size=768):
+    """
+    Wenige dunkle Formen auf Papiergrund, sodass die grobe Stufe nur einen Teil des
+    Bildes als Kandidat liefert, dazu ein schwacher Verlauf, der an eine starke
+    Kante anschließt (Canny-Hysterese über den Rahmenrand hinweg).
+    """
+    rng = np.random.default_rng(seed)
+    img = np.clip(rng.normal(225, 12, (size, size, 3)), 0, 255).astype(np.uint8)
+    for _ in range(10):
+        center = tuple(int(v) for v in rng.integers(30, size - 30, 2))
+        radius = int(rng.integers(3, 28))
+        cv2.circle(img, center, radius, tuple(int(v) for v in rng.integers(0, 80, 3)), -1)
+        if radius > 15:
+            cv2.circle(img, center, radius // 2, (230, 230, 230), -1)
+    x0, y0 = (int(v) for v in rng.integers(50, size - 150, 2))
+    cv2.rectangle(img, (x0, y0), (x0 + 15, y0 + 15), (10, 10, 10), -1)
+    for i in range(120):
+        img[y0 + 7:y0 + 9, x0 + 16 + i] = 150 + i // 3
+    img[rng.random((size, size)) < 0.0005] = 20
+    return img
+
+def coarse_coverage(gray, dark_threshold, params):
+    """Anteil des Bildes, den die Kandidatenrahmen der groben Stufe abdecken."""
+    _, dark_mask = cv2.threshold(gray, dark_threshold, 255, cv2.THRESH_BINARY_INV)
+    pad = (params["kernel_size"] // 2) * params["iterations"] + 3 + params["mask_boundary_px"]
+    level = effective_level(gray.shape, params["mask_pyramid_level"])
+    rects = candidate_rects(dark_mask, level, params["min_icon_size"], pad)
+    return sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects) / gray.size
+
+# ----------------------------------------------------------
+# Tests
+# ----------------------------------------------------------
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("min_area", [0, 10, 100, 400])
+def test_filter_matches_contour_loop(seed, min_area):
+    mask = speckle_mask(seed)
+    assert np.array_equal(filter_mask_by_contour_area(mask, min_area), legacy_filter(mask, min_area))
+
+def test_filter_empty_and_full():
+    empty = np.zeros((64, 64), np.uint8)
+    full = np.full((64, 64), 255, np.uint8)
+    for mask in (empty, full):
+        for min_area in (0, 100, 4000):
+            assert np.array_equal(filter_mask_by_contour_area(mask, min_area), legacy_filter(mask, min_area))
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("min_icon_size", [20, 100])
+def test_mask_level0_matches_legacy(seed, min_icon_size):
+    params = dict(PARAMS, min_icon_size=min_icon_size)
+    gray = cv2.cvtColor(synthetic_image(seed), cv2.COLOR_BGR2GRAY)
+    dark_threshold = calculate_dark_threshold(gray, params)
+    assert np.array_equal(compute_filtered_mask_multires(gray, dark_threshold, params), legacy_mask(gray, params))
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("level", [1, 2, 3])
+@pytest.mark.parametrize("boundary", [0, 8])
+def test_mask_pyramid_within_tolerance(seed, level, boundary):
+    params = dict(PARAMS, mask_pyramid_level=level, mask_boundary_px=boundary)
+    gray = cv2.cvtColor(sparse_image(seed), cv2.COLOR_BGR2GRAY)
+    dark_threshold = calculate_dark_threshold(gray, params)
+    # Die grobe Stufe muss tatsächlich greifen (sonst rechnet multires in voller Auflösung)
+    assert effective_level(gray.shape, level) == level
+    assert coarse_coverage(gray, dark_threshold, params) <= 0.75
+    expected = legacy_mask(gray, params)
+    mask = compute_filtered_mask_multires(gray, dark_threshold, params)
+    assert np.count_nonzero(expected) > 0
+    assert np.count_nonzero(mask != expected) <= MULTIRES_TOLERANCE * gray.size
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("alpha", [False, True])
+def test_decode_and_apply_match_legacy(tmp_path, seed, alpha):
+    path = str(tmp_path / "input.png")
+    cv2.imwrite(path, synthetic_image(seed, alpha=alpha))
+    expected_rgba, expected_gray = legacy_decode(path)
+    img = read(path, "bgra")
+    gray = get_gray(None, None, img)
+    assert np.array_equal(gray, expected_gray)
+    mask = legacy_mask(gray, PARAMS)
+    expected_rgba[mask == 0] = (0, 0, 0, 0)
+    assert np.array_equal(apply_mask(img, mask), cv2.cvtColor(expected_rgba, cv2.COLOR_RGBA2BGRA))
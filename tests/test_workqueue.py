@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Warteschlange auf einem Rechner mit mehreren Worker-Prozessen.
+
+Geprüft werden workqueue.run_local mit zwei Workern und einer einfachen Stufe
+(jedes Bild genau einmal bearbeitet), das Ende des Wartens, wenn alle Worker
+abstürzen, und lease_task bei vielen aufgebrauchten Aufgaben.
+
+Aufruf: python -m pytest tests
+"""
+import os
+import sys
+import time
+import textwrap
+
+INIT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init")
+sys.path.insert(0, INIT_DIR)
+import workqueue
+
+# Worker mit einer einfachen Stufe: hängt die eigene Kennung an die Datei an
+WORKER_SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, {init_dir!r})
+    import workqueue
+
+    def touch(path, date_folder):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(sys.argv[3] + "\\n")
+        return True
+
+    workqueue.run_worker(sys.argv[1], {{"touch": touch}}, worker_id=sys.argv[3], poll_seconds=0.1)
+""")
+
+def _worker_command(tmp_path, body):
+    script = tmp_path / "worker.py"
+    script.write_text(body, encoding="utf-8")
+    return [sys.executable, str(script), str(tmp_path)]
+
+def _enqueue(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"{i:02}.txt"
+        path.write_text("", encoding="utf-8")
+        paths.append(str(path))
+    conn = workqueue.open_queue(tmp_path)
+    try:
+        workqueue.enqueue(conn, tmp_path, paths, ["touch"])
+    finally:
+        conn.close()
+    return paths
+
+def test_run_local_two_workers(tmp_path):
+    paths = _enqueue(tmp_path, 8)
+    command = _worker_command(tmp_path, WORKER_SCRIPT.format(init_dir=INIT_DIR))
+    final = workqueue.run_local(tmp_path, command, 2, poll_seconds=0.1)
+    assert final["done"] == 8 and final["failed"] == 0
+    assert final["exit_codes"] == [0, 0]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            assert len(f.read().splitlines()) == 1
+
+def test_run_local_all_workers_crash(tmp_path):
+    _enqueue(tmp_path, 3)
+    command = _worker_command(tmp_path, "import sys\nsys.exit(3)\n")
+    started = time.time()
+    final = workqueue.run_local(tmp_path, command, 2, poll_seconds=0.1)
+    assert time.time() - started < 30
+    assert final["failed"] == 3 and final["pending"] == 0 and final["leased"] == 0
+    assert final["exit_codes"] == [3, 3]
+
+def test_lease_task_many_exhausted(tmp_path):
+    conn = workqueue.open_queue(tmp_path)
+    try:
+        workqueue.enqueue(conn, tmp_path, [str(tmp_path / f"{i}.png") for i in range(3000)], ["touch"], 1)
+        # Alle Aufgaben hatten ihren letzten Versuch, die Leases sind abgelaufen
+        conn.execute("UPDATE tasks SET status = 'leased', attempts = 1, lease_owner = 'x', lease_expires = 0")
+        assert workqueue.lease_task(conn, "w") is None
+        assert workqueue.queue_status(conn)["failed"] == 3000
+    finally:
+        conn.close()